@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import TopologyGraph from './components/TopologyGraph';
 import StatsPanel from './components/StatsPanel';
 import DeviceList from './components/DeviceList';
@@ -37,6 +37,9 @@ const App: React.FC = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [filteredDevices, setFilteredDevices] = useState<DeviceRecord[]>([]);
 
+  // Content hash of the loaded topology, compared with versions pushed on /api/topology/events
+  const loadedVersion = useRef<string | null>(null);
+
   // Fetch topology data from JSON file (manual refresh only)
   const fetchTopologyData = async () => {
     // Allow runtime configuration via Vite env vars:
@@ -52,6 +55,17 @@ const App: React.FC = () => {
 
     for (const url of DATA_URLS) {
       try {
+        // Read the publisher's .sha256 sidecar before the data: if a publish lands in between,
+        // the next event just triggers one extra reload instead of being missed
+        let version: string | null = null;
+        try {
+          const sidecar = await fetch(`${url}.sha256`, { cache: 'no-store' });
+          const digest = sidecar.ok ? (await sidecar.text()).trim() : '';
+          version = /^[0-9a-f]{64}$/.test(digest) ? digest : null;
+        } catch (e) {
+          // No sidecar (e.g. dev server); the first event then reloads once
+        }
+
         const response = await fetch(url, {
           cache: 'no-store',
           headers: { 'Cache-Control': 'no-cache', 'Pragma': 'no-cache' }
@@ -83,6 +97,10 @@ const App: React.FC = () => {
           continue;
         }
 
+        // /api/topology sends the content hash itself as the ETag ("<sha256>" or "<sha256>-<encoding>")
+        const etag = (response.headers.get('etag') || '').match(/^"([0-9a-f]{64})(?:-\w+)?"$/);
+        loadedVersion.current = etag ? etag[1] : version;
+
         setData(jsonData as RawNetworkData);
         setLastUpdate(new Date());
         setIsLoading(false);
@@ -104,6 +122,28 @@ const App: React.FC = () => {
     fetchTopologyData();
   }, []);
 
+  // Reload when the log API announces a newly published scan (Server-Sent Events)
+  useEffect(() => {
+    const env = (import.meta as any).env || {};
+    const eventsUrl = env.VITE_TOPOLOGY_EVENTS_URL ?? 'http://localhost:5000/api/topology/events';
+
+    const source = new EventSource(eventsUrl);
+    source.addEventListener('topology', (event) => {
+      try {
+        const { version } = JSON.parse((event as MessageEvent).data);
+        // The first event reports the current version; it may already differ from the one loaded on mount
+        if (version && version !== loadedVersion.current) {
+          loadedVersion.current = version;
+          fetchTopologyData();
+        }
+      } catch (e) {
+        console.debug('Invalid topology event:', e);
+      }
+    });
+
+    return () => source.close();
+  }, []);
+
   // Action States
   const [isPinging, setIsPinging] = useState(false);
   const [pingResult, setPingResult] = useState<{status: 'success' | 'error', msg: string} | null>(null);
@@ -18,45 +18,67 @@ echo "🔐 Configuring passwordless sudo..."
 cat > /etc/sudoers.d/nettopo-visualizer <<EOF
 # NetTopo Visualizer - Allow specific commands without password
 $REAL_USER ALL=(ALL) NOPASSWD: /usr/local/bin/update_topology_scan
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl start update-topology-scan
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl stop update-topology-scan
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl restart update-topology-scan
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl status update-topology-scan*
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl enable update-topology-scan*
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl disable update-topology-scan*
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl start topology-publisher
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl stop topology-publisher
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl restart topology-publisher
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl status topology-publisher*
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl enable topology-publisher*
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl disable topology-publisher*
 $REAL_USER ALL=(ALL) NOPASSWD: /bin/systemctl daemon-reload
-$REAL_USER ALL=(ALL) NOPASSWD: /bin/journalctl -u update-topology-scan*
+$REAL_USER ALL=(ALL) NOPASSWD: /bin/journalctl -u topology-publisher*
 EOF
 
 chmod 0440 /etc/sudoers.d/nettopo-visualizer
 echo "✓ Passwordless sudo configured"
 echo ""
 
-# 2. Install update script
-echo "📋 Installing update script..."
-if [ ! -f "update_latest_scan.sh" ]; then
-    echo "❌ ERROR: update_latest_scan.sh not found in current directory"
-    exit 1
-fi
-
+# 2. Install publisher and manual update script
+echo "📋 Installing topology publisher..."
+for f in update_latest_scan.sh topology_publisher.py write_topology_data.py topology_validation.py topology_layout.py; do
+    if [ ! -f "$f" ]; then
+        echo "❌ ERROR: $f not found in current directory"
+        exit 1
+    fi
+done
+
+mkdir -p /opt/firewall-log-api
+cp topology_publisher.py write_topology_data.py topology_validation.py topology_layout.py /opt/firewall-log-api/
 cp update_latest_scan.sh /usr/local/bin/update_topology_scan
 chmod +x /usr/local/bin/update_topology_scan
+# The publisher precomputes layouts with NumPy
+if ! python3 -c "import numpy" 2>/dev/null; then
+    apt-get install -y python3-numpy || pip3 install --break-system-packages numpy
+fi
+echo "✓ Publisher installed to /opt/firewall-log-api/topology_publisher.py"
 echo "✓ Script installed to /usr/local/bin/update_topology_scan"
 echo ""
 
-# 3. Create systemd service
+# 3. Retire the old 5-minute polling timer (installed by earlier versions of this script)
+if [ -f /etc/systemd/system/update-topology-scan.timer ]; then
+    echo "🧹 Removing old update timer..."
+    systemctl disable --now update-topology-scan.timer 2>/dev/null || true
+    rm -f /etc/systemd/system/update-topology-scan.timer /etc/systemd/system/update-topology-scan.service
+    echo "✓ Old timer removed"
+    echo ""
+fi
+
+# 4. Create systemd service (publishes each scan as soon as it completes)
 echo "⚙️  Creating systemd service..."
-cat > /etc/systemd/system/update-topology-scan.service <<EOF
+cat > /etc/systemd/system/topology-publisher.service <<EOF
 [Unit]
-Description=Update NetTopo Visualizer with latest scan data
+Description=Publish completed scans to NetTopo Visualizer
 After=network.target
 
 [Service]
-Type=oneshot
-ExecStart=/usr/local/bin/update_topology_scan
+Type=simple
+WorkingDirectory=/opt/firewall-log-api
+ExecStart=/usr/bin/python3 /opt/firewall-log-api/topology_publisher.py --layout --delta
+Restart=always
+RestartSec=5
 User=root
 StandardOutput=journal
 StandardError=journal
+Environment=PYTHONUNBUFFERED=1
 
 [Install]
 WantedBy=multi-user.target
@@ -64,24 +86,6 @@ EOF
 echo "✓ Service created"
 echo ""
 
-# 4. Create systemd timer (runs every 5 minutes)
-echo "⏰ Creating systemd timer..."
-cat > /etc/systemd/system/update-topology-scan.timer <<EOF
-[Unit]
-Description=Update topology scan data every 5 minutes
-Requires=update-topology-scan.service
-
-[Timer]
-OnBootSec=1min
-OnUnitActiveSec=5min
-AccuracySec=1s
-
-[Install]
-WantedBy=timers.target
-EOF
-echo "✓ Timer created"
-echo ""
-
 # 5. Ensure data directory exists
 echo "📁 Creating data directory..."
 mkdir -p /var/www/reactapp/data
@@ -90,32 +94,27 @@ chmod 755 /var/www/reactapp/data
 echo "✓ Data directory ready"
 echo ""
 
-# 6. Reload systemd and enable timer
-echo "🔄 Enabling systemd timer..."
+# 6. Reload systemd and start the publisher (it publishes the newest complete scan on start)
+echo "🔄 Enabling topology publisher..."
 systemctl daemon-reload
-systemctl enable update-topology-scan.timer
-systemctl start update-topology-scan.timer
-echo "✓ Timer enabled and started"
-echo ""
-
-# 7. Run once immediately
-echo "▶️  Running initial update..."
-/usr/local/bin/update_topology_scan || echo "⚠️  Initial update failed (may be expected if no scans exist yet)"
+systemctl enable topology-publisher
+systemctl restart topology-publisher
+echo "✓ Publisher enabled and started"
 echo ""
 
-# 8. Verify timer is running
+# 7. Verify publisher is running
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 echo "✅ Setup Complete!"
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 echo ""
-echo "📊 Timer Status:"
-systemctl status update-topology-scan.timer --no-pager --lines=0
+echo "📊 Publisher Status:"
+systemctl status topology-publisher --no-pager --lines=5
 echo ""
 echo "📝 Useful Commands (no password needed):"
-echo "  • View logs:      sudo journalctl -u update-topology-scan -f"
-echo "  • Manual update:  sudo systemctl start update-topology-scan"
-echo "  • Timer status:   sudo systemctl status update-topology-scan.timer"
-echo "  • Stop timer:     sudo systemctl stop update-topology-scan.timer"
+echo "  • View logs:      sudo journalctl -u topology-publisher -f"
+echo "  • Manual update:  sudo /usr/local/bin/update_topology_scan"
+echo "  • Status:         sudo systemctl status topology-publisher"
+echo "  • Stop publisher: sudo systemctl stop topology-publisher"
 echo ""
 echo "🌐 Access your app at: http://$(hostname -I | awk '{print $1}')/"
 echo ""
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Firewall Log API Metrics
+Prometheus-style request and per-stage metrics with no external dependencies
+
+Each request gets a RequestStats (thread-local) that code on the request path
+adds to: counters such as lines scanned/parsed, bytes read and matches
+returned, and seconds spent per stage (index refresh, store ingest, read, parse,
+filter, ping subprocess).
+Hot loops accumulate locally and report once per scan, so the per-line cost is
+a few integer additions. When the response is closed the request is folded
+into the process-wide registry:
+
+    firewall_api_requests_total{route,method,status}
+    firewall_api_request_duration_seconds{route,method}       histogram
+    firewall_api_stage_duration_seconds{route,stage}          histogram (per request)
+    firewall_api_log_<counter>_total{route}
+
+Requests slower than a threshold can also be appended to a JSON-lines slow log
+with their counters and stage breakdown.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "firewall_api_"
+BACKGROUND_ROUTE = "background"  # Route label for work done outside any request
+
+# Per-request counters exported as firewall_api_log_<name>_total
+LOG_COUNTERS = {
+    'lines_scanned': "Log lines examined (pre-filter included)",
+    'lines_parsed': "Log lines fully parsed",
+    'bytes_read': "Bytes read from log files",
+    'matches_returned': "Log records returned to clients",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**labels: Any) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class RequestStats:
+    """Counters and stage timings for one request (may be updated from worker threads)"""
+
+    def __init__(self, route: str, method: str = 'GET', attrs: Optional[Dict[str, Any]] = None):
+        self.route = route
+        self.method = method
+        self.attrs = dict(attrs or {})
+        self.started = time.perf_counter()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] += seconds
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.slow_log_path: Optional[str] = None
+        self.slow_threshold_seconds = 1.0
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = defaultdict(dict)
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._slow_log_lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            self._observe(name, labels, value)
+
+    def _observe(self, name: str, labels: Labels, value: float) -> None:
+        # [cumulative count per bucket..., +Inf count, sum]
+        series = self._histograms[name].get(labels)
+        if series is None:
+            series = self._histograms[name][labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def record_request(self, stats: RequestStats, status: int) -> float:
+        """Fold a finished request into the registry (and the slow log). Returns its duration."""
+        elapsed = time.perf_counter() - stats.started
+        route_labels = _labels(route=stats.route)
+        with stats._lock:
+            counters = dict(stats.counters)
+            stages = dict(stats.stages)
+        with self._lock:
+            self._counters['requests_total'][_labels(route=stats.route, method=stats.method, status=status)] += 1
+            self._observe('request_duration_seconds', _labels(route=stats.route, method=stats.method), elapsed)
+            for stage, seconds in stages.items():
+                self._observe('stage_duration_seconds', _labels(route=stats.route, stage=stage), seconds)
+            for name, value in counters.items():
+                self._counters[f'log_{name}_total'][route_labels] += value
+            slow = self.slow_log_path is not None and elapsed >= self.slow_threshold_seconds
+            if slow:
+                self._counters['slow_requests_total'][route_labels] += 1
+        if slow:
+            self._write_slow_entry(stats, status, elapsed, counters, stages)
+        return elapsed
+
+    def _write_slow_entry(self, stats, status, elapsed, counters, stages) -> None:
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'route': stats.route,
+            'method': stats.method,
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+            'counters': counters,
+        }
+        entry.update(stats.attrs)
+        try:
+            with self._slow_log_lock, open(self.slow_log_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print(f"Could not write slow request log {self.slow_log_path}: {e}")
+
+    def render(self, extra: Optional[List[str]] = None) -> str:
+        """Prometheus text exposition (version 0.0.4); `extra` lines are appended as-is"""
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {labels: list(values) for labels, values in series.items()}
+                          for name, series in self._histograms.items()}
+
+        def header(name: str, default_kind: str) -> None:
+            kind, help_text = self._help.get(name, (default_kind, name.replace('_', ' ')))
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for name in sorted(counters):
+            header(name, 'counter')
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name, 'histogram')
+            for labels, values in sorted(histograms[name].items()):
+                # _observe counts a value in every bucket whose bound it fits, so these are cumulative
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {count}")
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, ('le', '+Inf'))} "
+                             f"{values[len(self.buckets)]}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {values[len(self.buckets)]}")
+
+        lines.extend(extra or [])
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+registry.describe('requests_total', 'counter', "HTTP requests by route, method and status")
+registry.describe('request_duration_seconds', 'histogram', "Request latency by route")
+registry.describe('stage_duration_seconds', 'histogram', "Time per request spent in each stage (index, ingest, read, parse, filter, ping_subprocess)")
+registry.describe('slow_requests_total', 'counter', "Requests slower than the slow-log threshold")
+for _name, _help_text in LOG_COUNTERS.items():
+    registry.describe(f'log_{_name}_total', 'counter', _help_text)
+
+_local = threading.local()
+
+
+def begin_request(route: str, method: str = 'GET', attrs: Optional[Dict[str, Any]] = None) -> RequestStats:
+    """Start collecting for a request on this thread"""
+    _local.stats = RequestStats(route, method, attrs)
+    return _local.stats
+
+
+def end_request(stats: RequestStats, status: int) -> float:
+    """Stop collecting on this thread and record the request. Returns its duration in seconds."""
+    if getattr(_local, 'stats', None) is stats:
+        _local.stats = None
+    return registry.record_request(stats, status)
+
+
+def current() -> Optional[RequestStats]:
+    return getattr(_local, 'stats', None)
+
+
+def add(name: str, value: int = 1) -> None:
+    """Add to a per-request counter (no-op outside a request)"""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and value:
+        stats.add(name, value)
+
+
+def add_time(stage: str, seconds: float) -> None:
+    """Attribute time to a stage of the current request, or to BACKGROUND_ROUTE outside one"""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.add_time(stage, seconds)
+    else:
+        registry.observe('stage_duration_seconds', _labels(route=BACKGROUND_ROUTE, stage=stage), seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Attribute the time spent in a with-block to a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - start)
+
+
+def stage_seconds(stage: str) -> float:
+    """Time recorded so far for a stage of the current request (0.0 outside a request)"""
+    stats = getattr(_local, 'stats', None)
+    return stats.stages.get(stage, 0.0) if stats is not None else 0.0
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn so it records into the calling request's stats when run on another thread"""
+    stats = current()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'stats', None)
+        _local.stats = stats
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.stats = previous
+
+    return wrapper
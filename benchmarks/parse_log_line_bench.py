@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+parse_log_line Microbenchmark
+Compares the legacy three-regex parser against the pre-filter + single-pass
+parser in firewall_log_api.py on a synthetic firewall log.
+
+Usage:
+    python benchmarks/parse_log_line_bench.py [--lines 1000000] [--macs 200]
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firewall_log_api as api  # noqa: E402
+from benchmarks.synthetic import synthetic_macs, write_synthetic_log  # noqa: E402
+
+
+def legacy_parse_log_line(line):
+    """parse_log_line as it was before the single-pass parser (kept for comparison)"""
+    timestamp_match = re.match(r'^(\S+)', line)
+    timestamp = timestamp_match.group(1) if timestamp_match else None
+
+    data = {}
+    for match in re.finditer(r'(\w+)="([^"]*)"', line):
+        key, value = match.groups()
+        data[key] = value
+
+    for match in re.finditer(r'(\w+)=(\d+)', line):
+        key, value = match.groups()
+        if key not in data:
+            data[key] = value
+
+    record = {'timestamp': timestamp or data.get('timestamp', '')}
+    for field, default in api.LOG_FIELD_DEFAULTS.items():
+        if field != 'timestamp':
+            record[field] = data.get(field, default)
+    record['raw'] = line.strip()
+    return record
+
+
+def bench_legacy(path, normalized_mac):
+    matches = 0
+    with open(path, 'r') as f:
+        for line in f:
+            parsed = legacy_parse_log_line(line)
+            if normalized_mac in [api.normalize_mac(parsed['src_mac']), api.normalize_mac(parsed['dst_mac'])]:
+                matches += 1
+    return matches
+
+
+def bench_current(path, normalized_mac):
+    matches = 0
+    tokens = api.mac_search_tokens(normalized_mac)
+    with open(path, 'rb') as f:
+        for raw_line in f:
+            if not api.line_may_mention_mac(raw_line, tokens):
+                continue
+            parsed = api.parse_log_line(raw_line.decode('utf-8', 'replace'))
+            if parsed and api.log_involves_mac(parsed, normalized_mac):
+                matches += 1
+    return matches
+
+
+def bench_parse_only(path, parser):
+    with open(path, 'r') as f:
+        for line in f:
+            parser(line)
+
+
+def timed(label, lines, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<40} {elapsed:8.2f}s  {lines / elapsed:12,.0f} lines/sec")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=1000000, help='Synthetic log size in lines')
+    parser.add_argument('--macs', type=int, default=200, help='Number of distinct MACs in the log')
+    args = parser.parse_args()
+
+    macs = synthetic_macs(args.macs)
+    search_mac = api.normalize_mac(macs[0])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'firewall.log')
+        print(f"Generating {args.lines:,} lines ({args.macs} MACs)...")
+        write_synthetic_log(path, args.lines, macs)
+        print(f"  {os.path.getsize(path) / 1e6:,.1f} MB\n")
+
+        # Both parsers must agree on every field
+        with open(path, 'r') as f:
+            for _, line in zip(range(1000), f):
+                assert api.parse_log_line(line, keep_raw=True).to_dict() == legacy_parse_log_line(line), line
+
+        print("Parse every line:")
+        timed('before (3 regex passes + 2 dicts)', args.lines, bench_parse_only, path, legacy_parse_log_line)
+        timed('after (single compiled pass)', args.lines, bench_parse_only, path, api.parse_log_line)
+
+        print(f"\nFilter by MAC {macs[0]}:")
+        before = timed('before (parse then filter)', args.lines, bench_legacy, path, search_mac)
+        after = timed('after (pre-filter then parse)', args.lines, bench_current, path, search_mac)
+        assert before == after, (before, after)
+        print(f"\n  {after:,} matching lines (identical results)")
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite
+Reproducible measurements of the log API and the topology writer on synthetic
+data, written as JSON so runs on different commits can be compared.
+
+Measures:
+    parse       parse_log_line / pre-filter throughput (lines/sec)
+    endpoints   p50/p99 latency of the API routes under concurrent Flask test clients
+    writer      write_topology_data / --stream / --delta time and peak RSS (one subprocess each)
+    serving     mixed-route HTTP load against the Flask dev server and gunicorn (gunicorn.conf.py),
+                each in a subprocess, plus how long each takes to stop on SIGTERM
+    scan        cold full-log scan (parallel_scan.py) for one MAC and for a batch with gunicorn.conf.py's default
+                scan settings, alone and from several API processes at once; optionally at fixed process counts
+
+Usage:
+    python benchmarks/run_benchmarks.py [--log-size 100MB] [--macs 200] [--devices 10000]
+                                        [--clients 8] [--requests 200] [--cache] [--workers N]
+                                        [--scan-workers 1,2,4] [--only parse,endpoints,writer,serving,scan]
+                                        [--output results.json] [--compare previous.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks.synthetic import (  # noqa: E402
+    generate_topology, iter_topology_records, parse_size, synthetic_macs, write_synthetic_log
+)
+
+SUITES = ('parse', 'endpoints', 'writer', 'serving', 'scan')
+WRITER_MODES = ('full', 'stream', 'delta')
+SERVING_MODES = ('flask', 'gunicorn')
+SERVING_ROUTES = ('logs_tail', 'logs_device', 'logs_query', 'health')  # Mixed load, round-robin per client
+SERVER_START_TIMEOUT = 60  # Seconds to wait for a served API to answer /api/health
+BATCH_REQUEST_MACS = 50  # MACs per /api/logs/batch request
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(samples: List[float], wall_seconds: float) -> Dict[str, Any]:
+    samples = sorted(samples)
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p90_ms': round(percentile(samples, 90) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3) if samples else 0.0,
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        'requests_per_sec': round(len(samples) / wall_seconds, 1) if wall_seconds else 0.0
+    }
+
+
+def bench_parse(api, log_path: str, lines: int, search_mac: str) -> Dict[str, Any]:
+    """Throughput of parsing every line, and of the pre-filtered single-MAC scan"""
+    results = {}
+
+    start = time.perf_counter()
+    with open(log_path, 'r') as f:
+        for line in f:
+            api.parse_log_line(line)
+    elapsed = time.perf_counter() - start
+    results['parse_all'] = {'seconds': round(elapsed, 3), 'lines_per_sec': round(lines / elapsed)}
+
+    normalized = api.normalize_mac(search_mac)
+    tokens = api.mac_search_tokens(normalized)
+    matches = 0
+    start = time.perf_counter()
+    with open(log_path, 'rb') as f:
+        for raw_line in f:
+            if not api.line_may_mention_mac(raw_line, tokens):
+                continue
+            parsed = api.parse_log_line(raw_line.decode('utf-8', 'replace'))
+            if parsed and api.log_involves_mac(parsed, normalized):
+                matches += 1
+    elapsed = time.perf_counter() - start
+    results['filter_by_mac'] = {
+        'seconds': round(elapsed, 3),
+        'lines_per_sec': round(lines / elapsed),
+        'matches': matches
+    }
+    return results
+
+
+def gunicorn_scan_config() -> Dict[str, int]:
+    """Worker, scan process and scan slot counts gunicorn.conf.py picks without FIREWALL_API_* overrides"""
+    import runpy
+
+    overrides = {name: os.environ.pop(name) for name in list(os.environ) if name.startswith('FIREWALL_API_')}
+    try:
+        conf = runpy.run_path(os.path.join(REPO_DIR, 'gunicorn.conf.py'))
+    finally:
+        os.environ.update(overrides)
+    return {name: conf[name] for name in ('workers', 'scan_workers', 'scan_slots')}
+
+
+def default_scan_child(log_path: str, query: List[str], conf: Dict[str, int], slot_dir: str, barrier) -> float:
+    """One API process's cold scan with the production scan settings (runs in its own process)"""
+    import parallel_scan
+
+    parallel_scan.PARALLEL_SCAN_WORKERS = conf['scan_workers']
+    parallel_scan.SCAN_SLOTS = conf['scan_slots']
+    parallel_scan.SCAN_SLOT_DIR = slot_dir
+    try:
+        if conf['scan_workers'] > 1:
+            # Start the pool outside the timing
+            parallel_scan.scan_offsets(log_path, query, end=min(os.path.getsize(log_path), 1 << 20),
+                                       min_parallel_bytes=0)
+        barrier.wait()  # Every process starts its scan at once
+        start = time.perf_counter()
+        parallel_scan.scan_offsets(log_path, query)
+        return time.perf_counter() - start
+    finally:
+        parallel_scan.shutdown_pool()
+
+
+def bench_default_scan(log_path: str, queries: Dict[str, List[str]], conf: Dict[str, int],
+                       concurrency: int) -> Dict[str, Any]:
+    """Cold scans as gunicorn.conf.py configures them: one API process alone, then `concurrency` at once"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    size = os.path.getsize(log_path)
+    results = {}
+    concurrency = min(concurrency, conf['workers'])
+    print(f"  default config: {conf['workers']} workers, {conf['scan_workers']} scan processes each, "
+          f"{conf['scan_slots']} slots")
+    context = multiprocessing.get_context('forkserver')
+    with tempfile.TemporaryDirectory() as slot_dir, context.Manager() as manager:
+        for processes in sorted({1, concurrency}):
+            with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+                for name, query in queries.items():
+                    barrier = manager.Barrier(processes)
+                    futures = [pool.submit(default_scan_child, log_path, query, conf, slot_dir, barrier)
+                               for _ in range(processes)]
+                    elapsed = max(future.result() for future in futures)
+                    results[f'{name}_default_x{processes}'] = {
+                        'seconds': round(elapsed, 3),
+                        'mb_per_sec': round(processes * size / 1e6 / elapsed, 1)
+                    }
+                    print(f"  {name:<8} {processes:>3} concurrent  {elapsed:8.2f} s  "
+                          f"{processes * size / 1e6 / elapsed:8.1f} MB/s total")
+    return results
+
+
+def bench_scan(log_path: str, macs: List[str], worker_counts: List[int], conf: Dict[str, int],
+               concurrency: int) -> Dict[str, Any]:
+    """
+    Cold-scan time for one MAC (mmap.find) and a batch (regex pass): with the
+    default gunicorn settings `conf` (alone and `concurrency` API processes at once),
+    then at each fixed scan process count in worker_counts
+    """
+    import parallel_scan
+    from write_topology_data import normalize_mac
+
+    queries = {'one_mac': [normalize_mac(macs[0])],
+               'batch': [normalize_mac(mac) for mac in macs[:BATCH_REQUEST_MACS]]}
+    size = os.path.getsize(log_path)
+    results = bench_default_scan(log_path, queries, conf, concurrency)
+    for workers in worker_counts:
+        parallel_scan.shutdown_pool()
+        if workers > 1:
+            # Start the pool outside the timing
+            parallel_scan.scan_offsets(log_path, queries['one_mac'], end=min(size, 1 << 20), workers=workers,
+                                       min_parallel_bytes=0)
+        for name, query in queries.items():
+            start = time.perf_counter()
+            offsets = parallel_scan.scan_offsets(log_path, query, workers=workers, min_parallel_bytes=0)
+            elapsed = time.perf_counter() - start
+            results[f'{name}_{workers}w'] = {
+                'seconds': round(elapsed, 3),
+                'mb_per_sec': round(size / 1e6 / elapsed, 1),
+                'matches': sum(len(mac_offsets) for mac_offsets in offsets.values())
+            }
+            print(f"  {name:<8} {workers:>3} processes {elapsed:8.2f} s  {size / 1e6 / elapsed:8.1f} MB/s")
+    parallel_scan.shutdown_pool()
+    return results
+
+
+def configure_api(api, log_path: str, topology_path: str, use_cache: bool) -> None:
+    """Point the API module at the synthetic files (and optionally turn off its result caches)"""
+    from log_store import LogStore
+
+    api.LOG_FILE = log_path
+    api.LOG_INDEX_FILE = log_path + ".macidx"
+    api.LOG_STORE_DIR = log_path + ".store"
+    api.TOPOLOGY_FILE = topology_path
+    api.log_index = api.LogOffsetIndex(api.LOG_FILE, api.LOG_INDEX_FILE)
+    api.log_store = LogStore(api.LOG_STORE_DIR, api.LOG_FIELD_DEFAULTS)
+    if not use_cache:
+        # ttl=0: every request does the real work (concurrent identical requests still coalesce)
+        for name in ('device_logs_cache', 'tail_logs_cache'):
+            setattr(api, name, api.ResultCache(ttl=0))
+
+
+def endpoint_requests(macs: List[str]) -> Dict[str, Any]:
+    """name -> function(i) returning (method, url, json body or None) for the i-th request"""
+    def batch_body(i):
+        start = (i * BATCH_REQUEST_MACS) % len(macs)
+        return {'macs': (macs + macs)[start:start + BATCH_REQUEST_MACS], 'limit': 10}
+
+    return {
+        'logs_tail': lambda i: ('GET', f'/api/logs/tail/{macs[i % len(macs)]}', None),
+        'logs_device': lambda i: ('GET', f'/api/logs/{macs[i % len(macs)]}', None),
+        'logs_query': lambda i: ('GET', f'/api/logs/query?mac={macs[i % len(macs)]}&limit=100', None),
+        'logs_batch': lambda i: ('POST', '/api/logs/batch', batch_body(i)),
+        'topology': lambda i: ('GET', '/api/topology', None),
+        'topology_clusters': lambda i: ('GET', '/api/topology/clusters?by=switch', None),
+        'health': lambda i: ('GET', '/api/health', None)
+    }
+
+
+def bench_endpoints(api, macs: List[str], clients: int, requests_per_endpoint: int) -> Dict[str, Any]:
+    """Latency of each route with `clients` threads issuing requests concurrently"""
+    results = {}
+    for name, make_request in endpoint_requests(macs).items():
+        client = api.app.test_client()
+
+        def issue(i, client=client, make_request=make_request):
+            method, url, body = make_request(i)
+            start = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            response.get_data()
+            return time.perf_counter() - start, response.status_code
+
+        # First request pays one-time costs (index build, store ingest, topology hash)
+        cold_seconds, status = issue(0)
+        if name == 'logs_query':
+            # The first query ingests one step and leaves the rest to a background thread; measure steady state
+            api.ingest_log_store()
+
+        samples: List[float] = []
+        errors = []
+        lock = threading.Lock()
+        counter = iter(range(1, requests_per_endpoint + 1))
+
+        def worker():
+            local_client = api.app.test_client()
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                elapsed, code = issue(i, client=local_client)
+                with lock:
+                    samples.append(elapsed)
+                    if code >= 400:
+                        errors.append(code)
+
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        results[name] = dict(latency_summary(samples, wall),
+                             cold_ms=round(cold_seconds * 1000, 3),
+                             cold_status=status,
+                             errors=len(errors))
+        print(f"  {name:<20} p50 {results[name]['p50_ms']:9.2f} ms  p99 {results[name]['p99_ms']:9.2f} ms  "
+              f"{results[name]['requests_per_sec']:8.1f} req/s  (cold {results[name]['cold_ms']:.1f} ms)")
+    return results
+
+
+def peak_rss_kb() -> int:
+    """
+    This process's peak RSS. /proc's VmHWM is preferred: ru_maxrss survives exec,
+    so a child forked from a large parent would report the parent's peak.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def writer_child(mode: str, devices: int, target: str) -> Dict[str, Any]:
+    """Runs in a subprocess: time one writer mode and report this process's peak RSS"""
+    import write_topology_data as writer
+
+    base_rss = peak_rss_kb()
+    if mode == 'stream':
+        # Records are generated lazily, so peak RSS reflects the writer rather than the input
+        start = time.perf_counter()
+        connections: List[Dict[str, Any]] = []
+
+        def devices_iter():
+            for device, connection in iter_topology_records(devices):
+                if connection:
+                    connections.append(connection)
+                yield device
+
+        ok = writer.write_topology_stream(devices_iter(), iter(connections), target_path=target)
+    else:
+        data = generate_topology(devices)
+        if mode == 'delta':
+            # Give the delta writer a previous version to diff against
+            writer.write_topology_delta(generate_topology(devices, seed=7), target)
+        base_rss = peak_rss_kb()
+        start = time.perf_counter()
+        ok = (writer.write_topology_delta if mode == 'delta' else writer.write_topology_data)(data, target)
+    elapsed = time.perf_counter() - start
+    peak_rss = peak_rss_kb()
+    return {
+        'ok': bool(ok),
+        'seconds': round(elapsed, 3),
+        'devices_per_sec': round(devices / elapsed) if elapsed else None,
+        'output_bytes': os.path.getsize(target) if os.path.exists(target) else 0,
+        'peak_rss_kb': peak_rss,
+        'peak_rss_before_write_kb': base_rss
+    }
+
+
+def bench_writer(devices: int, work_dir: str) -> Dict[str, Any]:
+    results = {}
+    for mode in WRITER_MODES:
+        target = os.path.join(work_dir, f'writer_{mode}', 'raw_data_complete.json')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--writer-child', mode, str(devices), target],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            results[mode] = {'ok': False, 'error': proc.stderr.strip()[-2000:]}
+            print(f"  {mode:<8} ✗ {results[mode]['error'].splitlines()[-1] if proc.stderr else 'failed'}")
+            continue
+        results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"  {mode:<8} {results[mode]['seconds']:8.2f}s  peak RSS {results[mode]['peak_rss_kb'] / 1024:8.1f} MB  "
+              f"({results[mode]['output_bytes'] / 1e6:,.1f} MB written)")
+    return results
+
+
+def serve_child(mode: str, log_path: str, topology_path: str, port: int, workers: int, use_cache: bool) -> None:
+    """Runs in a subprocess: serve the API on the synthetic files until SIGTERM"""
+    import firewall_log_api as api
+
+    configure_api(api, log_path, topology_path, use_cache)
+    api.ingest_log_store()  # Start from a caught-up log store, like a long-running deployment
+    if mode == 'flask':
+        api.app.run(host='127.0.0.1', port=port, debug=False, threaded=True)
+        return
+
+    from gunicorn.app.base import Application
+
+    class BenchApplication(Application):
+        def load_config(self):
+            # The production settings and hooks, on a local port
+            self.load_config_from_file(os.path.join(REPO_DIR, 'gunicorn.conf.py'))
+            self.cfg.set('bind', f'127.0.0.1:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('accesslog', None)
+
+        def load(self):
+            return api.app
+
+    BenchApplication().run()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def http_request(base_url: str, method: str, url: str, body: Optional[Dict[str, Any]]) -> int:
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + url, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def bench_serving(log_path: str, topology_path: str, macs: List[str], clients: int,
+                  requests_total: int, workers: int, use_cache: bool) -> Dict[str, Any]:
+    """Mixed HTTP load against each serving mode, then time its shutdown"""
+    results = {}
+    routes = endpoint_requests(macs)
+    for mode in SERVING_MODES:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve-child', mode, log_path, topology_path,
+             str(port), str(workers)] + (['--cache'] if use_cache else []),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        try:
+            deadline = time.monotonic() + SERVER_START_TIMEOUT
+            while True:
+                try:
+                    http_request(base_url, 'GET', '/api/health', None)
+                    break
+                except OSError:
+                    if proc.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"{mode} server did not start: {proc.stderr.read()[-2000:]}")
+                    time.sleep(0.2)
+
+            # Warm every worker's index/store/topology hash before timing
+            for name in SERVING_ROUTES:
+                for i in range(max(workers, 1) * 2):
+                    http_request(base_url, *routes[name](i))
+
+            samples: Dict[str, List[float]] = {name: [] for name in SERVING_ROUTES}
+            errors = []
+            lock = threading.Lock()
+            counter = iter(range(requests_total))
+
+            def worker():
+                while True:
+                    with lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    name = SERVING_ROUTES[i % len(SERVING_ROUTES)]
+                    start = time.perf_counter()
+                    try:
+                        code = http_request(base_url, *routes[name](i))
+                    except OSError:
+                        code = 599
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        samples[name].append(elapsed)
+                        if code >= 400:
+                            errors.append(code)
+
+            threads = [threading.Thread(target=worker) for _ in range(clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - start
+
+            mode_results: Dict[str, Any] = {name: latency_summary(samples[name], wall) for name in SERVING_ROUTES}
+            mode_results['total'] = latency_summary([t for name in SERVING_ROUTES for t in samples[name]], wall)
+            mode_results['errors'] = len(errors)
+        finally:
+            stop_start = time.perf_counter()
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            stop_seconds = time.perf_counter() - stop_start
+        mode_results['shutdown_seconds'] = round(stop_seconds, 3)
+        results[mode] = mode_results
+        print(f"  {mode:<9} {mode_results['total']['requests_per_sec']:8.1f} req/s  "
+              f"health p99 {mode_results['health']['p99_ms']:9.2f} ms  "
+              f"tail p99 {mode_results['logs_tail']['p99_ms']:9.2f} ms  "
+              f"stop {mode_results['shutdown_seconds']:.2f}s  errors {mode_results['errors']}")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(value: Any, prefix: str = '') -> Dict[str, float]:
+    """{'a': {'b': 1}} -> {'a.b': 1}, numeric leaves only"""
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f'{prefix}{key}.'))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix[:-1]: value}
+    return {}
+
+
+def compare(previous_path: str, current: Dict[str, Any]) -> None:
+    """Print the relative change of every metric shared with a previous results file"""
+    with open(previous_path) as f:
+        previous = flatten(json.load(f)['results'])
+    print(f"\nChange vs {previous_path}:")
+    for key, value in flatten(current['results']).items():
+        old = previous.get(key)
+        if old:
+            print(f"  {key:<60} {old:>14,.3f} -> {value:>14,.3f}  ({(value - old) / old * 100:+6.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log-size', type=parse_size, default=parse_size('100MB'),
+                        help='Synthetic firewall log size (e.g. 100MB, 1GB)')
+    parser.add_argument('--macs', type=int, default=200, help='Distinct MACs in the log')
+    parser.add_argument('--devices', type=int, default=10000, help='Devices in the synthetic topology')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent test clients per endpoint')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--cache', action='store_true', help='Keep the API result caches enabled')
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) * 2 + 1,
+                        help='gunicorn worker processes for the serving suite')
+    parser.add_argument('--scan-workers', default='',
+                        help='Comma-separated fixed scan process counts to also measure in the scan suite '
+                             '(default: only the gunicorn.conf.py defaults)')
+    parser.add_argument('--only', default=','.join(SUITES), help='Comma-separated suites to run')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous results file to diff against')
+    parser.add_argument('--writer-child', nargs=3, metavar=('MODE', 'DEVICES', 'TARGET'), help=argparse.SUPPRESS)
+    parser.add_argument('--serve-child', nargs=5, metavar=('MODE', 'LOG', 'TOPOLOGY', 'PORT', 'WORKERS'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_child:
+        mode, log_path, topology_path, port, workers = args.serve_child
+        serve_child(mode, log_path, topology_path, int(port), int(workers), args.cache)
+        return 0
+
+    if args.writer_child:
+        mode, devices, target = args.writer_child
+        result = writer_child(mode, int(devices), target)
+        print(json.dumps(result))
+        return 0
+
+    suites = [suite.strip() for suite in args.only.split(',') if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suite(s): {', '.join(sorted(unknown))}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {
+                'log_size': args.log_size,
+                'macs': args.macs,
+                'devices': args.devices,
+                'clients': args.clients,
+                'requests': args.requests,
+                'cache': args.cache,
+                'workers': args.workers,
+                'scan_workers': args.scan_workers
+            }
+        },
+        'results': {}
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if {'parse', 'endpoints', 'serving', 'scan'} & set(suites):
+            import firewall_log_api as api
+            import write_topology_data as writer
+
+            macs = synthetic_macs(args.macs)
+            log_path = os.path.join(work_dir, 'firewall.log')
+            print(f"Generating {args.log_size / 1e6:,.0f} MB log ({args.macs} MACs)...")
+            lines = write_synthetic_log(log_path, macs=macs, max_bytes=args.log_size)
+            report['meta']['params']['log_lines'] = lines
+
+            topology_path = os.path.join(work_dir, 'raw_data_complete.json')
+            print(f"Generating {args.devices:,}-device topology...")
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    writer.write_topology_data(generate_topology(args.devices), topology_path)
+                finally:
+                    sys.stdout = stdout
+
+            if 'parse' in suites:
+                print(f"\nParse ({lines:,} lines):")
+                report['results']['parse'] = bench_parse(api, log_path, lines, macs[0])
+                for name, result in report['results']['parse'].items():
+                    print(f"  {name:<20} {result['lines_per_sec']:12,} lines/sec")
+
+            if 'endpoints' in suites:
+                configure_api(api, log_path, topology_path, args.cache)
+                print(f"\nEndpoints ({args.clients} clients x {args.requests} requests, "
+                      f"cache {'on' if args.cache else 'off'}):")
+                report['results']['endpoints'] = bench_endpoints(api, macs, args.clients, args.requests)
+
+            if 'serving' in suites:
+                print(f"\nServing ({args.clients} HTTP clients x {args.requests * len(SERVING_ROUTES)} mixed requests, "
+                      f"gunicorn {args.workers} workers, cache {'on' if args.cache else 'off'}):")
+                report['results']['serving'] = bench_serving(log_path, topology_path, macs, args.clients,
+                                                             args.requests * len(SERVING_ROUTES), args.workers,
+                                                             args.cache)
+
+            if 'scan' in suites:
+                worker_counts = [int(n) for n in args.scan_workers.split(',') if n.strip()]
+                print(f"\nScan ({args.log_size / 1e6:,.0f} MB log, up to {args.clients} concurrent API processes):")
+                scan_config = report['meta']['params']['scan_default'] = gunicorn_scan_config()
+                report['results']['scan'] = bench_scan(log_path, macs, worker_counts, scan_config, args.clients)
+
+        if 'writer' in suites:
+            print(f"\nWriter ({args.devices:,} devices):")
+            report['results']['writer'] = bench_writer(args.devices, work_dir)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+
+    if args.compare:
+        compare(args.compare, report)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Synthetic Benchmark Data
+Deterministic firewall logs and topology exports of arbitrary size, shared by
+the benchmarks in this directory.
+
+Usage:
+    python benchmarks/synthetic.py log PATH [--size 1GB | --lines N] [--macs 200]
+    python benchmarks/synthetic.py topology PATH [--devices 10000]
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+from collections import Counter
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_topology_data import generate_sample_topology_data, write_topology_data  # noqa: E402
+
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+HOSTS_PER_NETWORK = 250  # Devices per synthetic /24
+DEVICES_PER_SWITCH = 48  # Access ports per synthetic switch
+
+
+def parse_size(value: str) -> int:
+    """'512MB' / '1GB' / '1048576' -> bytes"""
+    text = value.strip().upper()
+    number = text.rstrip('KMGB')
+    unit = text[len(number):]
+    if unit not in SIZE_UNITS:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def synthetic_macs(count: int) -> List[str]:
+    return [f"AA:BB:CC:{i // 65536 % 256:02X}:{i // 256 % 256:02X}:{i % 256:02X}" for i in range(count)]
+
+
+def write_synthetic_log(path: str, lines: Optional[int] = None, macs: Optional[List[str]] = None,
+                        max_bytes: Optional[int] = None, seed: int = 42) -> int:
+    """
+    Write a firewall log in the key="value" format parse_log_line expects.
+
+    Args:
+        path: Output file
+        lines: Number of lines to write (unbounded if only max_bytes is given)
+        macs: MAC population; src/dst MACs are drawn uniformly from it
+        max_bytes: Stop once the file reaches this size
+        seed: RNG seed, so the same arguments always produce the same file
+
+    Returns:
+        int: Number of lines written
+    """
+    if lines is None and max_bytes is None:
+        raise ValueError("lines or max_bytes is required")
+    macs = macs or synthetic_macs(200)
+    rng = random.Random(seed)
+    severities = ['Information', 'Warning', 'Critical']
+    protocols = ['TCP', 'UDP', 'ICMP']
+    subtypes = ['Allowed', 'Allowed', 'Allowed', 'Denied']
+    written = 0
+    size = 0
+    with open(path, 'w') as f:
+        while (lines is None or written < lines) and (max_bytes is None or size < max_bytes):
+            i = written
+            line = (
+                f'2026-01-09T12:{i // 60 % 60:02d}:{i % 60:02d}+00:00 _gateway device_name="X01308HB6P42VD3" '
+                f'timestamp="2026-01-09T17:49:47" log_type="Firewall" log_subtype="{rng.choice(subtypes)}" '
+                f'severity="{rng.choice(severities)}" '
+                f'fw_rule_name="LAN TO WAN" protocol="{rng.choice(protocols)}" '
+                f'src_mac="{rng.choice(macs)}" dst_mac="{rng.choice(macs)}" '
+                f'src_ip="172.16.16.{rng.randint(1, 254)}" dst_ip="173.194.14.{rng.randint(1, 254)}" '
+                f'src_port={rng.randint(1024, 65535)} dst_port={rng.choice([53, 80, 443, 445])} '
+                f'src_country="R1" dst_country="USA" in_interface="Port2" out_interface="Port1"\n'
+            )
+            f.write(line)
+            size += len(line)
+            written += 1
+    return written
+
+
+def iter_topology_records(devices: int, seed: int = 42) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+    """
+    Yield (device, connection or None) for a synthetic topology of `devices` devices.
+
+    Devices get MACs from synthetic_macs (so synthetic logs reference them), are
+    spread over /24 networks of HOSTS_PER_NETWORK hosts, and every
+    DEVICES_PER_SWITCH devices share an access switch whose connections list
+    their MACs. Records are modelled on generate_sample_topology_data's.
+    """
+    rng = random.Random(seed)
+    sections = generate_sample_topology_data()['data']
+    device_templates = sections['devices']['records']
+    connection_template = sections['connections']['records'][0]
+    switch_id = None
+    for i in range(devices):
+        network = ipaddress.ip_network(f"10.{i // HOSTS_PER_NETWORK // 256 % 256}.{i // HOSTS_PER_NETWORK % 256}.0/24")
+        ip = str(network.network_address + 1 + i % HOSTS_PER_NETWORK)
+        if i % DEVICES_PER_SWITCH == 0:
+            template = device_templates[0]  # The sample's switch
+        else:
+            template = device_templates[1 + rng.randrange(len(device_templates) - 1)]
+        mac = f"AA:BB:CC:{i // 65536 % 256:02X}:{i // 256 % 256:02X}:{i % 256:02X}"
+        device = dict(template, id=i + 1, ip=ip, mac=mac, network=str(network),
+                      name=f"{template['type'].lower()}-{i + 1}", confidence=rng.randint(40, 100))
+
+        connection = None
+        if i % DEVICES_PER_SWITCH == 0:
+            switch_id = device['id']
+        else:
+            connection = dict(connection_template, id=i + 1, device_id=switch_id,
+                              port_name=f"GigabitEthernet0/{i % DEVICES_PER_SWITCH}",
+                              mac_address=mac, ip_address=ip, vendor=device['vendor'])
+        yield device, connection
+
+
+def generate_topology(devices: int, seed: int = 42) -> Dict[str, Any]:
+    """Scale generate_sample_topology_data up to `devices` devices (see iter_topology_records)"""
+    data = generate_sample_topology_data()
+    sections = data['data']
+    device_records = []
+    connection_records = []
+    for device, connection in iter_topology_records(devices, seed):
+        device_records.append(device)
+        if connection:
+            connection_records.append(connection)
+
+    sections['devices'] = {'count': len(device_records), 'records': device_records}
+    sections['connections'] = {'count': len(connection_records), 'records': connection_records}
+    for name, field in (('device_type_breakdown', 'type'), ('vendor_breakdown', 'vendor'),
+                        ('name_resolution_sources', 'name_source')):
+        sections[name] = dict(Counter(device[field] for device in device_records))
+    sections['scan_metadata'][0]['total_devices'] = len(device_records)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='kind', required=True)
+    log = sub.add_parser('log', help='Synthetic firewall log')
+    log.add_argument('path')
+    log.add_argument('--size', type=parse_size, help='Target file size, e.g. 512MB or 1GB')
+    log.add_argument('--lines', type=int, help='Number of lines (default 1,000,000 if --size is not given)')
+    log.add_argument('--macs', type=int, default=200, help='Number of distinct MACs')
+    topology = sub.add_parser('topology', help='Synthetic topology export')
+    topology.add_argument('path')
+    topology.add_argument('--devices', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.kind == 'log':
+        lines = args.lines if args.lines or args.size else 1000000
+        written = write_synthetic_log(args.path, lines, synthetic_macs(args.macs), args.size)
+        print(f"✓ Wrote {written:,} lines ({os.path.getsize(args.path) / 1e6:,.1f} MB) to {args.path}")
+    else:
+        if not write_topology_data(generate_topology(args.devices), args.path):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -177,6 +177,17 @@ const TopologyGraph: React.FC<TopologyGraphProps> = ({ data, onNodeSelect, selec
     distributeRing(ring1, 200);
     distributeRing(ring2, 350);
 
+    // Use server-side positions (write_topology_data.py --layout) when every node has one
+    const precomputed = data.data.layout?.positions;
+    const usePrecomputed = !!precomputed && nodes.every(n => precomputed[n.id]);
+    if (usePrecomputed) {
+        nodes.forEach(n => {
+            const [x, y] = precomputed![n.id];
+            n.x = centerX + x;
+            n.y = centerY + y;
+        });
+    }
+
     // --- Simulation ---
     const simulation = d3.forceSimulation(nodes)
       .force("link", d3.forceLink(links).id((d: any) => d.id).strength(0.2))
@@ -282,7 +293,7 @@ const TopologyGraph: React.FC<TopologyGraphProps> = ({ data, onNodeSelect, selec
       .style("pointer-events", "none")
       .attr("text-anchor", "start");
       
-    simulation.on("tick", () => {
+    const ticked = () => {
       link
         .attr("x1", (d: any) => d.source.x)
         .attr("y1", (d: any) => d.source.y)
@@ -297,7 +308,14 @@ const TopologyGraph: React.FC<TopologyGraphProps> = ({ data, onNodeSelect, selec
           return `translate(${isLeft ? -15 : 15}, 0)`; 
       })
       .attr("text-anchor", d => d.id === hubId ? "middle" : (d.x! < centerX ? "end" : "start"));
-    });
+    };
+
+    simulation.on("tick", ticked);
+    if (usePrecomputed) {
+        // Already laid out: draw once, the simulation only runs again while dragging
+        simulation.stop();
+        ticked();
+    }
 
     function dragstarted(event: any, d: any) {
       if (!event.active) simulation.alphaTarget(0.3).restart();
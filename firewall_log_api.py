@@ -4,56 +4,173 @@ Firewall Log API Server
 Serves filtered firewall logs for NetTopo Visualizer
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
+import json
+import queue
 import re
-from datetime import datetime
-from collections import deque
+from datetime import datetime, timezone
+from collections import OrderedDict, deque
+import argparse
+import base64
+import fcntl
+import gzip
+import hashlib
+import ipaddress
+import math
 import os
+import subprocess
+import sys
+import tempfile
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import attrgetter
+
+import api_metrics as metrics
+from log_store import LogStore, file_lock
+import parallel_scan
+from parallel_scan import MAC_FIELD_RE, mac_search_tokens
+from scan_history import ScanHistory, parse_time
+from topology_publisher import DirectoryWatcher
+from traffic_summary import TOP_PORTS, TrafficAggregator, select_summary
+from write_topology_data import CLUSTER_SUFFIX, atomic_write_bytes, build_cluster_index
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React app
 
 LOG_FILE = "/home/ubuntu/firewall_sim/firewall.log"
+LOG_INDEX_FILE = LOG_FILE + ".macidx"  # SQLite index: normalized MAC -> line byte offsets
+SCAN_SLOT_DIR = LOG_FILE + ".scan-slots"  # Slot lock files shared by every worker's scan pool (see parallel_scan.py)
 MAX_LOGS_PER_DEVICE = 100  # Return max 100 logs per device
+INDEX_BATCH_LINES = 50000  # Commit index updates every N lines
+COLD_INDEX_BYTES = 64 * 1024 * 1024  # Index this far behind LOG_FILE: answer with a parallel scan while it catches up
+REVERSE_READ_CHUNK_SIZE = 64 * 1024  # Block size for reading the log backward from EOF
+TAIL_MAX_BYTES = 256 * 1024 * 1024  # Stop a tail scan after reading this many bytes
+TAIL_MAX_SECONDS = 2.0  # ...or after this much wall time
+REQUEST_DEADLINE_SECONDS = 30.0  # Budget for full scans in one request (cold/unindexed lookups, store queries)
+DEADLINE_CHECK_LINES = 4096  # Lines read between deadline checks
+MAX_BATCH_MACS = 5000  # Max MACs accepted by /api/logs/batch
+FOLLOW_POLL_INTERVAL = 0.5  # Seconds between checks for new lines / rotation in the follower
+STREAM_QUEUE_SIZE = 1000  # Per-subscriber buffer; events are dropped for slow clients beyond this
+STREAM_KEEPALIVE_SECONDS = 15  # Send an SSE comment this often so proxies keep the stream open
+SEGMENT_SUMMARY_SUFFIX = ".summary.json"  # Sidecar next to each rotated segment
+BLOOM_FALSE_POSITIVE_RATE = 0.01  # Target false positive rate for segment MAC Bloom filters
+# Rotated siblings of LOG_FILE: firewall.log.1, firewall.log.2.gz, firewall.log-20260109.gz
+ROTATED_SUFFIX_RE = re.compile(r'^[.-](\d+)(\.gz)?$')
+LOG_STORE_DIR = LOG_FILE + ".store"  # Columnar store for /api/logs/query
+MAX_QUERY_LIMIT = 1000  # Max records returned by /api/logs/query
+LOG_STORE_INGEST_BYTES = 4 * 1024 * 1024  # Log bytes ingested per step (~1s of parsing); a query ingests one, a background thread the rest
+TOPOLOGY_FILE = "/var/www/reactapp/data/raw_data_complete.json"  # Topology export (served by /api/topology, pinged by sweeps)
+TOPOLOGY_HASH_SUFFIX = ".sha256"  # Sidecar written by write_topology_data / topology_publisher.py
+TOPOLOGY_WATCH_SECONDS = 1.0  # Max wait per topology watch round (how quickly the notifier notices stop())
+TOPOLOGY_EVENTS_QUEUE_SIZE = 4  # Per-subscriber buffer; only the newest version matters
+MAX_CLUSTER_PAGE = 1000  # Max member devices returned per cluster expand request
+MAX_NEIGHBORHOOD_NODES = 500  # Max devices returned by /api/topology/neighborhood
+MAX_NEIGHBORHOOD_HOPS = 3
+PING_COUNT = 4  # Packets per ping
+PING_TIMEOUT_SECONDS = 10  # Hard per-target timeout
+PING_MAX_CONCURRENCY = 32  # Global cap on concurrent ping processes for batch sweeps
+MAX_PING_BATCH = 4096  # Max targets per /api/ping/batch request
+PING_CACHE_TTL = 10  # Seconds a ping result is reused for the same IP
+LOG_CACHE_TTL = 5  # Seconds a log lookup is reused for the same MAC (while LOG_FILE is unchanged)
+RESULT_CACHE_SIZE = 1024  # Max entries per endpoint cache (least recently used evicted)
+SLOW_REQUEST_LOG = None  # JSON-lines file for slow requests (None disables; see --slow-log)
+SLOW_REQUEST_SECONDS = 1.0  # Requests at least this slow go to SLOW_REQUEST_LOG
+TRAFFIC_POLL_INTERVAL = 2.0  # Seconds between traffic summary updates from LOG_FILE
+TRAFFIC_BACKFILL_BYTES = 64 * 1024 * 1024  # On start, summarize at most this much of the end of LOG_FILE
+TRAFFIC_READY_TIMEOUT = 10.0  # Max seconds /api/traffic/summary waits for the initial backfill
+TRAFFIC_SNAPSHOT_FILE = LOG_FILE + ".traffic.json"  # Summary published by the one process that follows the log
+TRAFFIC_LEADER_LOCK = LOG_FILE + ".traffic.lock"  # flock()ed by that process; another takes over if it exits
+TRAFFIC_SNAPSHOT_MAX_AGE = 30.0  # Older snapshots (e.g. from before a restart) don't count as ready
+MAX_TRAFFIC_TOP_PORTS = 50
+
+# Leading token of a syslog line (the syslog timestamp)
+LOG_TIMESTAMP_RE = re.compile(r'^(\S+)')
+# Single pass over key="value" and key=123 pairs
+LOG_KV_RE = re.compile(r'(\w+)=(?:"([^"]*)"|(\d+))')
+
+# Fields extracted from each log line, with their defaults
+LOG_FIELD_DEFAULTS = {
+    'timestamp': '',
+    'severity': 'Information',
+    'src_ip': '',
+    'dst_ip': '',
+    'src_mac': '',
+    'dst_mac': '',
+    'protocol': '',
+    'src_port': '',
+    'dst_port': '',
+    'fw_rule_name': '',
+    'log_subtype': '',
+    'src_country': '',
+    'dst_country': '',
+    'in_interface': '',
+    'out_interface': '',
+}
+LOG_FIELDS = tuple(LOG_FIELD_DEFAULTS)
+# Low-cardinality fields whose values are interned, so records share one string per distinct value
+INTERNED_LOG_FIELDS = ('severity', 'protocol', 'log_subtype', 'fw_rule_name', 'src_country', 'dst_country',
+                       'in_interface', 'out_interface', 'src_mac', 'dst_mac', 'src_port', 'dst_port')
+LOG_SHAPES = ('records', 'columnar')  # ?shape= for log responses: list of objects, or {"fields", "rows"}
+
+class LogRecord:
+    """
+    A parsed log line: one slot per LOG_FIELDS entry, plus `raw` (the original
+    line, or None unless the parse was asked to keep it). A fraction of the size
+    of the equivalent dict; supports record['field'] and record.get() as well.
+    """
+
+    __slots__ = LOG_FIELDS + ('raw',)
+
+    def __init__(self, values, raw=None):
+        for name in LOG_FIELDS:
+            setattr(self, name, values[name])
+        self.raw = raw
 
-def parse_log_line(line):
-    """Parse a single firewall log line into structured data"""
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self, include_raw=True):
+        record = {name: getattr(self, name) for name in LOG_FIELDS}
+        if include_raw and self.raw is not None:
+            record['raw'] = self.raw
+        return record
+
+def parse_log_line(line, keep_raw=False):
+    """Parse a single firewall log line into a LogRecord (keeping the raw line only if asked)"""
     try:
-        # Extract timestamp (first part before _gateway)
-        timestamp_match = re.match(r'^(\S+)', line)
-        timestamp = timestamp_match.group(1) if timestamp_match else None
+        record = LOG_FIELD_DEFAULTS.copy()
+        found = set()
         
-        # Extract key-value pairs
-        data = {}
-        for match in re.finditer(r'(\w+)="([^"]*)"', line):
-            key, value = match.groups()
-            data[key] = value
+        # Quoted values always win; a bare numeric value only fills a field
+        # that hasn't been seen yet
+        for key, quoted, number in LOG_KV_RE.findall(line):
+            if key not in record:
+                continue
+            if number:
+                if key in found:
+                    continue
+                record[key] = number
+            else:
+                record[key] = quoted
+            found.add(key)
         
-        # Extract numeric values without quotes
-        for match in re.finditer(r'(\w+)=(\d+)', line):
-            key, value = match.groups()
-            if key not in data:  # Don't override quoted values
-                data[key] = value
+        # Prefer the syslog timestamp (first part before _gateway)
+        timestamp_match = LOG_TIMESTAMP_RE.match(line)
+        if timestamp_match:
+            record['timestamp'] = timestamp_match.group(1)
         
-        return {
-            'timestamp': timestamp or data.get('timestamp', ''),
-            'severity': data.get('severity', 'Information'),
-            'src_ip': data.get('src_ip', ''),
-            'dst_ip': data.get('dst_ip', ''),
-            'src_mac': data.get('src_mac', ''),
-            'dst_mac': data.get('dst_mac', ''),
-            'protocol': data.get('protocol', ''),
-            'src_port': data.get('src_port', ''),
-            'dst_port': data.get('dst_port', ''),
-            'fw_rule_name': data.get('fw_rule_name', ''),
-            'log_subtype': data.get('log_subtype', ''),
-            'src_country': data.get('src_country', ''),
-            'dst_country': data.get('dst_country', ''),
-            'in_interface': data.get('in_interface', ''),
-            'out_interface': data.get('out_interface', ''),
-            'raw': line.strip()  # Keep raw line for debugging
-        }
+        for key in INTERNED_LOG_FIELDS:
+            record[key] = sys.intern(record[key])
+        return LogRecord(record, line.strip() if keep_raw else None)
     except Exception as e:
         print(f"Error parsing line: {e}")
         return None
@@ -64,168 +181,2236 @@ def normalize_mac(mac):
         return ""
     return mac.replace(':', '').replace('-', '').upper()
 
+def line_may_mention_mac(raw_line, tokens):
+    """Cheap substring pre-filter run before parse_log_line"""
+    for token in tokens:
+        if token in raw_line:
+            return True
+    return False
+
+def log_involves_mac(parsed, normalized_mac):
+    """Exact check that a parsed log has the MAC as src_mac or dst_mac"""
+    return normalized_mac in (normalize_mac(parsed.src_mac), normalize_mac(parsed.dst_mac))
+
+def shape_logs(records, shape='records', include_raw=False):
+    """JSON-ready form of LogRecords: a list of objects, or {'fields': [...], 'rows': [[...], ...]} when columnar"""
+    if shape == 'columnar':
+        fields = LOG_FIELDS + ('raw',) if include_raw else LOG_FIELDS
+        row = attrgetter(*fields)
+        return {'fields': list(fields), 'rows': [row(record) for record in records]}
+    return [record.to_dict(include_raw) for record in records]
+
+def log_output_options(params):
+    """(shape, include_raw) from request params ('shape', 'raw'); raises ValueError for an unknown shape"""
+    shape = params.get('shape') or 'records'
+    if shape not in LOG_SHAPES:
+        raise ValueError(f"Invalid shape: {shape} (expected one of {', '.join(LOG_SHAPES)})")
+    raw = params.get('raw', False)
+    include_raw = raw if isinstance(raw, bool) else str(raw).lower() in ('1', 'true', 'yes')
+    return shape, include_raw
+
+def match_mac_lines(raw_lines, normalized_search_mac, keep_raw=False):
+    """
+    Yield parsed logs for a MAC from raw byte lines: cheap substring pre-filter,
+    then a full parse of candidate lines only. Line counts and parse time are
+    recorded once, when the generator finishes or is closed; everything else
+    spent in the loop (outside the reader's own 'read' time) counts as 'filter'.
+    """
+    tokens = mac_search_tokens(normalized_search_mac)
+    started = time.perf_counter()
+    read_before = metrics.stage_seconds('read')
+    parse_seconds = 0.0
+    scanned = parsed_count = 0
+    try:
+        for raw_line in raw_lines:
+            scanned += 1
+            if not line_may_mention_mac(raw_line, tokens):
+                continue
+            parse_start = time.perf_counter()
+            parsed = parse_log_line(raw_line.decode('utf-8', 'replace'), keep_raw)
+            parse_seconds += time.perf_counter() - parse_start
+            parsed_count += 1
+            if parsed and log_involves_mac(parsed, normalized_search_mac):
+                yield parsed
+    finally:
+        read_seconds = metrics.stage_seconds('read') - read_before
+        metrics.add('lines_scanned', scanned)
+        metrics.add('lines_parsed', parsed_count)
+        metrics.add_time('parse', parse_seconds)
+        metrics.add_time('filter', max(0.0, time.perf_counter() - started - read_seconds - parse_seconds))
+
+def parse_lines(lines, keep_raw=False):
+    """Parse already-selected lines (e.g. index hits), recording parse time. Unparseable lines are dropped."""
+    start = time.perf_counter()
+    parsed = [parse_log_line(line, keep_raw) for line in lines]
+    metrics.add_time('parse', time.perf_counter() - start)
+    metrics.add('lines_parsed', len(lines))
+    return [record for record in parsed if record]
+
+class LogOffsetIndex:
+    """
+    Persistent on-disk index of LOG_FILE: normalized MAC -> byte offsets of
+    the lines where it appears as src_mac or dst_mac.
+
+    The index remembers how far into the file it has read (and the file's inode),
+    so each refresh only parses newly appended lines. If the log is replaced or
+    truncated the index is rebuilt from scratch.
+    """
+
+    def __init__(self, log_path, index_path):
+        self.log_path = log_path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS mac_offsets ('
+            'mac TEXT NOT NULL, offset INTEGER NOT NULL, '
+            'PRIMARY KEY (mac, offset)) WITHOUT ROWID'
+        )
+        return conn
+
+    @staticmethod
+    def _get_meta(conn, key, default=0):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def refresh(self, deadline=None):
+        """
+        Index any lines appended since the last refresh. Returns number of new lines indexed.
+        Raises TimeoutError once `deadline` (time.monotonic()) has passed; lines indexed so far are kept.
+        """
+        # Another thread may be indexing a long backlog; don't wait past the deadline for it
+        if not self._lock.acquire(timeout=-1 if deadline is None else time_left(deadline)):
+            time_left(deadline)
+        try:
+            return self._refresh(deadline)
+        finally:
+            self._lock.release()
+
+    def _refresh(self, deadline):
+        # The file lock keeps other API worker processes from indexing the same lines
+        with file_lock(self.index_path + '.lock'):
+            st = os.stat(self.log_path)
+            conn = self._connect()
+            try:
+                indexed_offset = self._get_meta(conn, 'indexed_offset')
+                indexed_inode = self._get_meta(conn, 'inode', None)
+
+                # Log rotated/replaced or truncated - start over
+                if indexed_inode != st.st_ino or st.st_size < indexed_offset:
+                    conn.execute('DELETE FROM mac_offsets')
+                    indexed_offset = 0
+                    self._set_meta(conn, 'inode', st.st_ino)
+                    self._set_meta(conn, 'indexed_offset', 0)
+                    conn.commit()
+
+                if st.st_size == indexed_offset:
+                    return 0
+
+                new_lines = 0
+                rows = []
+                offset = indexed_offset
+                with open(self.log_path, 'rb') as f:
+                    f.seek(offset)
+                    for line in f:
+                        # Don't index a partially written last line; pick it up next time
+                        if not line.endswith(b'\n'):
+                            break
+                        for match in MAC_FIELD_RE.finditer(line):
+                            mac = normalize_mac((match.group(1) or match.group(2)).decode('ascii', 'ignore'))
+                            if mac:
+                                rows.append((mac, offset))
+                        offset += len(line)
+                        new_lines += 1
+
+                        out_of_time = (deadline is not None and new_lines % DEADLINE_CHECK_LINES == 0
+                                       and time.monotonic() > deadline)
+                        if new_lines % INDEX_BATCH_LINES == 0 or out_of_time:
+                            conn.executemany('INSERT OR IGNORE INTO mac_offsets (mac, offset) VALUES (?, ?)', rows)
+                            self._set_meta(conn, 'indexed_offset', offset)
+                            conn.commit()
+                            rows = []
+                        if out_of_time:
+                            time_left(deadline)
+
+                conn.executemany('INSERT OR IGNORE INTO mac_offsets (mac, offset) VALUES (?, ?)', rows)
+                self._set_meta(conn, 'indexed_offset', offset)
+                conn.commit()
+                return new_lines
+            finally:
+                conn.close()
+
+    def pending_bytes(self):
+        """How far the index is behind the log (the whole file if it was rotated or truncated)"""
+        st = os.stat(self.log_path)
+        conn = self._connect()
+        try:
+            indexed_offset = self._get_meta(conn, 'indexed_offset')
+            if self._get_meta(conn, 'inode', None) != st.st_ino or st.st_size < indexed_offset:
+                return st.st_size
+            return st.st_size - indexed_offset
+        finally:
+            conn.close()
+
+    def refresh_in_background(self):
+        """Start a refresh on a background thread unless one is already running"""
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._background_refresh, name='log-index', daemon=True)
+            self._refresher.start()
+
+    def _background_refresh(self):
+        try:
+            with metrics.timed('index'):
+                self.refresh()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Background log index refresh failed: {e}")
+
+    def iter_offsets(self, normalized_mac, page_size=MAX_LOGS_PER_DEVICE):
+        """Yield byte offsets of every line for a MAC, newest first, fetched a page at a time"""
+        conn = self._connect()
+        try:
+            before = None
+            while True:
+                if before is None:
+                    rows = conn.execute(
+                        'SELECT offset FROM mac_offsets WHERE mac = ? ORDER BY offset DESC LIMIT ?',
+                        (normalized_mac, page_size)
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        'SELECT offset FROM mac_offsets WHERE mac = ? AND offset < ? ORDER BY offset DESC LIMIT ?',
+                        (normalized_mac, before, page_size)
+                    ).fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    yield row[0]
+                before = rows[-1][0]
+        finally:
+            conn.close()
+
+    def newest_offsets_many(self, normalized_macs, limit):
+        """Return {mac: (total matching lines, newest `limit` offsets newest first)} using one connection"""
+        conn = self._connect()
+        try:
+            results = {}
+            for mac in normalized_macs:
+                total = conn.execute('SELECT COUNT(*) FROM mac_offsets WHERE mac = ?', (mac,)).fetchone()[0]
+                rows = conn.execute(
+                    'SELECT offset FROM mac_offsets WHERE mac = ? ORDER BY offset DESC LIMIT ?',
+                    (mac, limit)
+                ).fetchall()
+                results[mac] = (total, [row[0] for row in rows])
+            return results
+        finally:
+            conn.close()
+
+    def read_lines(self, offsets, path=None):
+        """Seek to each offset and read the line there (of the log, or another file such as a rotated segment)"""
+        start = time.perf_counter()
+        lines = []
+        bytes_read = 0
+        with open(path or self.log_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                line = f.readline()
+                bytes_read += len(line)
+                lines.append(line.decode('utf-8', 'replace'))
+        metrics.add_time('read', time.perf_counter() - start)
+        metrics.add('bytes_read', bytes_read)
+        metrics.add('lines_scanned', len(lines))
+        return lines
+
+log_index = LogOffsetIndex(LOG_FILE, LOG_INDEX_FILE)
+
+def read_lines_reverse(path, chunk_size=REVERSE_READ_CHUNK_SIZE):
+    """
+    Yield complete lines of a file from last to first, reading fixed-size blocks
+    backward from EOF. A trailing line without a newline (still being written) is skipped.
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        skip_partial = True
+
+        while position > 0:
+            start = time.perf_counter()
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            metrics.add_time('read', time.perf_counter() - start)
+            metrics.add('bytes_read', read_size)
+
+            # First element may be the tail end of a line that starts in an earlier block
+            remainder = lines.pop(0)
+
+            if skip_partial:
+                if not lines:
+                    # No newline yet - this whole block belongs to the incomplete last line
+                    continue
+                # Text after the final newline is an incomplete line
+                lines.pop()
+                skip_partial = False
+
+            for line in reversed(lines):
+                yield line
+
+        if remainder and not skip_partial:
+            yield remainder
+
+def tail_device_logs(normalized_search_mac, limit=MAX_LOGS_PER_DEVICE,
+                     max_bytes=TAIL_MAX_BYTES, max_seconds=TAIL_MAX_SECONDS, keep_raw=False):
+    """
+    Newest `limit` logs for a MAC, reading LOG_FILE backward from EOF.
+    Stops early once enough matches are found or the byte/time budget is spent.
+    Returns (logs newest first, bytes scanned, budget exhausted).
+    """
+    logs = []
+    bytes_scanned = 0
+    exhausted = False
+    deadline = time.monotonic() + max_seconds
+
+    def budgeted_lines():
+        nonlocal bytes_scanned, exhausted
+        for raw_line in read_lines_reverse(LOG_FILE):
+            bytes_scanned += len(raw_line) + 1
+            if bytes_scanned > max_bytes or time.monotonic() > deadline:
+                exhausted = True
+                return
+            yield raw_line
+
+    matches = match_mac_lines(budgeted_lines(), normalized_search_mac, keep_raw)
+    try:
+        for parsed in matches:
+            logs.append(parsed)
+            if len(logs) >= limit:
+                break
+    finally:
+        matches.close()
+
+    return logs, bytes_scanned, exhausted
+
+def parse_log_time(value):
+    """Parse an ISO 8601 log/query timestamp into an aware datetime (naive = UTC). None if unparseable."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on a blake2b digest)"""
+
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=BLOOM_FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        num_bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_dict(self):
+        return {
+            'num_bits': self.num_bits,
+            'num_hashes': self.num_hashes,
+            'bits': base64.b64encode(bytes(self.bits)).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['num_bits'], data['num_hashes'], bytearray(base64.b64decode(data['bits'])))
+
+def list_rotated_segments(log_path=None):
+    """Rotated/compressed siblings of the log file, newest first"""
+    log_path = log_path or LOG_FILE
+    log_dir = os.path.dirname(log_path) or '.'
+    base = os.path.basename(log_path)
+
+    segments = []
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return []
+    for name in names:
+        if not name.startswith(base):
+            continue
+        match = ROTATED_SUFFIX_RE.match(name[len(base):])
+        if not match:
+            continue
+        path = os.path.join(log_dir, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        # Newest modification first; for equal mtimes a lower .N is newer
+        segments.append((-mtime, int(match.group(1)), path))
+
+    segments.sort()
+    return [path for _, _, path in segments]
+
+def open_segment(path):
+    """Open a log segment for binary reading, transparently decompressing .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+_segment_summaries = {}  # path -> (size, mtime, summary)
+_segment_summaries_lock = threading.Lock()
+
+def build_segment_summary(path):
+    """One pass over a rotated segment: time range, line count and a Bloom filter of its MACs"""
+    macs = set()
+    first_timestamp = None
+    last_timestamp = None
+    lines = 0
+
+    with open_segment(path) as f:
+        for raw_line in f:
+            lines += 1
+            timestamp_match = LOG_TIMESTAMP_RE.match(raw_line.decode('utf-8', 'replace'))
+            if timestamp_match:
+                if first_timestamp is None:
+                    first_timestamp = timestamp_match.group(1)
+                last_timestamp = timestamp_match.group(1)
+            for match in MAC_FIELD_RE.finditer(raw_line):
+                mac = normalize_mac((match.group(1) or match.group(2)).decode('ascii', 'ignore'))
+                if mac:
+                    macs.add(mac)
+
+    bloom = BloomFilter.for_capacity(len(macs))
+    for mac in macs:
+        bloom.add(mac)
+
+    return {
+        'first_timestamp': first_timestamp,
+        'last_timestamp': last_timestamp,
+        'lines': lines,
+        'distinct_macs': len(macs),
+        'bloom': bloom.to_dict()
+    }
+
+def write_segment_summary(path, summary):
+    """Atomically write a segment's sidecar summary (best effort - the log dir may be read-only)"""
+    sidecar = path + SEGMENT_SUMMARY_SUFFIX
+    try:
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(sidecar) or '.', suffix='.tmp', prefix='.summary_')
+        with os.fdopen(tmp_fd, 'w') as f:
+            json.dump(summary, f)
+        os.replace(tmp_path, sidecar)
+    except OSError as e:
+        print(f"Could not write segment summary {sidecar}: {e}")
+
+def get_segment_summary(path, build=True):
+    """
+    Load (or build and persist) the sidecar summary for a rotated segment.
+    With build=False a missing or stale summary is left to the background
+    builder (building one reads the whole segment) and None is returned.
+    """
+    st = os.stat(path)
+    with _segment_summaries_lock:
+        cached = _segment_summaries.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+            return cached[2]
+
+    summary = None
+    sidecar = path + SEGMENT_SUMMARY_SUFFIX
+    try:
+        with open(sidecar) as f:
+            stored = json.load(f)
+        if stored.get('size') == st.st_size and stored.get('mtime') == st.st_mtime:
+            summary = stored
+    except (OSError, ValueError):
+        pass
+
+    if summary is None:
+        if not build:
+            build_segment_summaries_in_background([path])
+            return None
+        summary = build_segment_summary(path)
+        summary['size'] = st.st_size
+        summary['mtime'] = st.st_mtime
+        write_segment_summary(path, summary)
+
+    summary['_bloom'] = BloomFilter.from_dict(summary['bloom'])
+    with _segment_summaries_lock:
+        _segment_summaries[path] = (st.st_size, st.st_mtime, summary)
+    return summary
+
+_summary_builder = None
+_summary_queue = []  # Segments waiting for the background builder, oldest request first
+
+def build_segment_summaries_in_background(paths):
+    """Queue segments for summary building on a background thread (started unless one is running)"""
+    global _summary_builder
+    with _segment_summaries_lock:
+        _summary_queue.extend(path for path in paths if path not in _summary_queue)
+        if _summary_builder is not None:
+            return
+        _summary_builder = threading.Thread(target=_build_queued_summaries, name='segment-summaries', daemon=True)
+        _summary_builder.start()
+
+def _build_queued_summaries():
+    global _summary_builder
+    while True:
+        with _segment_summaries_lock:
+            if not _summary_queue:
+                # Cleared under the lock, so a segment queued from now on starts a new builder
+                _summary_builder = None
+                return
+            path = _summary_queue[0]
+        try:
+            with metrics.timed('segment_summary'):
+                get_segment_summary(path)
+        except Exception as e:
+            # Lookups keep reading the segment directly; it is queued again on the next one
+            print(f"Could not summarize log segment {path}: {e}")
+        finally:
+            with _segment_summaries_lock:
+                _summary_queue.remove(path)
+
+def segment_may_match(summary, normalized_mac, since=None, until=None):
+    """False when the sidecar proves the segment has nothing for this MAC/time window"""
+    if normalized_mac not in summary['_bloom']:
+        return False
+    first = parse_log_time(summary.get('first_timestamp'))
+    last = parse_log_time(summary.get('last_timestamp'))
+    if since and last and last < since:
+        return False
+    if until and first and first > until:
+        return False
+    return True
+
+def time_left(deadline):
+    """Seconds until a time.monotonic() deadline (None: no limit); TimeoutError once it has passed"""
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"Log lookup exceeded {REQUEST_DEADLINE_SECONDS:g}s")
+    return remaining
+
+def lines_before(lines, deadline):
+    """Pass lines through, raising TimeoutError once the deadline passes (checked every DEADLINE_CHECK_LINES)"""
+    if deadline is None:
+        yield from lines
+        return
+    for n, line in enumerate(lines):
+        if n % DEADLINE_CHECK_LINES == 0:
+            time_left(deadline)
+        yield line
+
+def iter_reverse_matches(path, normalized_search_mac, keep_raw=False, deadline=None):
+    """Yield parsed logs for a MAC from an uncompressed file, newest first"""
+    return match_mac_lines(lines_before(read_lines_reverse(path), deadline), normalized_search_mac, keep_raw)
+
+def iter_scanned_matches(path, normalized_search_mac, keep_raw=False, deadline=None):
+    """Yield parsed logs for a MAC from an uncompressed file via a full (parallel) scan, newest first"""
+    with metrics.timed('scan'):
+        offsets = parallel_scan.scan_offsets(
+            path, [normalized_search_mac], timeout=time_left(deadline)
+        )[normalized_search_mac]
+    metrics.add('bytes_read', os.path.getsize(path))
+    for end in range(len(offsets), 0, -MAX_LOGS_PER_DEVICE):
+        page = offsets[max(0, end - MAX_LOGS_PER_DEVICE):end][::-1]
+        yield from parse_lines(log_index.read_lines(page, path), keep_raw)
+
+def index_is_cold():
+    """True when the offset index is too far behind LOG_FILE to wait for; it then catches up in the background"""
+    if log_index.pending_bytes() < COLD_INDEX_BYTES:
+        return False
+    log_index.refresh_in_background()
+    return True
+
+def iter_indexed_matches(normalized_search_mac, keep_raw=False, deadline=None):
+    """Yield parsed logs for a MAC from LOG_FILE via the offset index, newest first"""
+    offsets = []
+    for offset in log_index.iter_offsets(normalized_search_mac):
+        offsets.append(offset)
+        if len(offsets) >= MAX_LOGS_PER_DEVICE:
+            time_left(deadline)
+            yield from parse_lines(log_index.read_lines(offsets), keep_raw)
+            offsets = []
+    yield from parse_lines(log_index.read_lines(offsets), keep_raw)
+
+def in_time_window(parsed, since, until):
+    """Returns (keep, older_than_window) for a parsed log"""
+    if not since and not until:
+        return True, False
+    ts = parse_log_time(parsed.timestamp)
+    if ts is None:
+        return True, False
+    if since and ts < since:
+        return False, True
+    if until and ts > until:
+        return False, False
+    return True, False
+
+def device_logs_all_segments(normalized_search_mac, limit=MAX_LOGS_PER_DEVICE, since=None, until=None,
+                             keep_raw=False, deadline=None):
+    """
+    Newest `limit` logs for a MAC across LOG_FILE and its rotated/compressed
+    siblings, read newest first and stopping as soon as the limit is reached.
+    Rotated segments whose sidecar summary rules out the MAC or time window are
+    skipped without being read. Returns (logs newest first, segments read, segments skipped).
+    Raises TimeoutError once `deadline` (time.monotonic()) has passed.
+    """
+    logs = []
+    segments_read = 0
+    segments_skipped = 0
+
+    # Live file: seek straight to matches via the offset index; scan the whole file in parallel
+    # while the index is cold (first query on a large log) or unavailable
+    live_matches = None
+    if os.path.exists(LOG_FILE):
+        try:
+            if index_is_cold():
+                live_matches = iter_scanned_matches(LOG_FILE, normalized_search_mac, keep_raw, deadline)
+            else:
+                with metrics.timed('index'):
+                    log_index.refresh(deadline)
+                live_matches = iter_indexed_matches(normalized_search_mac, keep_raw, deadline)
+        except TimeoutError:
+            raise
+        except (sqlite3.Error, OSError) as e:
+            print(f"Log index unavailable, scanning full file: {e}")
+            live_matches = iter_scanned_matches(LOG_FILE, normalized_search_mac, keep_raw, deadline)
+        segments_read += 1
+
+        for parsed in live_matches:
+            keep, older = in_time_window(parsed, since, until)
+            if older:
+                # Everything after this (and every rotated segment) is older still
+                return logs, segments_read, segments_skipped
+            if keep:
+                logs.append(parsed)
+                if len(logs) >= limit:
+                    return logs, segments_read, segments_skipped
+
+    for segment in list_rotated_segments():
+        try:
+            # Right after a rotation the summary isn't built yet; read the segment (under the deadline) instead
+            summary = get_segment_summary(segment, build=False)
+        except (OSError, EOFError, gzip.BadGzipFile) as e:
+            print(f"Skipping unreadable log segment {segment}: {e}")
+            continue
+        if summary is not None and not segment_may_match(summary, normalized_search_mac, since, until):
+            segments_skipped += 1
+            continue
+        segments_read += 1
+
+        remaining = limit - len(logs)
+        if segment.endswith('.gz'):
+            # Compressed segments can only be read forward; keep the newest matches in a bounded deque
+            newest = deque(maxlen=remaining)
+            with open_segment(segment) as f:
+                for parsed in match_mac_lines(lines_before(f, deadline), normalized_search_mac, keep_raw):
+                    if in_time_window(parsed, since, until)[0]:
+                        newest.append(parsed)
+            metrics.add('bytes_read', os.path.getsize(segment))
+            matches = reversed(newest)
+        elif os.path.getsize(segment) >= parallel_scan.PARALLEL_SCAN_MIN_BYTES:
+            matches = iter_scanned_matches(segment, normalized_search_mac, keep_raw, deadline)
+        else:
+            matches = iter_reverse_matches(segment, normalized_search_mac, keep_raw, deadline)
+
+        for parsed in matches:
+            keep, older = in_time_window(parsed, since, until)
+            if older:
+                return logs, segments_read, segments_skipped
+            if keep:
+                logs.append(parsed)
+                if len(logs) >= limit:
+                    return logs, segments_read, segments_skipped
+
+    return logs, segments_read, segments_skipped
+
+class LogFollower:
+    """
+    Single background thread that follows LOG_FILE like `tail -F` and fans new
+    lines out to subscribers keyed by normalized MAC. Each line is parsed at most
+    once no matter how many streams are open. Rotation is detected by inode
+    change, truncation by the file shrinking below our read position.
+    """
+
+    def __init__(self, log_path, poll_interval=FOLLOW_POLL_INTERVAL):
+        self.log_path = log_path
+        self.poll_interval = poll_interval
+        self._subscribers = {}  # normalized MAC -> set of queues
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def subscribe(self, normalized_mac):
+        """Register a queue that receives parsed logs for this MAC; starts the follower if needed"""
+        q = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        with self._lock:
+            if self._stopped.is_set():
+                q.put(None)
+                return q
+            self._subscribers.setdefault(normalized_mac, set()).add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='log-follower', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, normalized_mac, q):
+        with self._lock:
+            queues = self._subscribers.get(normalized_mac)
+            if queues:
+                queues.discard(q)
+                if not queues:
+                    del self._subscribers[normalized_mac]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def stop(self):
+        """Stop following and end every open stream (each subscriber queue receives None)"""
+        with self._lock:
+            self._stopped.set()
+            queues = [q for queues in self._subscribers.values() for q in queues]
+        for q in queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                # Make room - the stream is ending anyway
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+
+    def _dispatch(self, raw_line):
+        with self._lock:
+            if not self._subscribers:
+                return
+            targets = []
+            for match in MAC_FIELD_RE.finditer(raw_line):
+                mac = normalize_mac((match.group(1) or match.group(2)).decode('ascii', 'ignore'))
+                if mac in self._subscribers and mac not in targets:
+                    targets.append(mac)
+            queues = [q for mac in targets for q in self._subscribers[mac]]
+        if not queues:
+            return
+
+        # Parsed once for every stream, so keep the raw line for those that asked for it
+        parsed = parse_log_line(raw_line.decode('utf-8', 'replace'), keep_raw=True)
+        if not parsed:
+            return
+        for q in queues:
+            try:
+                q.put_nowait(parsed)
+            except queue.Full:
+                pass  # Slow client - drop rather than block the follower
+
+    def _open(self, from_end):
+        f = open(self.log_path, 'rb')
+        if from_end:
+            f.seek(0, os.SEEK_END)
+        return f, os.fstat(f.fileno()).st_ino
+
+    def _drain(self, f, partial):
+        """Dispatch all complete lines available from f; returns the leftover partial line"""
+        while True:
+            chunk = f.read(REVERSE_READ_CHUNK_SIZE)
+            if not chunk:
+                return partial
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                if line.strip():
+                    self._dispatch(line)
+
+    def _run(self):
+        f = None
+        inode = None
+        partial = b''
+        while not self._stopped.is_set():
+            try:
+                if f is None:
+                    # Start at EOF the first time; a file that appears after rotation is read from the start
+                    f, inode = self._open(from_end=inode is None)
+                    partial = b''
+
+                partial = self._drain(f, partial)
+
+                st = os.stat(self.log_path)
+                if st.st_ino != inode:
+                    # Rotated: finish what was written to the old file, then switch
+                    partial = self._drain(f, partial)
+                    f.close()
+                    f = None
+                    continue
+                if st.st_size < f.tell():
+                    # Truncated in place
+                    f.seek(0)
+                    partial = b''
+            except FileNotFoundError:
+                # Between rotation and creation of the new file
+                if f is not None:
+                    f.close()
+                    f = None
+            except Exception as e:
+                print(f"Log follower error: {e}")
+            self._stopped.wait(self.poll_interval)
+        if f is not None:
+            f.close()
+
+log_follower = LogFollower(LOG_FILE)
+
+log_store = LogStore(LOG_STORE_DIR, LOG_FIELD_DEFAULTS)
+
+def _ingest_file(path, offset, max_bytes=None):
+    """
+    Append complete lines of `path` from `offset` into the log store, stopping
+    after about max_bytes. Returns (new offset, lines ingested, reached the end).
+    """
+    lines = 0
+    end = None if max_bytes is None else offset + max_bytes
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw_line in f:
+            # Leave a partially written last line for the next ingest
+            if not raw_line.endswith(b'\n'):
+                break
+            if end is not None and offset >= end:
+                return offset, lines, False
+            offset += len(raw_line)
+            parsed = parse_log_line(raw_line.decode('utf-8', 'replace'))
+            if not parsed:
+                continue
+            ts = parse_log_time(parsed.timestamp)
+            log_store.append(parsed, ts.timestamp() if ts else None)
+            lines += 1
+    return offset, lines, True
+
+def ingest_log_store(max_bytes=None):
+    """
+    Incrementally ingest lines appended to LOG_FILE since the last run, at most
+    about max_bytes of them (default: all). Returns (lines ingested, caught up).
+    """
+    with log_store.exclusive():
+        st = os.stat(LOG_FILE)
+        source = log_store.source_state
+        offset = source.get('offset', 0)
+        lines = 0
+
+        if source.get('inode') != st.st_ino:
+            # Rotated: finish the previous file if it's still around uncompressed, then start the new one
+            if source.get('inode') is not None:
+                for segment in list_rotated_segments():
+                    if not segment.endswith('.gz') and os.stat(segment).st_ino == source['inode']:
+                        start = offset
+                        offset, lines, done = _ingest_file(segment, offset, max_bytes)
+                        if not done:
+                            log_store.flush({'inode': source['inode'], 'offset': offset})
+                            return lines, False
+                        if max_bytes is not None:
+                            max_bytes = max(0, max_bytes - (offset - start))
+                        break
+            offset = 0
+        elif st.st_size < offset:
+            # Truncated in place
+            offset = 0
+
+        offset, new_lines, done = _ingest_file(LOG_FILE, offset, max_bytes)
+        log_store.flush({'inode': st.st_ino, 'offset': offset})
+        return lines + new_lines, done
+
+_store_ingester = None
+_store_ingester_lock = threading.Lock()
+
+def ingest_log_store_in_background():
+    """Catch the log store up on a background thread unless one is already running"""
+    global _store_ingester
+    with _store_ingester_lock:
+        if _store_ingester is not None and _store_ingester.is_alive():
+            return
+        _store_ingester = threading.Thread(target=_background_ingest, name='log-store-ingest', daemon=True)
+        _store_ingester.start()
+
+def _background_ingest():
+    # One step at a time, so queries (which read under the store lock) interleave with the catch-up
+    try:
+        done = False
+        while not done:
+            with metrics.timed('ingest'):
+                _, done = ingest_log_store(LOG_STORE_INGEST_BYTES)
+    except (OSError, ValueError) as e:
+        print(f"Background log store ingest failed: {e}")
+
+def indexed_batch_logs(normalized_macs, limit, keep_raw=False, deadline=None):
+    """Newest `limit` logs plus totals for several MACs from one index refresh. Returns {mac: (total, logs)}."""
+    with metrics.timed('index'):
+        log_index.refresh(deadline)
+    lookups = log_index.newest_offsets_many(normalized_macs, limit)
+
+    results = {}
+    for mac, (total, offsets) in lookups.items():
+        results[mac] = (total, parse_lines(log_index.read_lines(offsets), keep_raw))
+    return results
+
+def scan_batch_logs(normalized_macs, limit, keep_raw=False, deadline=None, path=None):
+    """
+    One (parallel) scan of LOG_FILE (or an uncompressed rotated segment) for several MACs, used while
+    the index is cold or unavailable. Returns {mac: (total, logs)}.
+    """
+    path = path or LOG_FILE
+    with metrics.timed('scan'):
+        offsets = parallel_scan.scan_offsets(path, normalized_macs, timeout=time_left(deadline))
+    metrics.add('bytes_read', os.path.getsize(path))
+
+    results = {}
+    for mac, mac_offsets in offsets.items():
+        newest = mac_offsets[::-1][:limit]
+        results[mac] = (len(mac_offsets), parse_lines(log_index.read_lines(newest, path), keep_raw))
+    return results
+
+def compressed_batch_logs(segment, normalized_macs, limit, keep_raw=False, deadline=None):
+    """One forward pass over a .gz segment for several MACs. Returns {mac: (total, logs newest first)}."""
+    wanted = set(normalized_macs)
+    totals = dict.fromkeys(wanted, 0)
+    newest = {mac: deque(maxlen=limit) for mac in wanted}
+    with open_segment(segment) as f:
+        for raw_line in lines_before(f, deadline):
+            found = wanted.intersection(parallel_scan.line_macs(raw_line))
+            if not found:
+                continue
+            parsed = parse_log_line(raw_line.decode('utf-8', 'replace'), keep_raw)
+            if parsed is None:
+                continue
+            for mac in found:
+                totals[mac] += 1
+                newest[mac].append(parsed)
+    metrics.add('bytes_read', os.path.getsize(segment))
+    return {mac: (totals[mac], list(reversed(newest[mac]))) for mac in wanted}
+
+def rotated_batch_logs(results, limit, keep_raw=False, deadline=None):
+    """
+    Top up batch results ({mac: (total, logs newest first)}) from the rotated segments, newest first,
+    like device_logs_all_segments: each segment is read once for the MACs still short of `limit`,
+    and skipped when its summary rules all of them out.
+    """
+    for segment in list_rotated_segments():
+        short = [mac for mac, (_, logs) in results.items() if len(logs) < limit]
+        if not short:
+            break
+        try:
+            summary = get_segment_summary(segment, build=False)
+        except (OSError, EOFError, gzip.BadGzipFile) as e:
+            print(f"Skipping unreadable log segment {segment}: {e}")
+            continue
+        if summary is not None:
+            short = [mac for mac in short if segment_may_match(summary, mac)]
+        if not short:
+            continue
+
+        if segment.endswith('.gz'):
+            found = compressed_batch_logs(segment, short, limit, keep_raw, deadline)
+        else:
+            found = scan_batch_logs(short, limit, keep_raw, deadline, segment)
+        for mac, (total, logs) in found.items():
+            previous_total, previous_logs = results[mac]
+            results[mac] = (previous_total + total, previous_logs + logs[:limit - len(previous_logs)])
+    return results
+
+class ResultCache:
+    """
+    Bounded TTL + LRU cache with single-flight coalescing: concurrent requests for
+    the same key wait for one in-flight computation instead of each running it.
+    An optional `version` (e.g. the log file's size/mtime) invalidates entries
+    computed against different input.
+    """
+
+    def __init__(self, ttl, max_entries=RESULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, version, value)
+        self._inflight = {}  # (key, version) -> [event, value, error]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_compute(self, key, compute, version=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic() and entry[1] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+
+            flight = self._inflight.get((key, version))
+            leader = flight is None
+            if leader:
+                flight = [threading.Event(), None, None]
+                self._inflight[(key, version)] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight[0].wait()
+            if flight[2] is not None:
+                raise flight[2]
+            return flight[1]
+
+        try:
+            value = compute()
+            flight[1] = value
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, version, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        except Exception as e:
+            # Errors are shared with waiters but never cached
+            flight[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[(key, version)]
+            flight[0].set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced
+            }
+
+ping_cache = ResultCache(PING_CACHE_TTL)
+device_logs_cache = ResultCache(LOG_CACHE_TTL)
+tail_logs_cache = ResultCache(LOG_CACHE_TTL)
+
+def log_file_version():
+    """Identity of LOG_FILE's current contents; cached log results are only reused while it matches"""
+    st = os.stat(LOG_FILE)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+def log_segments_version():
+    """
+    Identity of LOG_FILE plus every rotated segment. Rotation, compression
+    (.N -> .N.gz) and pruning change it even while LOG_FILE itself is untouched.
+    """
+    live = log_file_version() if os.path.exists(LOG_FILE) else None
+    segments = []
+    for segment in list_rotated_segments():
+        try:
+            st = os.stat(segment)
+        except OSError:
+            continue  # Removed since it was listed; the next request sees the new list
+        segments.append((os.path.basename(segment), st.st_ino, st.st_size, st.st_mtime_ns))
+    return (live, tuple(segments))
+
 @app.route('/api/logs/<mac_address>', methods=['GET'])
 def get_device_logs(mac_address):
-    """Get logs for a specific MAC address"""
+    """
+    Get logs for a specific MAC address across the live log and its rotated segments.
+    Optional query params: since, until (ISO 8601), shape (records|columnar), raw=1 to include raw lines
+    """
     try:
-        if not os.path.exists(LOG_FILE):
+        if not os.path.exists(LOG_FILE) and not list_rotated_segments():
             return jsonify({
                 'error': f'Log file not found: {LOG_FILE}',
                 'logs': []
             }), 404
         
-        normalized_search_mac = normalize_mac(mac_address)
-        matching_logs = deque(maxlen=MAX_LOGS_PER_DEVICE)  # Keep only last N logs
+        since = until = None
+        for param in ('since', 'until'):
+            value = request.args.get(param)
+            if value:
+                parsed_time = parse_log_time(value)
+                if parsed_time is None:
+                    return jsonify({'error': f'Invalid {param} timestamp: {value}', 'logs': []}), 400
+                if param == 'since':
+                    since = parsed_time
+                else:
+                    until = parsed_time
         
-        # Read log file (could optimize with tail for large files)
-        with open(LOG_FILE, 'r') as f:
-            for line in f:
-                parsed = parse_log_line(line)
-                if not parsed:
-                    continue
-                
-                # Check if this log involves the requested MAC
-                src_mac_normalized = normalize_mac(parsed['src_mac'])
-                dst_mac_normalized = normalize_mac(parsed['dst_mac'])
-                
-                if normalized_search_mac in [src_mac_normalized, dst_mac_normalized]:
-                    matching_logs.append(parsed)
+        try:
+            shape, include_raw = log_output_options(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'logs': []}), 400
         
-        # Return newest first
-        logs = list(reversed(matching_logs))
+        normalized_search_mac = normalize_mac(mac_address)
+        version = log_segments_version()
+        logs, segments_read, segments_skipped = device_logs_cache.get_or_compute(
+            (normalized_search_mac, since, until, include_raw),
+            lambda: device_logs_all_segments(normalized_search_mac, MAX_LOGS_PER_DEVICE, since, until, include_raw,
+                                             time.monotonic() + REQUEST_DEADLINE_SECONDS),
+            version
+        )
         
+        metrics.add('matches_returned', len(logs))
         return jsonify({
             'mac_address': mac_address,
             'count': len(logs),
-            'logs': logs
+            'segments_read': segments_read,
+            'segments_skipped': segments_skipped,
+            'logs': shape_logs(logs, shape, include_raw)
         })
     
+    except TimeoutError as e:
+        # Cold index on a huge log, or many rotated segments to read; the index keeps catching up
+        return jsonify({'error': f'{e}, retry shortly', 'logs': []}), 504
     except Exception as e:
         return jsonify({
             'error': str(e),
             'logs': []
         }), 500
 
+@app.route('/api/logs/batch', methods=['POST'])
+def get_batch_logs():
+    """
+    Get recent logs and totals for many MACs at once, across the live log and its rotated segments
+    (the same logs as /api/logs/<mac>). `total` counts matches in the live log and in every rotated
+    segment that had to be read to fill `limit`.
+    Body: {"macs": ["AA:BB:...", ...], "limit": 10}
+    Optional: "shape": "records" | "columnar", "raw": true to include raw lines
+    """
+    try:
+        if not os.path.exists(LOG_FILE) and not list_rotated_segments():
+            return jsonify({'error': f'Log file not found: {LOG_FILE}', 'devices': {}}), 404
+        
+        body = request.get_json(silent=True) or {}
+        macs = body.get('macs')
+        if not isinstance(macs, list) or not all(isinstance(mac, str) for mac in macs):
+            return jsonify({'error': '"macs" must be a list of MAC address strings', 'devices': {}}), 400
+        if len(macs) > MAX_BATCH_MACS:
+            return jsonify({'error': f'Too many MACs (max {MAX_BATCH_MACS})', 'devices': {}}), 400
+        
+        try:
+            limit = int(body.get('limit', MAX_LOGS_PER_DEVICE))
+        except (TypeError, ValueError):
+            return jsonify({'error': '"limit" must be an integer', 'devices': {}}), 400
+        limit = max(0, min(limit, MAX_LOGS_PER_DEVICE))
+        
+        try:
+            shape, include_raw = log_output_options(body)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'devices': {}}), 400
+        
+        normalized_macs = sorted({normalize_mac(mac) for mac in macs})
+        
+        # One index lookup (or one file pass) for every requested MAC, then one pass per rotated
+        # segment still needed
+        deadline = time.monotonic() + REQUEST_DEADLINE_SECONDS
+        results = {mac: (0, []) for mac in normalized_macs}
+        if os.path.exists(LOG_FILE):
+            try:
+                if index_is_cold():
+                    results = scan_batch_logs(normalized_macs, limit, include_raw, deadline)
+                else:
+                    results = indexed_batch_logs(normalized_macs, limit, include_raw, deadline)
+            except TimeoutError:
+                raise
+            except (sqlite3.Error, OSError) as e:
+                print(f"Log index unavailable, scanning full file: {e}")
+                results = scan_batch_logs(normalized_macs, limit, include_raw, deadline)
+        rotated_batch_logs(results, limit, include_raw, deadline)
+        
+        devices = {}
+        for mac in macs:
+            total, logs = results[normalize_mac(mac)]
+            devices[mac] = {
+                'total': total,
+                'count': len(logs),
+                'logs': shape_logs(logs, shape, include_raw)
+            }
+            metrics.add('matches_returned', len(logs))
+        
+        return jsonify({
+            'count': len(devices),
+            'limit': limit,
+            'devices': devices
+        })
+    
+    except TimeoutError as e:
+        return jsonify({'error': f'{e}, retry shortly', 'devices': {}}), 504
+    except Exception as e:
+        return jsonify({'error': str(e), 'devices': {}}), 500
+
+@app.route('/api/logs/query', methods=['GET'])
+def query_logs():
+    """
+    Query the columnar log store.
+    Query params:
+        since, until   ISO 8601 time window
+        mac            match src_mac or dst_mac (any format)
+        <field>=value  exact match on any parsed field, e.g. severity, protocol, dst_port, log_subtype
+        group_by       field to count matches by (e.g. src_country), with top=N groups
+        limit          max records returned, newest first
+        shape          records (default) or columnar; raw lines are not kept in the store
+    """
+    try:
+        if not os.path.exists(LOG_FILE):
+            return jsonify({'error': f'Log file not found: {LOG_FILE}', 'logs': []}), 404
+        
+        since = until = None
+        for param in ('since', 'until'):
+            value = request.args.get(param)
+            if value:
+                parsed_time = parse_log_time(value)
+                if parsed_time is None:
+                    return jsonify({'error': f'Invalid {param} timestamp: {value}', 'logs': []}), 400
+                if param == 'since':
+                    since = parsed_time.timestamp()
+                else:
+                    until = parsed_time.timestamp()
+        
+        try:
+            limit = max(0, min(int(request.args.get('limit', MAX_LOGS_PER_DEVICE)), MAX_QUERY_LIMIT))
+            top = max(1, int(request.args.get('top', 10)))
+        except ValueError:
+            return jsonify({'error': 'limit and top must be integers', 'logs': []}), 400
+        
+        try:
+            shape, _ = log_output_options(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'logs': []}), 400
+        
+        group_by = request.args.get('group_by')
+        if group_by and (group_by not in LOG_FIELD_DEFAULTS or group_by == 'timestamp'):
+            return jsonify({'error': f'Cannot group by: {group_by}', 'logs': []}), 400
+        
+        where = {}
+        for field in LOG_FIELD_DEFAULTS:
+            if field == 'timestamp' or field not in request.args:
+                continue
+            value = request.args[field]
+            if field in ('src_port', 'dst_port'):
+                if not value.isdigit():
+                    return jsonify({'error': f'{field} must be a number', 'logs': []}), 400
+                where[field] = lambda v, target=int(value): v == target
+            elif field in ('src_mac', 'dst_mac'):
+                where[field] = lambda v, target=normalize_mac(value): normalize_mac(v) == target
+            else:
+                where[field] = lambda v, target=value: v == target
+        
+        where_any = None
+        if request.args.get('mac'):
+            target_mac = normalize_mac(request.args['mac'])
+            where_any = (('src_mac', 'dst_mac'), lambda v: normalize_mac(v) == target_mac)
+        
+        # Ingest at most one step inline; a large backlog (e.g. the first query against a
+        # multi-GB log) is caught up in the background and reported as ingest_pending
+        with metrics.timed('ingest'):
+            _, caught_up = ingest_log_store(LOG_STORE_INGEST_BYTES)
+        if not caught_up:
+            ingest_log_store_in_background()
+        result = log_store.query(
+            since=since, until=until, where=where, where_any=where_any,
+            limit=limit, group_by=group_by, top=top,
+            deadline=time.monotonic() + REQUEST_DEADLINE_SECONDS
+        )
+        
+        records = result['records']
+        if shape == 'columnar':
+            # Store records are dicts in log_store.fields order
+            records = {'fields': list(log_store.fields), 'rows': [list(record.values()) for record in records]}
+        
+        metrics.add('matches_returned', len(result['records']))
+        response = {
+            'count': len(result['records']),
+            'total': result['total'],
+            'chunks_scanned': result['chunks_scanned'],
+            'chunks_skipped': result['chunks_skipped'],
+            'ingest_pending': not caught_up,
+            'truncated': result['truncated'],
+            'logs': records
+        }
+        if group_by:
+            response['group_by'] = group_by
+            response['groups'] = result['groups']
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({'error': str(e), 'logs': []}), 500
+
+@app.route('/api/logs/stream/<mac_address>', methods=['GET'])
+def stream_device_logs(mac_address):
+    """Stream new logs for a device as Server-Sent Events (raw=1 to include raw lines)"""
+    normalized_search_mac = normalize_mac(mac_address)
+    _, include_raw = log_output_options({'raw': request.args.get('raw', False)})
+    q = log_follower.subscribe(normalized_search_mac)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    parsed = q.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if parsed is None:
+                    # Server shutting down; the client reconnects to another worker after `retry`
+                    return
+                yield f"event: log\ndata: {json.dumps(parsed.to_dict(include_raw))}\n\n"
+        finally:
+            # Client disconnected
+            log_follower.unsubscribe(normalized_search_mac, q)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Don't let nginx buffer the stream
+        }
+    )
+
 @app.route('/api/logs/tail/<mac_address>', methods=['GET'])
 def get_device_logs_tail(mac_address):
-    """Get recent logs for a device (last 50 lines approach for performance)"""
+    """
+    Get the newest logs for a device by reading the log file backward (bounded by byte/time budget).
+    Optional query params: shape (records|columnar), raw=1 to include raw lines
+    """
     try:
         if not os.path.exists(LOG_FILE):
             return jsonify({'error': 'Log file not found', 'logs': []}), 404
         
-        # Use tail command for better performance on large files
-        import subprocess
-        result = subprocess.run(
-            ['tail', '-n', '500', LOG_FILE],
-            capture_output=True,
-            text=True
-        )
+        try:
+            shape, include_raw = log_output_options(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'logs': []}), 400
         
+        # Read backward from EOF in-process until we have enough matches
+        # or the byte/time budget runs out
         normalized_search_mac = normalize_mac(mac_address)
-        matching_logs = []
-        
-        for line in result.stdout.split('\n'):
-            if not line.strip():
-                continue
-            
-            parsed = parse_log_line(line)
-            if not parsed:
-                continue
-            
-            src_mac_normalized = normalize_mac(parsed['src_mac'])
-            dst_mac_normalized = normalize_mac(parsed['dst_mac'])
-            
-            if normalized_search_mac in [src_mac_normalized, dst_mac_normalized]:
-                matching_logs.append(parsed)
-        
-        # Return newest first, limit to MAX_LOGS_PER_DEVICE
-        logs = list(reversed(matching_logs[-MAX_LOGS_PER_DEVICE:]))
+        logs, bytes_scanned, budget_exhausted = tail_logs_cache.get_or_compute(
+            (normalized_search_mac, include_raw),
+            lambda: tail_device_logs(normalized_search_mac, keep_raw=include_raw),
+            log_file_version()
+        )
         
+        metrics.add('matches_returned', len(logs))
         return jsonify({
             'mac_address': mac_address,
             'count': len(logs),
-            'logs': logs
+            'bytes_scanned': bytes_scanned,
+            'budget_exhausted': budget_exhausted,
+            'logs': shape_logs(logs, shape, include_raw)
         })
     
     except Exception as e:
         return jsonify({'error': str(e), 'logs': []}), 500
 
+@app.before_request
+def start_request_metrics():
+    view_args = request.view_args or {}
+    attrs = {key: view_args[key] for key in ('mac_address', 'ip_address') if key in view_args}
+    if request.query_string:
+        attrs['query'] = request.query_string.decode('utf-8', 'replace')
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.begin_request(route, request.method, attrs)
+
+@app.after_request
+def finish_request_metrics(response):
+    stats = metrics.current()
+    if stats is not None:
+        # Recorded when the body has been sent, so streamed responses are timed in full
+        response.call_on_close(lambda: metrics.end_request(stats, response.status_code))
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text-format metrics: per-route latency, log scan counters, stage timings, LOG_FILE state"""
+    extra = [
+        '# HELP firewall_api_log_file_exists Whether LOG_FILE exists',
+        '# TYPE firewall_api_log_file_exists gauge',
+        '# HELP firewall_api_log_file_size_bytes Current size of LOG_FILE',
+        '# TYPE firewall_api_log_file_size_bytes gauge',
+        '# HELP firewall_api_log_file_inode Inode of LOG_FILE (changes on rotation)',
+        '# TYPE firewall_api_log_file_inode gauge',
+    ]
+    try:
+        st = os.stat(LOG_FILE)
+        extra += [
+            'firewall_api_log_file_exists 1',
+            f'firewall_api_log_file_size_bytes {st.st_size}',
+            f'firewall_api_log_file_inode {st.st_ino}',
+        ]
+    except OSError:
+        extra.append('firewall_api_log_file_exists 0')
+    
+    caches = {'ping': ping_cache, 'device_logs': device_logs_cache, 'tail_logs': tail_logs_cache}
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('coalesced', 'counter'), ('entries', 'gauge')):
+        name = f'firewall_api_cache_{field}' + ('_total' if kind == 'counter' else '')
+        extra += [f'# HELP {name} Result cache {field}', f'# TYPE {name} {kind}']
+        for cache_name, cache in caches.items():
+            extra.append(f'{name}{{cache="{cache_name}"}} {cache.stats()[field]}')
+    
+    return Response(metrics.registry.render(extra), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
         'log_file': LOG_FILE,
-        'log_file_exists': os.path.exists(LOG_FILE)
+        'log_file_exists': os.path.exists(LOG_FILE),
+        'caches': {
+            'ping': ping_cache.stats(),
+            'device_logs': device_logs_cache.stats(),
+            'tail_logs': tail_logs_cache.stats()
+        }
     })
 
-@app.route('/api/ping/<ip_address>', methods=['GET'])
-def ping_device(ip_address):
-    """Ping a device and return results"""
+topology_hash_cache = ResultCache(ttl=3600, max_entries=4)
+
+def _is_fresh(sibling_path, source_mtime):
+    """A sibling artifact is usable only if it was written after the file it derives from"""
+    try:
+        return os.path.getmtime(sibling_path) >= source_mtime
+    except OSError:
+        return False
+
+def topology_content_hash():
+    """sha256 of TOPOLOGY_FILE, from its sidecar when fresh; otherwise hashed once per file version"""
+    st = os.stat(TOPOLOGY_FILE)
+    sidecar = TOPOLOGY_FILE + TOPOLOGY_HASH_SUFFIX
+    if _is_fresh(sidecar, st.st_mtime):
+        with open(sidecar) as f:
+            content_hash = f.read().strip()
+        if content_hash:
+            return content_hash
+
+    def compute():
+        digest = hashlib.sha256()
+        with open(TOPOLOGY_FILE, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    return topology_hash_cache.get_or_compute(TOPOLOGY_FILE, compute, (st.st_ino, st.st_size, st.st_mtime_ns))
+
+@app.route('/api/topology', methods=['GET'])
+def get_topology():
+    """
+    Serve the topology export with a strong content-hash ETag.
+    Unchanged snapshots get 304 Not Modified; changed ones are sent as the
+    pre-compressed .br/.gz sibling when the client accepts it.
+    """
     try:
-        import subprocess
-        import re
+        if not os.path.exists(TOPOLOGY_FILE):
+            return jsonify({'error': f'Topology file not found: {TOPOLOGY_FILE}'}), 404
         
-        # Run ping command (send 4 packets, timeout 2 seconds)
-        result = subprocess.run(
-            ['ping', '-c', '4', '-W', '2', ip_address],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
+        content_hash = topology_content_hash()
+        source_mtime = os.path.getmtime(TOPOLOGY_FILE)
+        
+        path, encoding = TOPOLOGY_FILE, None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in request.accept_encodings and _is_fresh(TOPOLOGY_FILE + suffix, source_mtime):
+                path, encoding = TOPOLOGY_FILE + suffix, candidate
+                break
         
-        success = result.returncode == 0
-        output = result.stdout
-        
-        # Parse ping statistics
-        stats = {
-            'success': success,
-            'ip': ip_address,
-            'packets_sent': 4,
-            'packets_received': 0,
-            'packet_loss': 100,
-            'min_ms': None,
-            'avg_ms': None,
-            'max_ms': None,
-            'output': output
+        # Each encoding is a distinct representation, so it gets its own strong ETag
+        etag = content_hash if encoding is None else f'{content_hash}-{encoding}'
+        headers = {
+            'ETag': f'"{etag}"',
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': 'no-cache'
         }
         
-        if success:
-            # Parse packets received: "4 packets transmitted, 4 received, 0% packet loss"
-            packets_match = re.search(r'(\d+) packets transmitted, (\d+) received, (\d+)% packet loss', output)
-            if packets_match:
-                stats['packets_sent'] = int(packets_match.group(1))
-                stats['packets_received'] = int(packets_match.group(2))
-                stats['packet_loss'] = int(packets_match.group(3))
-            
-            # Parse round-trip times: "rtt min/avg/max/mdev = 0.123/0.456/0.789/0.012 ms"
-            rtt_match = re.search(r'rtt min/avg/max/mdev = ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms', output)
-            if rtt_match:
-                stats['min_ms'] = float(rtt_match.group(1))
-                stats['avg_ms'] = float(rtt_match.group(2))
-                stats['max_ms'] = float(rtt_match.group(3))
-        
-        return jsonify(stats)
+        variants = (content_hash, f'{content_hash}-br', f'{content_hash}-gzip')
+        if any(request.if_none_match.contains(variant) for variant in variants):
+            return Response(status=304, headers=headers)
+        
+        response = send_file(path, mimetype='application/json', conditional=False, etag=False)
+        response.headers.update(headers)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
     
-    except subprocess.TimeoutExpired:
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+class TopologyNotifier:
+    """
+    Background thread that watches the directory of TOPOLOGY_FILE (inotify, see
+    topology_publisher.DirectoryWatcher) for a new .sha256 sidecar - written
+    last on every publish - and pushes the new content hash to subscribers.
+    """
+
+    def __init__(self, topology_path, wait_seconds=TOPOLOGY_WATCH_SECONDS):
+        self.topology_path = topology_path
+        self.wait_seconds = wait_seconds
+        self.version = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def current(self):
+        """{'version', 'published_at'} for the snapshot on disk, or None if there isn't one"""
+        try:
+            version = topology_content_hash()
+            published_at = os.path.getmtime(self.topology_path + TOPOLOGY_HASH_SUFFIX)
+        except FileNotFoundError:
+            return None
+        return {'version': version, 'published_at': datetime.fromtimestamp(published_at, timezone.utc).isoformat()}
+
+    def subscribe(self):
+        """Queue that receives the current version, then every new one (None when stopping)"""
+        q = queue.Queue(maxsize=TOPOLOGY_EVENTS_QUEUE_SIZE)
+        with self._lock:
+            if self._stopped.is_set():
+                q.put(None)
+                return q
+            self._subscribers.add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='topology-notifier', daemon=True)
+                self._thread.start()
+        current = self.current()
+        if current:
+            self._offer(q, current)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def stop(self):
+        """Stop watching and end every open stream"""
+        with self._lock:
+            self._stopped.set()
+            queues = list(self._subscribers)
+        for q in queues:
+            self._offer(q, None)
+
+    @staticmethod
+    def _offer(q, event):
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            # Slow client - an older version it hasn't read yet is superseded anyway
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+            q.put_nowait(event)
+
+    def _publish_if_changed(self):
+        current = self.current()
+        if current is None or current['version'] == self.version:
+            return
+        self.version = current['version']
+        with self._lock:
+            queues = list(self._subscribers)
+        for q in queues:
+            self._offer(q, current)
+
+    def _run(self):
+        watcher = DirectoryWatcher()
+        sidecar = os.path.basename(self.topology_path) + TOPOLOGY_HASH_SUFFIX
+        watching = False
+        current = self.current()
+        self.version = current['version'] if current else None
+        try:
+            while not self._stopped.is_set():
+                try:
+                    if not watching:
+                        watcher.add(os.path.dirname(self.topology_path) or '.')
+                        watching = True
+                        self._publish_if_changed()  # Published while we weren't watching yet
+                    events = watcher.wait(self.wait_seconds)
+                    if events is None or any(name == sidecar for _, name, _ in events):
+                        self._publish_if_changed()
+                except OSError as e:
+                    # Data directory missing (not deployed yet) - retry
+                    print(f"Topology notifier error: {e}")
+                    self._stopped.wait(self.wait_seconds * 10)
+                except Exception as e:
+                    print(f"Topology notifier error: {e}")
+                    self._stopped.wait(self.wait_seconds)
+        finally:
+            watcher.close()
+
+topology_notifier = TopologyNotifier(TOPOLOGY_FILE)
+
+@app.route('/api/topology/events', methods=['GET'])
+def topology_events():
+    """Server-Sent Events: the current topology version (content hash) on connect, then each newly published one"""
+    q = topology_notifier.subscribe()
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = q.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    # Server shutting down; the client reconnects to another worker after `retry`
+                    return
+                yield f"event: topology\nid: {event['version']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            topology_notifier.unsubscribe(q)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Don't let nginx buffer the stream
+        }
+    )
+
+topology_cluster_cache = ResultCache(ttl=3600, max_entries=2)
+
+def topology_cluster_index():
+    """Cluster index for TOPOLOGY_FILE: the writer's sidecar when it matches the snapshot, else built once per version"""
+    content_hash = topology_content_hash()
+
+    def compute():
+        try:
+            with open(TOPOLOGY_FILE + CLUSTER_SUFFIX, encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('source_hash') == content_hash:
+                return index
+        except (OSError, ValueError):
+            pass
+        # No (or stale) sidecar, e.g. a snapshot copied in by a script
+        with open(TOPOLOGY_FILE, encoding='utf-8') as f:
+            return build_cluster_index(json.load(f), content_hash)
+
+    return topology_cluster_cache.get_or_compute(TOPOLOGY_FILE, compute, content_hash)
+
+@app.route('/api/topology/clusters', methods=['GET'])
+def topology_clusters():
+    """
+    Collapsed topology: one node per cluster with aggregate counts, plus inter-cluster link counts.
+    Query params:
+        by    network (CIDR, default) or switch (upstream switch from connections.device_id)
+    """
+    try:
+        if not os.path.exists(TOPOLOGY_FILE):
+            return jsonify({'error': f'Topology file not found: {TOPOLOGY_FILE}', 'clusters': []}), 404
+        
+        by = request.args.get('by', 'network')
+        index = topology_cluster_index()
+        view = index['views'].get(by)
+        if view is None:
+            return jsonify({'error': f'Unknown clustering: {by} (use network or switch)', 'clusters': []}), 400
+        
+        clusters = [
+            {key: value for key, value in cluster.items() if key != 'members'}
+            for cluster in view['clusters'].values()
+        ]
         return jsonify({
-            'success': False,
-            'ip': ip_address,
-            'error': 'Ping timeout',
-            'packets_sent': 4,
-            'packets_received': 0,
-            'packet_loss': 100
+            'by': by,
+            'version': index['source_hash'],
+            'device_count': len(index['nodes']),
+            'cluster_count': len(clusters),
+            'clusters': clusters,
+            'links': view['links']
         })
     except Exception as e:
+        return jsonify({'error': str(e), 'clusters': []}), 500
+
+@app.route('/api/topology/clusters/<path:cluster_id>', methods=['GET'])
+def expand_topology_cluster(cluster_id):
+    """
+    Expand one cluster (e.g. net:192.168.1.0/24 or switch:1) into its member devices.
+    Query params:
+        offset, limit   page through large clusters
+    """
+    try:
+        if not os.path.exists(TOPOLOGY_FILE):
+            return jsonify({'error': f'Topology file not found: {TOPOLOGY_FILE}', 'devices': []}), 404
+        
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = max(0, min(int(request.args.get('limit', MAX_CLUSTER_PAGE)), MAX_CLUSTER_PAGE))
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers', 'devices': []}), 400
+        
+        index = topology_cluster_index()
+        by = 'switch' if cluster_id.startswith('switch:') else 'network'
+        cluster = index['views'][by]['clusters'].get(cluster_id)
+        if cluster is None:
+            return jsonify({'error': f'Unknown cluster: {cluster_id}', 'devices': []}), 404
+        
+        members = cluster['members'][offset:offset + limit]
+        nodes = index['nodes']
+        summary = {key: value for key, value in cluster.items() if key != 'members'}
         return jsonify({
-            'success': False,
-            'ip': ip_address,
-            'error': str(e),
-            'packets_sent': 0,
-            'packets_received': 0,
-            'packet_loss': 100
-        }), 500
+            'cluster': summary,
+            'offset': offset,
+            'count': len(members),
+            'total': cluster['device_count'],
+            'devices': [nodes[str(device_id)] for device_id in members]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'devices': []}), 500
+
+@app.route('/api/topology/neighborhood/<device>', methods=['GET'])
+def topology_neighborhood(device):
+    """
+    Devices within N hops of one device (by id or MAC), breadth first and bounded.
+    Query params:
+        hops    1-3 (default 1)
+        limit   max devices returned
+    """
+    try:
+        if not os.path.exists(TOPOLOGY_FILE):
+            return jsonify({'error': f'Topology file not found: {TOPOLOGY_FILE}', 'devices': []}), 404
+        
+        try:
+            hops = max(1, min(int(request.args.get('hops', 1)), MAX_NEIGHBORHOOD_HOPS))
+            limit = max(1, min(int(request.args.get('limit', MAX_NEIGHBORHOOD_NODES)), MAX_NEIGHBORHOOD_NODES))
+        except ValueError:
+            return jsonify({'error': 'hops and limit must be integers', 'devices': []}), 400
+        
+        index = topology_cluster_index()
+        nodes, adjacency = index['nodes'], index['adjacency']
+        center = device if device in nodes else index['macs'].get(normalize_mac(device))
+        if center is None:
+            return jsonify({'error': f'Unknown device: {device}', 'devices': []}), 404
+        
+        depth = {center: 0}
+        frontier = deque([center])
+        truncated = False
+        while frontier and not truncated:
+            current = frontier.popleft()
+            if depth[current] == hops:
+                continue
+            for peer in adjacency.get(current, ()):
+                if peer in depth:
+                    continue
+                if len(depth) >= limit:
+                    truncated = True
+                    break
+                depth[peer] = depth[current] + 1
+                frontier.append(peer)
+        
+        membership = {by: view['membership'] for by, view in index['views'].items()}
+        devices = [
+            dict(nodes[device_id], hop=hop, clusters={by: members[device_id] for by, members in membership.items()})
+            for device_id, hop in depth.items()
+        ]
+        edges = [
+            [device_id, peer]
+            for device_id in depth
+            for peer in adjacency.get(device_id, ())
+            if peer in depth and device_id < peer
+        ]
+        return jsonify({
+            'center': nodes[center],
+            'hops': hops,
+            'count': len(devices),
+            'truncated': truncated,
+            'devices': devices,
+            'edges': edges
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'devices': []}), 500
+
+scan_history = ScanHistory()  # Synced on a background thread; history routes answer from what is indexed so far
+
+@app.route('/api/history/scans', methods=['GET'])
+def history_scans():
+    """List indexed scans, oldest first"""
+    try:
+        scan_history.sync_in_background()
+        scans = scan_history.list_scans()
+        return jsonify({'count': len(scans), 'scans': scans, 'indexing': scan_history.syncing})
+    except Exception as e:
+        return jsonify({'error': str(e), 'scans': []}), 500
+
+@app.route('/api/history/topology', methods=['GET'])
+def history_topology():
+    """Topology as of a point in time: ?at=<ISO 8601> (latest scan at or before it)"""
+    try:
+        at = parse_time(request.args.get('at'))
+        if at is None:
+            return jsonify({'error': 'Query param "at" must be an ISO 8601 timestamp'}), 400
+        
+        scan_history.sync_in_background()
+        result = scan_history.topology_at(at)
+        if result is None:
+            return jsonify({'error': f'No scan at or before {request.args["at"]}', 'indexing': scan_history.syncing}), 404
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/mac/<mac_address>', methods=['GET'])
+def history_mac(mac_address):
+    """When a MAC first and last appeared, and the IPs it was seen with"""
+    try:
+        scan_history.sync_in_background()
+        return jsonify(scan_history.presence('mac', mac_address))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/ip/<ip_address>', methods=['GET'])
+def history_ip(ip_address):
+    """When an IP first and last appeared, and the MACs it was seen with"""
+    try:
+        scan_history.sync_in_background()
+        return jsonify(scan_history.presence('ip', ip_address))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/diff', methods=['GET'])
+def history_diff():
+    """Records added/removed/changed between two scans: ?from=<scan name>&to=<scan name>"""
+    try:
+        from_scan, to_scan = request.args.get('from'), request.args.get('to')
+        if not from_scan or not to_scan:
+            return jsonify({'error': 'Query params "from" and "to" (scan names) are required'}), 400
+        
+        scan_history.sync_in_background()
+        result = scan_history.diff(from_scan, to_scan)
+        if result is None:
+            return jsonify({'error': f'Unknown scan: {from_scan} or {to_scan}', 'indexing': scan_history.syncing}), 404
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+class TrafficFollower:
+    """
+    Background thread that keeps per-device traffic summaries (traffic_summary.py)
+    current. It reads only the complete lines appended to LOG_FILE since its last
+    offset - starting with the last TRAFFIC_BACKFILL_BYTES so the windows aren't
+    empty after a restart - and rematches devices whenever the topology export's
+    content hash changes. Rotation and truncation are handled like LogFollower.
+
+    Only one API process follows the log: the one holding an flock on
+    `lock_path`. It writes the full summary to `snapshot_path` after every poll,
+    and every worker (itself included) answers from that file, so all workers
+    return the same counts. The others wait for the lock and take over if the
+    leader exits.
+    """
+
+    def __init__(self, log_path, snapshot_path=TRAFFIC_SNAPSHOT_FILE, lock_path=TRAFFIC_LEADER_LOCK,
+                 poll_interval=TRAFFIC_POLL_INTERVAL, backfill_bytes=TRAFFIC_BACKFILL_BYTES):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.lock_path = lock_path
+        self.poll_interval = poll_interval
+        self.backfill_bytes = backfill_bytes
+        self.aggregator = TrafficAggregator()
+        self.topology_hash = None
+        self.offset = 0
+        self.is_leader = False
+        self.ready = threading.Event()  # Set once the backfill has been summarized (leader only)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock_file = None
+        self._snapshot = None
+        self._snapshot_id = None  # (inode, mtime_ns) of the snapshot file we hold
+
+    def start(self):
+        """Start the follower thread if it isn't running"""
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='traffic-follower', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _acquire_leadership(self):
+        """Take the leader lock without blocking; it is held until the process exits"""
+        f = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._lock_file = f
+        self.is_leader = True
+        return True
+
+    def _publish(self):
+        summary = self.aggregator.summary(top=MAX_TRAFFIC_TOP_PORTS)
+        summary.update({
+            'ready': self.ready.is_set(),
+            'topology_hash': self.topology_hash,
+            'log_offset': self.offset,
+        })
+        atomic_write_bytes(self.snapshot_path, json.dumps(summary, separators=(',', ':')).encode('utf-8'))
+
+    def snapshot(self, timeout=0.0):
+        """
+        The leader's latest published summary, or None if there is none. Waits up
+        to `timeout` seconds for a fresh one (younger than TRAFFIC_SNAPSHOT_MAX_AGE).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                st = os.stat(self.snapshot_path)
+                fresh = time.time() - st.st_mtime < TRAFFIC_SNAPSHOT_MAX_AGE
+                if fresh or time.monotonic() >= deadline:
+                    with self._lock:
+                        if self._snapshot_id != (st.st_ino, st.st_mtime_ns):
+                            with open(self.snapshot_path, encoding='utf-8') as f:
+                                self._snapshot = json.load(f)
+                            self._snapshot_id = (st.st_ino, st.st_mtime_ns)
+                        return dict(self._snapshot, ready=self._snapshot['ready'] and fresh)
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    return None
+            time.sleep(0.1)
+
+    def _refresh_topology(self):
+        try:
+            content_hash = topology_content_hash()
+        except FileNotFoundError:
+            return  # Keep matching against the last export until a new one is published
+        if content_hash == self.topology_hash:
+            return
+        with open(TOPOLOGY_FILE, encoding='utf-8') as f:
+            self.aggregator.set_devices(json.load(f))
+        self.topology_hash = content_hash
+
+    def _open(self, backfill):
+        f = open(self.log_path, 'rb')
+        if backfill:
+            size = os.fstat(f.fileno()).st_size
+            if size > self.backfill_bytes:
+                f.seek(size - self.backfill_bytes)
+                f.readline()  # Skip the partial first line
+        self.offset = f.tell()
+        return f, os.fstat(f.fileno()).st_ino
+
+    def _drain(self, f, partial):
+        """Summarize all complete lines available from f; returns the leftover partial line"""
+        with metrics.timed('traffic_summarize'):
+            while True:
+                chunk = f.read(REVERSE_READ_CHUNK_SIZE)
+                if not chunk:
+                    return partial
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()
+                for line in lines:
+                    parsed = parse_log_line(line.decode('utf-8', 'replace')) if line.strip() else None
+                    if parsed:
+                        ts = parse_log_time(parsed.timestamp)
+                        self.aggregator.add(parsed, ts.timestamp() if ts else None)
+                self.offset = f.tell() - len(partial)
+
+    def _run(self):
+        # Stand by until this process holds the leader lock
+        while not self._stopped.is_set():
+            try:
+                if self._acquire_leadership():
+                    break
+            except OSError as e:
+                print(f"Traffic follower error: {e}")
+            self._stopped.wait(self.poll_interval)
+
+        f = None
+        inode = None
+        partial = b''
+        while not self._stopped.is_set():
+            try:
+                self._refresh_topology()
+                if f is None:
+                    # Backfill the first time; a file that appears after rotation is read from the start
+                    f, inode = self._open(backfill=inode is None)
+                    partial = b''
+
+                partial = self._drain(f, partial)
+                self.aggregator.expire()
+                self.ready.set()
+
+                st = os.stat(self.log_path)
+                if st.st_ino != inode:
+                    # Rotated: finish what was written to the old file, then switch
+                    partial = self._drain(f, partial)
+                    f.close()
+                    f = None
+                    continue
+                if st.st_size < f.tell():
+                    # Truncated in place
+                    f.seek(0)
+                    self.offset = 0
+                    partial = b''
+                self._publish()
+            except FileNotFoundError:
+                # No log yet, or between rotation and creation of the new file
+                if f is not None:
+                    f.close()
+                    f = None
+                self.ready.set()
+                try:
+                    self._publish()
+                except Exception as e:
+                    print(f"Traffic follower error: {e}")
+            except Exception as e:
+                print(f"Traffic follower error: {e}")
+            self._stopped.wait(self.poll_interval)
+        if f is not None:
+            f.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self.is_leader = False
+
+traffic_follower = TrafficFollower(LOG_FILE)
+
+@app.route('/api/traffic/summary', methods=['GET'])
+def traffic_summary():
+    """
+    Rolling traffic counters for every topology node with recent firewall log activity,
+    keyed by graph node ID (device MAC, or dev-<id>).
+    Optional query params: window (comma-separated names, e.g. 5m,1h; default all), top (ports per window)
+    """
+    try:
+        windows = request.args.get('window')
+        windows = [name.strip() for name in windows.split(',')] if windows else None
+        known = [name for name, _ in traffic_follower.aggregator.windows]
+        if windows and any(name not in known for name in windows):
+            return jsonify({'error': f'"window" must be one of {", ".join(known)}', 'devices': {}}), 400
+        try:
+            top = min(int(request.args.get('top', TOP_PORTS)), MAX_TRAFFIC_TOP_PORTS)
+        except ValueError:
+            return jsonify({'error': '"top" must be an integer', 'devices': {}}), 400
+
+        # Every worker runs the thread, but only the leader follows the log; all answer from its snapshot
+        traffic_follower.start()
+        snapshot = traffic_follower.snapshot(TRAFFIC_READY_TIMEOUT)
+        if snapshot is None:
+            return jsonify({'error': 'Traffic summary is not available yet', 'ready': False, 'devices': {}}), 503
+
+        return jsonify(select_summary(snapshot, windows, max(top, 0)))
+    except Exception as e:
+        return jsonify({'error': str(e), 'devices': {}}), 500
+
+def parse_ping_output(ip_address, output, success):
+    """Parse `ping` output into packet and round-trip statistics"""
+    stats = {
+        'success': success,
+        'ip': ip_address,
+        'packets_sent': PING_COUNT,
+        'packets_received': 0,
+        'packet_loss': 100,
+        'min_ms': None,
+        'avg_ms': None,
+        'max_ms': None,
+        'output': output
+    }
+    
+    if success:
+        # Parse packets received: "4 packets transmitted, 4 received, 0% packet loss"
+        packets_match = re.search(r'(\d+) packets transmitted, (\d+) received, (\d+)% packet loss', output)
+        if packets_match:
+            stats['packets_sent'] = int(packets_match.group(1))
+            stats['packets_received'] = int(packets_match.group(2))
+            stats['packet_loss'] = int(packets_match.group(3))
+        
+        # Parse round-trip times: "rtt min/avg/max/mdev = 0.123/0.456/0.789/0.012 ms"
+        rtt_match = re.search(r'rtt min/avg/max/mdev = ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms', output)
+        if rtt_match:
+            stats['min_ms'] = float(rtt_match.group(1))
+            stats['avg_ms'] = float(rtt_match.group(2))
+            stats['max_ms'] = float(rtt_match.group(3))
+    
+    return stats
+
+def run_ping(ip_address, timeout=PING_TIMEOUT_SECONDS):
+    """Ping a host and return its statistics (raises subprocess.TimeoutExpired on timeout)"""
+    # Send PING_COUNT packets, wait up to 2 seconds for each reply
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            ['ping', '-c', str(PING_COUNT), '-W', '2', ip_address],
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+    finally:
+        metrics.add_time('ping_subprocess', time.perf_counter() - start)
+    return parse_ping_output(ip_address, result.stdout, result.returncode == 0)
+
+def ping_timeout_result(ip_address):
+    return {
+        'success': False,
+        'ip': ip_address,
+        'error': 'Ping timeout',
+        'packets_sent': PING_COUNT,
+        'packets_received': 0,
+        'packet_loss': 100
+    }
+
+def ping_error_result(ip_address, error):
+    return {
+        'success': False,
+        'ip': ip_address,
+        'error': str(error),
+        'packets_sent': 0,
+        'packets_received': 0,
+        'packet_loss': 100
+    }
+
+@app.route('/api/ping/<ip_address>', methods=['GET'])
+def ping_device(ip_address):
+    """Ping a device and return results"""
+    try:
+        # Operators looking at the same device share one recent/in-flight ping
+        return jsonify(ping_cache.get_or_compute((ip_address, PING_TIMEOUT_SECONDS), lambda: run_ping(ip_address)))
+    
+    except subprocess.TimeoutExpired:
+        return jsonify(ping_timeout_result(ip_address))
+    except Exception as e:
+        return jsonify(ping_error_result(ip_address, e)), 500
+
+# Shared by all batch requests, so concurrent sweeps can't exceed PING_MAX_CONCURRENCY pings per process
+ping_executor = ThreadPoolExecutor(max_workers=PING_MAX_CONCURRENCY, thread_name_prefix='ping')
+
+def topology_ips(topology_file=None):
+    """All device IPs from the current topology export"""
+    with open(topology_file or TOPOLOGY_FILE) as f:
+        data = json.load(f)
+    records = data.get('data', {}).get('devices', {}).get('records', [])
+    return [record['ip'] for record in records if record.get('ip')]
+
+def ping_batch_worker(ip_address, timeout):
+    try:
+        # A shorter timeout can turn a slow reply into a failure, so results are only shared per timeout
+        return ping_cache.get_or_compute((ip_address, timeout), lambda: run_ping(ip_address, timeout))
+    except subprocess.TimeoutExpired:
+        return ping_timeout_result(ip_address)
+    except Exception as e:
+        return ping_error_result(ip_address, e)
+
+@app.route('/api/ping/batch', methods=['POST'])
+def ping_batch():
+    """
+    Ping many devices concurrently, streaming one JSON result per line (NDJSON) as each completes.
+    Body: {"ips": ["192.168.1.1", ...]} or {"all": true} for every device IP in the topology export.
+    Optional: "timeout" per target in seconds (0 < timeout <= PING_TIMEOUT_SECONDS), "include_output": false
+    Entries that are not valid IP address strings are skipped and listed in the final "skipped".
+    """
+    body = request.get_json(silent=True) or {}
+    
+    if body.get('all'):
+        try:
+            ips = topology_ips()
+        except (OSError, ValueError) as e:
+            return jsonify({'error': f'Could not read topology data: {e}', 'results': []}), 500
+    else:
+        ips = body.get('ips')
+        if not isinstance(ips, list):
+            return jsonify({'error': '"ips" must be a list of IP address strings', 'results': []}), 400
+    # Bounded before any per-entry work, so an oversized body is rejected cheaply
+    if len(ips) > MAX_PING_BATCH:
+        return jsonify({'error': f'Too many targets (max {MAX_PING_BATCH})', 'results': []}), 400
+    
+    timeout = body.get('timeout', PING_TIMEOUT_SECONDS)
+    if (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not math.isfinite(timeout)
+            or not 0 < timeout <= PING_TIMEOUT_SECONDS):
+        return jsonify({'error': f'"timeout" must be a number of seconds in (0, {PING_TIMEOUT_SECONDS}]',
+                        'results': []}), 400
+    
+    # Validate before anything reaches the ping command line; one bad record doesn't fail the sweep
+    targets = []
+    skipped = []
+    for ip in ips:
+        try:
+            if not isinstance(ip, str):
+                raise ValueError(ip)
+            targets.append(str(ipaddress.ip_address(ip.strip())))
+        except ValueError:
+            skipped.append(ip if isinstance(ip, str) else repr(ip))
+    targets = list(dict.fromkeys(targets))
+    include_output = bool(body.get('include_output', False))
+    
+    worker = metrics.propagate(ping_batch_worker)
+    futures = [ping_executor.submit(worker, ip, timeout) for ip in targets]
+    
+    def generate():
+        reachable = 0
+        try:
+            for future in as_completed(futures):
+                stats = future.result()
+                if stats.get('success') and stats.get('packets_received', 0) > 0:
+                    reachable += 1
+                if not include_output:
+                    # Copy - the dict may be shared through ping_cache
+                    stats = {key: value for key, value in stats.items() if key != 'output'}
+                yield json.dumps(stats) + '\n'
+            yield json.dumps({'done': True, 'count': len(targets), 'reachable': reachable, 'skipped': skipped}) + '\n'
+        finally:
+            # Client went away - don't keep queued pings occupying the shared pool
+            for future in futures:
+                future.cancel()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def shutdown():
+    """Stop background work so the process can exit promptly (gunicorn.conf.py calls this per worker)"""
+    log_follower.stop()
+    topology_notifier.stop()
+    traffic_follower.stop()
+    parallel_scan.shutdown_pool()
+    # Queued sweep pings are abandoned; running ones end within PING_TIMEOUT_SECONDS
+    ping_executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == '__main__':
-    # Run on port 5000
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    parser = argparse.ArgumentParser(description='Firewall Log API Server')
+    parser.add_argument('--ingest', action='store_true',
+                        help='Ingest new log lines into the columnar store and exit')
+    parser.add_argument('--slow-log', default=SLOW_REQUEST_LOG,
+                        help='Append requests slower than --slow-ms to this JSON-lines file')
+    parser.add_argument('--slow-ms', type=float, default=SLOW_REQUEST_SECONDS * 1000,
+                        help='Slow request threshold in milliseconds')
+    args = parser.parse_args()
+    metrics.registry.slow_log_path = args.slow_log
+    metrics.registry.slow_threshold_seconds = args.slow_ms / 1000.0
+    
+    if args.ingest:
+        ingested, _ = ingest_log_store()
+        print(f"✓ Ingested {ingested:,} lines into {LOG_STORE_DIR} ({log_store.row_count():,} rows total)")
+    else:
+        # Development server on port 5000 (production runs under gunicorn: see gunicorn.conf.py)
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -0,0 +1,78 @@
+"""
+Gunicorn configuration for the Firewall Log API (production serving mode)
+
+    gunicorn -c gunicorn.conf.py firewall_log_api:app
+
+Several worker processes each run a pool of threads, so CPU-bound log scans
+(which hold the GIL) run in parallel across cores, while pings, file reads and
+SSE streams wait in threads without blocking other requests. Settings can be
+overridden from the environment (see setup_log_api.sh):
+
+    FIREWALL_API_BIND              Listen address (default 0.0.0.0:5000)
+    FIREWALL_API_WORKERS           Worker processes (default 2 x CPUs + 1)
+    FIREWALL_API_THREADS           Threads per worker; each open SSE stream holds one (default 8)
+    FIREWALL_API_TIMEOUT           Seconds a worker may miss its heartbeat before it is killed and restarted (default 60);
+                                   with gthread this is not a per-request limit - requests that can run long
+                                   (cold full-log scans, rotated segments) give up after REQUEST_DEADLINE_SECONDS
+    FIREWALL_API_GRACEFUL_TIMEOUT  Seconds in-flight requests get to finish on stop/reload (default 30)
+    FIREWALL_API_SLOW_LOG          JSON-lines slow request log (default off)
+    FIREWALL_API_SLOW_MS           Slow request threshold in milliseconds (default 1000)
+    FIREWALL_API_SCAN_WORKERS      Processes per worker for cold full-log scans, started on first use (default CPUs)
+    FIREWALL_API_SCAN_SLOTS        Log ranges scanned at once across all workers (default CPUs); scan processes
+                                   wait for a free slot, so concurrent cold scans share the cores
+
+Every worker keeps its own result caches, log follower and /api/metrics
+registry; the log store, MAC offset index and scan history on disk are shared
+and guarded by file locks. Traffic summaries are followed by one worker at a
+time (whichever holds the .traffic.lock file lock) and published to a
+.traffic.json snapshot that every worker serves.
+"""
+
+import multiprocessing
+import os
+import signal
+
+bind = os.environ.get('FIREWALL_API_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('FIREWALL_API_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Every worker's scan pool spans all cores so one cold scan uses the whole machine; the shared slots keep
+# concurrent scans from several workers to one range per core between them
+scan_workers = int(os.environ.get('FIREWALL_API_SCAN_WORKERS', multiprocessing.cpu_count()))
+scan_slots = int(os.environ.get('FIREWALL_API_SCAN_SLOTS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('FIREWALL_API_THREADS', 8))
+timeout = int(os.environ.get('FIREWALL_API_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('FIREWALL_API_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+max_requests = 10000  # Recycle workers now and then so cache/heap growth can't accumulate
+max_requests_jitter = 1000
+accesslog = '-'
+errorlog = '-'
+proc_name = 'firewall-log-api'
+
+
+def post_worker_init(worker):
+    import firewall_log_api
+
+    firewall_log_api.metrics.registry.slow_log_path = os.environ.get('FIREWALL_API_SLOW_LOG') or None
+    firewall_log_api.metrics.registry.slow_threshold_seconds = float(
+        os.environ.get('FIREWALL_API_SLOW_MS', firewall_log_api.SLOW_REQUEST_SECONDS * 1000)) / 1000.0
+    firewall_log_api.parallel_scan.PARALLEL_SCAN_WORKERS = scan_workers
+    firewall_log_api.parallel_scan.SCAN_SLOTS = scan_slots
+    firewall_log_api.parallel_scan.SCAN_SLOT_DIR = firewall_log_api.SCAN_SLOT_DIR
+
+    # Log and topology event streams never finish on their own; end them as soon as the worker is asked to stop
+    # (clients reconnect to another worker) instead of holding it for the whole graceful_timeout
+    handle_exit = worker.handle_exit
+
+    def handle_term(sig, frame):
+        firewall_log_api.log_follower.stop()
+        firewall_log_api.topology_notifier.stop()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    import firewall_log_api
+
+    firewall_log_api.shutdown()
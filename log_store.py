@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Columnar Firewall Log Store
+Compact on-disk column chunks for ad-hoc firewall log queries
+
+Parsed log records are appended into fixed-size chunks. Each chunk stores one
+zlib-compressed blob per column:
+    - repeated strings (severity, protocol, rule, country, interface, IPs, MACs)
+      are dictionary-encoded per chunk as small integer codes
+    - ports are stored as integers (-1 when missing)
+    - the original timestamp string is kept for output, plus an epoch column
+      used for time filtering
+
+A manifest records every chunk's row count and min/max epoch time, so time
+range queries skip whole chunks without opening them. Filters are evaluated a
+column at a time: a predicate is applied once per distinct value, and a chunk
+whose dictionaries can't satisfy a filter is skipped before any codes are read.
+The surviving rows are selected with NumPy masks over the typed columns
+(dictionary codes through a per-chunk lookup table), and only the returned
+rows are decoded back to strings.
+"""
+
+import fcntl
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+CHUNK_ROWS = 65536  # Rows per chunk; the newest chunk stays open until it's full
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"  # flock()ed by writers so several server processes can share one store
+CHUNK_MAGIC = b"NTLC1\n"
+INT_COLUMNS = ('src_port', 'dst_port')
+TEXT_COLUMNS = ('timestamp',)
+TIME_COLUMN = '_ts'  # Epoch seconds (NaN when the timestamp couldn't be parsed)
+QUERY_ATTEMPTS = 3  # A query restarts from a fresh manifest when a concurrent flush replaces a chunk it was reading
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Write bytes via temp file + os.replace so readers never see a partial file"""
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp", prefix=".store_")
+    try:
+        with os.fdopen(tmp_fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock on `path` (created if missing), held across processes"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+class Chunk:
+    """Read access to one chunk file; columns are decoded lazily and cached"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(CHUNK_MAGIC)) != CHUNK_MAGIC:
+                raise ValueError(f"Not a log store chunk: {path}")
+            header_len = int.from_bytes(f.read(4), 'little')
+            self.header = json.loads(f.read(header_len))
+            self.data_start = f.tell()
+        self.rows = self.header['rows']
+        self._columns: Dict[str, Any] = {}
+
+    def kind(self, name: str) -> str:
+        return self.header['columns'][name]['kind']
+
+    def dictionary(self, name: str) -> List[str]:
+        return self.header['columns'][name]['dictionary']
+
+    def column(self, name: str):
+        """Raw column: codes for dictionary columns, ints, epoch floats or strings"""
+        if name in self._columns:
+            return self._columns[name]
+
+        meta = self.header['columns'][name]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start + meta['offset'])
+            blob = zlib.decompress(f.read(meta['length']))
+
+        if meta['kind'] == 'text':
+            values = blob.decode('utf-8').split('\n') if self.rows else []
+        else:
+            values = array(meta['typecode'])
+            values.frombytes(blob)
+            if self.header['byteorder'] != sys.byteorder:
+                values.byteswap()
+
+        self._columns[name] = values
+        return values
+
+    def array(self, name: str) -> np.ndarray:
+        """Numeric column (codes, ints or epoch floats) as a NumPy view, without copying"""
+        col = self.column(name)
+        return np.frombuffer(col, dtype=col.typecode) if len(col) else np.zeros(0, dtype=col.typecode)
+
+    def values(self, name: str) -> List[Any]:
+        """Decoded column values (dictionary codes resolved to strings)"""
+        col = self.column(name)
+        if self.kind(name) == 'dict':
+            dictionary = self.dictionary(name)
+            return [dictionary[code] for code in col]
+        return list(col)
+
+
+class LogStore:
+    """
+    Append-only columnar store of parsed log records in `store_dir`.
+
+    Args:
+        store_dir: Directory holding the manifest and chunk files
+        fields: Record fields to store (e.g. the keys parse_log_line returns)
+        chunk_rows: Rows per chunk
+    """
+
+    def __init__(self, store_dir: str, fields: Iterable[str], chunk_rows: int = CHUNK_ROWS):
+        self.store_dir = store_dir
+        self.fields = [field for field in fields if field != 'raw']
+        self.chunk_rows = chunk_rows
+        self.lock = threading.RLock()
+        self._buffer: Optional[Dict[str, list]] = None
+        self._dirty = False  # Buffer has rows not yet written to disk
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_id: Optional[Tuple[int, int]] = None  # (inode, mtime_ns) of the manifest we hold
+
+    # ------------------------------------------------------------------ manifest
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.store_dir, MANIFEST_NAME)
+
+    def _stat_manifest(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def manifest(self) -> Dict[str, Any]:
+        manifest_id = self._stat_manifest()
+        if self._manifest is None or manifest_id != self._manifest_id:
+            # First use, or another process saved a newer manifest
+            if self._manifest is not None:
+                self._buffer = None
+                self._dirty = False
+            try:
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+            except FileNotFoundError:
+                self._manifest = {'version': 1, 'next_chunk': 1, 'chunks': [], 'source': {}}
+            self._manifest_id = manifest_id
+        return self._manifest
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the store for writing against other threads and other processes"""
+        with self.lock, file_lock(os.path.join(self.store_dir, LOCK_NAME)):
+            yield self
+
+    @property
+    def source_state(self) -> Dict[str, Any]:
+        """Caller-owned ingest position (e.g. inode/offset of the log file), saved with each flush"""
+        return self.manifest()['source']
+
+    def row_count(self) -> int:
+        return sum(chunk['rows'] for chunk in self.manifest()['chunks'])
+
+    def reset(self) -> None:
+        """Drop all chunks"""
+        with self.lock:
+            manifest = self.manifest()
+            old_files = [chunk['file'] for chunk in manifest['chunks']]
+            manifest['chunks'] = []
+            manifest['source'] = {}
+            self._buffer = None
+            self._dirty = False
+            self._save_manifest()
+            for name in old_files:
+                try:
+                    os.unlink(os.path.join(self.store_dir, name))
+                except OSError:
+                    pass
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.store_dir, exist_ok=True)
+        _atomic_write(self.manifest_path, json.dumps(self._manifest).encode('utf-8'))
+        self._manifest_id = self._stat_manifest()
+
+    # ------------------------------------------------------------------ writing
+
+    def _empty_buffer(self) -> Dict[str, list]:
+        return {name: [] for name in self.fields + [TIME_COLUMN]}
+
+    def append(self, record: Dict[str, Any], epoch: Optional[float]) -> None:
+        """Buffer one parsed record; full chunks are written as they fill up"""
+        with self.lock:
+            if self._buffer is None:
+                self._buffer = self._reopen_tail_chunk()
+            for name in self.fields:
+                value = record.get(name, '')
+                self._buffer[name].append(_to_int(value) if name in INT_COLUMNS else (value or ''))
+            self._buffer[TIME_COLUMN].append(math.nan if epoch is None else epoch)
+            self._dirty = True
+
+            if len(self._buffer[TIME_COLUMN]) >= self.chunk_rows:
+                self._write_buffer()
+                self._buffer = self._empty_buffer()
+                self._dirty = False
+
+    def flush(self, source_state: Optional[Dict[str, Any]] = None) -> None:
+        """Write buffered rows (as the open tail chunk) and persist the manifest"""
+        with self.lock:
+            manifest = self.manifest()
+            if source_state is not None:
+                manifest['source'] = source_state
+            if self._dirty:
+                # The tail chunk's rows stay buffered so the next append extends it
+                self._write_buffer()
+                self._dirty = False
+            else:
+                self._save_manifest()
+
+    def _reopen_tail_chunk(self) -> Dict[str, list]:
+        """Load a partially filled last chunk back into the buffer so small ingests don't pile up tiny chunks"""
+        buffer = self._empty_buffer()
+        chunks = self.manifest()['chunks']
+        if chunks and chunks[-1]['rows'] < self.chunk_rows:
+            path = os.path.join(self.store_dir, chunks[-1]['file'])
+            try:
+                chunk = Chunk(path)
+                for name in self.fields + [TIME_COLUMN]:
+                    buffer[name] = chunk.values(name)
+            except (ValueError, zlib.error) as e:
+                # Leave the damaged chunk alone (queries skip it) and start a new one after it
+                print(f"Log store chunk {path} is unreadable, not extending it: {e}")
+                return self._empty_buffer()
+            buffer['_replaces'] = chunks[-1]['file']
+        return buffer
+
+    def _write_buffer(self) -> None:
+        manifest = self.manifest()
+        buffer = self._buffer
+        rows = len(buffer[TIME_COLUMN])
+
+        columns = {}
+        blobs = []
+        offset = 0
+        for name in self.fields + [TIME_COLUMN]:
+            values = buffer[name]
+            if name == TIME_COLUMN:
+                meta = {'kind': 'time', 'typecode': 'd'}
+                raw = array('d', values).tobytes()
+            elif name in INT_COLUMNS:
+                meta = {'kind': 'int', 'typecode': 'i'}
+                raw = array('i', values).tobytes()
+            elif name in TEXT_COLUMNS:
+                meta = {'kind': 'text'}
+                raw = '\n'.join(v.replace('\n', ' ') for v in values).encode('utf-8')
+            else:
+                # Dictionary-encode repeated strings
+                codes_by_value = {}
+                codes = [codes_by_value.setdefault(v, len(codes_by_value)) for v in values]
+                typecode = 'H' if len(codes_by_value) <= 0xFFFF else 'I'
+                meta = {'kind': 'dict', 'typecode': typecode, 'dictionary': list(codes_by_value)}
+                raw = array(typecode, codes).tobytes()
+
+            blob = zlib.compress(raw, 1)
+            meta['offset'] = offset
+            meta['length'] = len(blob)
+            offset += len(blob)
+            columns[name] = meta
+            blobs.append(blob)
+
+        times = [t for t in buffer[TIME_COLUMN] if not math.isnan(t)]
+        min_ts = min(times) if times else None
+        max_ts = max(times) if times else None
+        header = json.dumps({
+            'rows': rows,
+            'byteorder': sys.byteorder,
+            'min_ts': min_ts,
+            'max_ts': max_ts,
+            'columns': columns
+        }).encode('utf-8')
+
+        name = f"chunk_{manifest['next_chunk']:06d}.col"
+        manifest['next_chunk'] += 1
+        os.makedirs(self.store_dir, exist_ok=True)
+        _atomic_write(
+            os.path.join(self.store_dir, name),
+            CHUNK_MAGIC + len(header).to_bytes(4, 'little') + header + b''.join(blobs)
+        )
+
+        entry = {'file': name, 'rows': rows, 'min_ts': min_ts, 'max_ts': max_ts}
+        replaced = buffer.pop('_replaces', None)
+        if replaced and manifest['chunks'] and manifest['chunks'][-1]['file'] == replaced:
+            manifest['chunks'][-1] = entry
+        else:
+            manifest['chunks'].append(entry)
+        self._save_manifest()
+
+        # The rewritten tail chunk supersedes the old file
+        if replaced:
+            try:
+                os.unlink(os.path.join(self.store_dir, replaced))
+            except OSError:
+                pass
+        if rows < self.chunk_rows:
+            buffer['_replaces'] = name
+
+    # ------------------------------------------------------------------ querying
+
+    @staticmethod
+    def _allowed(chunk: Chunk, name: str, predicate: Callable[[Any], bool]) -> set:
+        """Evaluate a predicate once per distinct value of a column. Returns the allowed raw values/codes."""
+        kind = chunk.kind(name)
+        if kind == 'dict':
+            return {code for code, value in enumerate(chunk.dictionary(name)) if predicate(value)}
+        distinct = set(chunk.column(name)) if kind == 'text' else np.unique(chunk.array(name)).tolist()
+        return {value for value in distinct if predicate(value)}
+
+    @staticmethod
+    def _mask(chunk: Chunk, name: str, allowed: set) -> np.ndarray:
+        """Boolean row mask: the column's value (or code) is in `allowed`"""
+        kind = chunk.kind(name)
+        if kind == 'dict':
+            lookup = np.zeros(len(chunk.dictionary(name)), dtype=bool)
+            lookup[list(allowed)] = True
+            return lookup[chunk.array(name)]
+        if kind == 'text':
+            return np.fromiter((value in allowed for value in chunk.column(name)), dtype=bool, count=chunk.rows)
+        return np.isin(chunk.array(name), list(allowed))
+
+    def _decode_rows(self, chunk: Chunk, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """Records for just these rows, each column decoded only at those positions"""
+        columns = {}
+        for name in self.fields:
+            kind = chunk.kind(name)
+            if kind == 'dict':
+                dictionary = chunk.dictionary(name)
+                columns[name] = [dictionary[code] for code in chunk.array(name)[rows].tolist()]
+            elif kind == 'int':
+                # Back to the string form parse_log_line returns
+                columns[name] = [str(v) if v >= 0 else '' for v in chunk.array(name)[rows].tolist()]
+            elif kind == 'text':
+                col = chunk.column(name)
+                columns[name] = [col[i] for i in rows.tolist()]
+            else:
+                columns[name] = chunk.array(name)[rows].tolist()
+        return [{name: columns[name][i] for name in self.fields} for i in range(len(rows))]
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              where: Optional[Dict[str, Callable[[Any], bool]]] = None,
+              where_any: Optional[Tuple[Iterable[str], Callable[[Any], bool]]] = None,
+              limit: int = 100, group_by: Optional[str] = None, top: int = 10,
+              deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Query the store newest chunk first.
+
+        Args:
+            since/until: Epoch-second time window (inclusive)
+            where: {column: predicate} - every predicate must hold
+            where_any: (columns, predicate) - predicate must hold for at least one column
+            limit: Max records returned (newest first)
+            group_by: Column to count matching rows by
+            top: Number of groups returned
+            deadline: time.monotonic() after which no further chunks are read;
+                the result then covers only the newer chunks and is marked truncated
+
+        Returns:
+            dict with total matches, newest records, top groups and chunk stats
+        """
+        for attempt in range(QUERY_ATTEMPTS):
+            with self.lock:
+                chunks = list(self.manifest()['chunks'])
+            try:
+                return self._query_chunks(chunks, since, until, where or {}, where_any, limit, group_by, top,
+                                          deadline)
+            except FileNotFoundError:
+                # A concurrent flush replaced the tail chunk after the manifest was read; its rows
+                # (and any new ones) are in a file only the new manifest lists
+                if attempt == QUERY_ATTEMPTS - 1:
+                    raise
+
+    def _query_chunks(self, chunks: List[Dict[str, Any]], since: Optional[float], until: Optional[float],
+                      where: Dict[str, Callable[[Any], bool]],
+                      where_any: Optional[Tuple[Iterable[str], Callable[[Any], bool]]],
+                      limit: int, group_by: Optional[str], top: int,
+                      deadline: Optional[float]) -> Dict[str, Any]:
+        records = []
+        total = 0
+        groups = Counter()
+        chunks_scanned = 0
+        chunks_skipped = 0
+        truncated = False
+
+        for entry in reversed(chunks):
+            if deadline is not None and time.monotonic() > deadline:
+                truncated = True
+                break
+            # Skip whole chunks by time range straight from the manifest
+            if since is not None and (entry['max_ts'] is None or entry['max_ts'] < since):
+                chunks_skipped += 1
+                continue
+            if until is not None and (entry['min_ts'] is None or entry['min_ts'] > until):
+                chunks_skipped += 1
+                continue
+
+            path = os.path.join(self.store_dir, entry['file'])
+            try:
+                found = self._query_chunk(Chunk(path), since, until, where, where_any,
+                                          limit - len(records), group_by)
+            except (ValueError, zlib.error) as e:
+                # Bad magic, header or column block (e.g. a damaged disk block): answer from the other chunks
+                print(f"Skipping unreadable log store chunk {path}: {e}")
+                chunks_skipped += 1
+                continue
+            if found is None:
+                chunks_skipped += 1
+                continue
+            chunks_scanned += 1
+            matched, chunk_groups, chunk_records = found
+            total += matched
+            groups.update(chunk_groups)
+            records.extend(chunk_records)
+
+        result = {
+            'total': total,
+            'records': records,
+            'chunks_scanned': chunks_scanned,
+            'chunks_skipped': chunks_skipped,
+            'truncated': truncated
+        }
+        if group_by:
+            result['groups'] = [{'value': value, 'count': count} for value, count in groups.most_common(top)]
+        return result
+
+    def _query_chunk(self, chunk: Chunk, since: Optional[float], until: Optional[float],
+                     where: Dict[str, Callable[[Any], bool]],
+                     where_any: Optional[Tuple[Iterable[str], Callable[[Any], bool]]],
+                     limit: int, group_by: Optional[str]) -> Optional[Tuple[int, Counter, List[Dict[str, Any]]]]:
+        """
+        Matches in one chunk: (match count, group counts, newest `limit` records), or None when the
+        chunk's dictionaries rule it out without reading any rows.
+        """
+        # Dictionary columns can rule out a chunk before any codes are read
+        filters = []
+        for name, predicate in where.items():
+            allowed = self._allowed(chunk, name, predicate)
+            if not allowed:
+                return None
+            filters.append((name, allowed))
+        any_filters = []
+        if where_any:
+            columns, predicate = where_any
+            for name in columns:
+                allowed = self._allowed(chunk, name, predicate)
+                if allowed:
+                    any_filters.append((name, allowed))
+            if not any_filters:
+                return None
+
+        mask = np.ones(chunk.rows, dtype=bool)
+        if since is not None or until is not None:
+            ts = chunk.array(TIME_COLUMN)
+            if since is not None:
+                mask &= ts >= since
+            if until is not None:
+                mask &= ts <= until
+        for name, allowed in filters:
+            mask &= self._mask(chunk, name, allowed)
+        if any_filters:
+            any_mask = np.zeros(chunk.rows, dtype=bool)
+            for name, allowed in any_filters:
+                any_mask |= self._mask(chunk, name, allowed)
+            mask &= any_mask
+        rows = np.flatnonzero(mask)
+
+        groups = Counter()
+        if group_by and len(rows):
+            if chunk.kind(group_by) == 'dict':
+                counts = np.bincount(chunk.array(group_by)[rows], minlength=len(chunk.dictionary(group_by)))
+                dictionary = chunk.dictionary(group_by)
+                groups = Counter({dictionary[code]: int(counts[code]) for code in np.flatnonzero(counts)})
+            elif chunk.kind(group_by) == 'text':
+                col = chunk.column(group_by)
+                groups = Counter(col[i] for i in rows.tolist())
+            else:
+                values, counts = np.unique(chunk.array(group_by)[rows], return_counts=True)
+                groups = Counter(dict(zip(values.tolist(), counts.tolist())))
+
+        records = self._decode_rows(chunk, rows[::-1][:max(limit, 0)]) if limit > 0 else []
+        return len(rows), groups, records
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Parallel Firewall Log Scan
+Multi-core full scans of a log file for the queries the MAC offset index can't
+answer yet (a cold index on a large log, or an index that is unavailable)
+
+The file is memory-mapped and split into newline-aligned byte ranges, one task
+per range in a process pool. Workers never parse lines: for a few MACs they
+jump between occurrences of the MAC's spellings with mmap.find(), for many
+they run MAC_FIELD_RE over the whole range. Either way a candidate line counts
+only if one of its src_mac/dst_mac fields normalizes to a wanted MAC - the
+same test the offset index and log_involves_mac apply. Workers return the
+byte offsets of matching lines; the caller merges them in file order and
+parses just the lines it returns (e.g. the newest N).
+
+Files smaller than PARALLEL_SCAN_MIN_BYTES (or a pool of one) are scanned in
+the calling process with the same code, as is a scan whose pool broke (a scan
+process was killed); the next parallel scan starts a fresh pool.
+
+Every API process has its own pool sized to the machine, so one cold scan can
+use all cores. With SCAN_SLOT_DIR set (gunicorn.conf.py does), a scan process
+only scans a range while it holds one of SCAN_SLOTS flock()ed slot files there.
+This works as a semaphore across all API processes, so concurrent scans from
+several workers share the cores instead of oversubscribing them.
+"""
+
+import fcntl
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from write_topology_data import normalize_mac
+
+PARALLEL_SCAN_WORKERS = os.cpu_count() or 1  # Scan processes (per API process, started on first use; see gunicorn.conf.py)
+SCAN_SLOTS = os.cpu_count() or 1  # Ranges scanned at once across every process sharing SCAN_SLOT_DIR
+SCAN_SLOT_DIR = None  # Directory of slot lock files shared by all API processes (None: no cross-process limit)
+SLOT_POLL_SECONDS = 0.01  # Wait between attempts while every slot is taken
+PARALLEL_SCAN_MIN_BYTES = 64 * 1024 * 1024  # Smaller scans run in-process
+RANGES_PER_WORKER = 4  # More ranges than workers so an uneven range doesn't leave cores idle
+MAX_FIND_MACS = 4  # Up to this many MACs are located with mmap.find(); more use one regex pass
+DEADLINE_CHECK_BYTES = 8 * 1024 * 1024  # Bytes scanned between deadline checks inside a range
+
+# Matches src_mac/dst_mac in a raw log line, quoted or bare numeric like parse_log_line
+MAC_FIELD_RE = re.compile(rb'(?:src_mac|dst_mac)=(?:"([^"]*)"|(\d+))')
+
+
+def mac_search_tokens(normalized_mac: str) -> Tuple[bytes, ...]:
+    """
+    Byte strings a raw log line must contain to possibly mention this MAC:
+    colon, dash and bare forms, in upper and lower case.
+    """
+    pairs = [normalized_mac[i:i + 2] for i in range(0, len(normalized_mac), 2)]
+    forms = {':'.join(pairs), '-'.join(pairs), normalized_mac}
+    return tuple({variant.encode() for form in forms for variant in (form.upper(), form.lower())})
+
+
+def line_macs(line: bytes) -> List[str]:
+    """Normalized src_mac/dst_mac values of a raw log line"""
+    return [normalize_mac((match.group(1) or match.group(2)).decode('ascii', 'ignore'))
+            for match in MAC_FIELD_RE.finditer(line)]
+
+
+def line_ranges(path: str, parts: int, end: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Split the first `end` bytes of a file (default: all) into up to `parts`
+    byte ranges that each start at the beginning of a line.
+    """
+    if end is None:
+        end = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(end * i // parts - 1, bounds[-1]))
+            f.readline()
+            position = min(f.tell(), end)
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(end)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _find_candidates(mm, start: int, end: int, tokens: Iterable[bytes]) -> Iterable[int]:
+    """Positions in [start, end) where any of the tokens occurs, at most one per line"""
+    for token in tokens:
+        position = mm.find(token, start, end)
+        while position != -1:
+            yield position
+            line_end = mm.find(b'\n', position, end)
+            if line_end == -1:
+                break
+            position = mm.find(token, line_end + 1, end)
+
+
+def _check_deadline(deadline: Optional[float]) -> None:
+    if deadline is not None and time.time() > deadline:
+        raise TimeoutError("Log scan deadline exceeded")
+
+
+@contextmanager
+def scan_slot(slot_dir: str, slots: int, deadline: Optional[float] = None):
+    """
+    Hold one of `slots` flock()ed files in slot_dir while the block runs: a
+    semaphore shared by every process using the same directory (a slot is freed
+    even if its holder is killed). Raises TimeoutError if none frees up before
+    `deadline`.
+    """
+    os.makedirs(slot_dir, exist_ok=True)
+    first = os.getpid() % slots  # Processes start probing at different slots
+    while True:
+        for i in range(slots):
+            f = open(os.path.join(slot_dir, f"slot.{(first + i) % slots}"), 'a')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            try:
+                yield
+            finally:
+                f.close()  # Releases the lock
+            return
+        _check_deadline(deadline)
+        time.sleep(SLOT_POLL_SECONDS)
+
+
+def scan_range(path: str, start: int, end: int, normalized_macs: List[str],
+               deadline: Optional[float] = None, slot_dir: Optional[str] = None,
+               slots: int = 1) -> Dict[str, array]:
+    """
+    Offsets of the complete lines in [start, end) whose src_mac or dst_mac is
+    one of normalized_macs. Returns {mac: array of line start offsets, ascending}.
+    Raises TimeoutError once `deadline` (a time.time() value, so it holds in
+    scan processes too) has passed. With slot_dir, the range is scanned while
+    holding one of its `slots` (see scan_slot).
+    """
+    if slot_dir is not None:
+        with scan_slot(slot_dir, slots, deadline):
+            return scan_range(path, start, end, normalized_macs, deadline)
+
+    wanted = set(normalized_macs)
+    found: Dict[str, set] = {mac: set() for mac in wanted}
+    if end <= start:
+        return {mac: array('q') for mac in wanted}
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = min(end, len(mm))
+        # Lines starting after the last newline are still being written
+        complete_end = mm.rfind(b'\n', start, end)
+        if complete_end == -1:
+            return {mac: array('q') for mac in wanted}
+
+        tokens = None
+        if len(wanted) <= MAX_FIND_MACS:
+            tokens = [token for mac in wanted for token in mac_search_tokens(mac)]
+        normalized: Dict[bytes, str] = {}  # Raw field value -> normalized MAC
+        # Newline-aligned blocks, so a sparse MAC still reaches a deadline check every few MB
+        block_start = start
+        while block_start < complete_end:
+            _check_deadline(deadline)
+            block_end = complete_end
+            if complete_end - block_start > DEADLINE_CHECK_BYTES:
+                block_end = mm.find(b'\n', block_start + DEADLINE_CHECK_BYTES, complete_end)
+                if block_end == -1:
+                    block_end = complete_end
+
+            if tokens is not None:
+                for position in _find_candidates(mm, block_start, block_end, tokens):
+                    line_start = mm.rfind(b'\n', start, position) + 1 or start
+                    line_end = mm.find(b'\n', position, end)
+                    for mac in line_macs(mm[line_start:line_end]):
+                        if mac in wanted:
+                            found[mac].add(line_start)
+            else:
+                for match in MAC_FIELD_RE.finditer(mm, block_start, block_end):
+                    value = match.group(1) or match.group(2)
+                    mac = normalized.get(value)
+                    if mac is None:
+                        mac = normalized[value] = normalize_mac(value.decode('ascii', 'ignore'))
+                    if mac in wanted:
+                        found[mac].add(mm.rfind(b'\n', start, match.start()) + 1 or start)
+            block_start = block_end + 1
+
+    return {mac: array('q', sorted(offsets)) for mac, offsets in found.items()}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: scan processes start from a clean interpreter, not a copy of a threaded server
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('forkserver'))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the scan processes (they are restarted on the next parallel scan)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool, unless another thread already replaced it"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def scan_offsets(path: str, normalized_macs: List[str], end: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 min_parallel_bytes: int = PARALLEL_SCAN_MIN_BYTES,
+                 timeout: Optional[float] = None) -> Dict[str, List[int]]:
+    """
+    Byte offsets of every complete line in the file (up to `end`) involving
+    each MAC, in file order. Ranges are scanned in parallel when the file is
+    large enough and more than one worker is configured.
+
+    Args:
+        path: Log file
+        normalized_macs: MACs as returned by normalize_mac
+        end: Scan only this many bytes (default: the current size)
+        workers: Scan processes to use (default PARALLEL_SCAN_WORKERS)
+        min_parallel_bytes: Smaller scans run in the calling process
+        timeout: Seconds the whole scan may take (default: no limit)
+
+    Returns:
+        {mac: [line start offsets, ascending]}
+
+    Raises:
+        TimeoutError: The scan took longer than `timeout`
+    """
+    if end is None:
+        end = os.path.getsize(path)
+    if workers is None:
+        workers = PARALLEL_SCAN_WORKERS
+    deadline = None if timeout is None else time.time() + timeout
+    macs = sorted(set(normalized_macs))
+    if workers <= 1 or end < min_parallel_bytes:
+        return {mac: offsets.tolist() for mac, offsets in scan_range(path, 0, end, macs, deadline).items()}
+
+    ranges = line_ranges(path, workers * RANGES_PER_WORKER, end)
+    pool = _get_pool(workers)
+    futures = []
+    try:
+        # Scan processes are fresh interpreters, so the slot settings travel with each task
+        futures = [pool.submit(scan_range, path, start, stop, macs, deadline, SCAN_SLOT_DIR, SCAN_SLOTS)
+                   for start, stop in ranges]
+
+        # Ranges are in file order, so concatenating their results keeps offsets ascending
+        results: Dict[str, List[int]] = {mac: [] for mac in macs}
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            for mac, offsets in future.result(timeout=remaining).items():
+                results[mac].extend(offsets)
+        return results
+    except BrokenProcessPool:
+        # A scan process died (OOM kill, crash); a broken pool never recovers, so replace it next time
+        _discard_pool(pool)
+        return {mac: offsets.tolist() for mac, offsets in scan_range(path, 0, end, macs, deadline).items()}
+    except TimeoutError:
+        # Ranges not started yet are dropped; running ones stop at their next deadline check
+        for future in futures:
+            future.cancel()
+        raise
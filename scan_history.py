@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Scan History Store
+Indexes every scan_*/raw_data_complete.json once into a local SQLite database
+so history questions are answered from the index instead of re-parsing exports.
+
+Usage:
+    python scan_history.py [--scans-dir DIR] [--db PATH]
+
+Each scan's records are stored one row per record (canonical JSON body),
+indexed by section + MAC, section + IP and scan + key; scans are indexed by
+scan time. This supports:
+    - topology as of time T       (latest scan at or before T, rebuilt from rows)
+    - first/last appearance       (of a MAC or IP across all scans)
+    - diff between two scans      (added/removed/changed records by key)
+
+Records without a unique key in their scan (no id, or a MAC/id repeated
+within the section) are stored with an empty key: they are part of the
+topology as of T but can't be matched across scans, so diffs leave them out.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from write_topology_data import RECORD_SECTIONS, UNKNOWN_MAC_KEY, normalize_mac, record_key
+
+SCANS_DIR = "/opt/eagleyesocradar/scans"
+HISTORY_DB = "/home/ubuntu/nettopo/scan_history.sqlite"
+SCAN_PREFIX = "scan_"
+SCAN_FILE_NAME = "raw_data_complete.json"
+SYNC_INTERVAL_SECONDS = 30  # Min time between directory rescans triggered by queries
+HISTORY_FORMAT = 2  # PRAGMA user_version; older databases are re-indexed (record keys changed)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    scan_time TEXT,
+    scan_epoch REAL,
+    file_size INTEGER,
+    file_mtime REAL,
+    device_count INTEGER,
+    connection_count INTEGER,
+    extra BLOB
+);
+CREATE INDEX IF NOT EXISTS scans_by_time ON scans (scan_epoch);
+CREATE TABLE IF NOT EXISTS records (
+    scan_id INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    mac TEXT,
+    ip TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_by_scan ON records (scan_id, section, key);
+CREATE INDEX IF NOT EXISTS records_by_mac ON records (section, mac, scan_id);
+CREATE INDEX IF NOT EXISTS records_by_ip ON records (section, ip, scan_id);
+"""
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """ISO 8601 string to epoch seconds (naive times are taken as UTC); None if unparseable"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _canonical(record: Dict[str, Any]) -> str:
+    """Stable JSON text for a record, so equal records compare equal as strings"""
+    return json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class ScanHistory:
+    """
+    Embedded scan history index.
+
+    Args:
+        db_path: SQLite database file
+        scans_dir: Directory containing scan_* folders
+    """
+
+    def __init__(self, db_path: str = HISTORY_DB, scans_dir: str = SCANS_DIR):
+        self.db_path = db_path
+        self.scans_dir = scans_dir
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        self._syncer: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        if conn.execute('PRAGMA user_version').fetchone()[0] != HISTORY_FORMAT:
+            # Indexed with older record keys; drop the rows so the next sync indexes every scan again
+            with conn:
+                conn.execute('DELETE FROM records')
+                conn.execute('DELETE FROM scans')
+                conn.execute(f'PRAGMA user_version = {HISTORY_FORMAT}')
+        return conn
+
+    @property
+    def syncing(self) -> bool:
+        """True while a background sync is running"""
+        return self._syncer is not None and self._syncer.is_alive()
+
+    def sync_in_background(self) -> None:
+        """
+        Start sync() on a background thread unless one is already running, so
+        queries never wait for scan exports to be parsed; they answer from what
+        is indexed so far.
+        """
+        if time.monotonic() - self._last_sync < SYNC_INTERVAL_SECONDS:
+            return
+        with self._lock:
+            if self.syncing:
+                return
+            self._syncer = threading.Thread(target=self._background_sync, name='scan-history', daemon=True)
+            self._syncer.start()
+
+    def _background_sync(self) -> None:
+        try:
+            self.sync()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Background scan history sync failed: {e}")
+
+    # ------------------------------------------------------------------ ingest
+
+    def sync(self, force: bool = False) -> int:
+        """
+        Ingest scans that are new or changed since they were last indexed.
+
+        Args:
+            force: Rescan the directory even if SYNC_INTERVAL_SECONDS hasn't passed
+
+        Returns:
+            int: Number of scans ingested
+        """
+        if not force and time.monotonic() - self._last_sync < SYNC_INTERVAL_SECONDS:
+            return 0
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._sync_lock, open(self.db_path + '.lock', 'a') as lock_file:
+            # Other API worker processes sync the same database
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self._last_sync = time.monotonic()
+            try:
+                names = sorted(n for n in os.listdir(self.scans_dir) if n.startswith(SCAN_PREFIX))
+            except OSError as e:
+                print(f"✗ Cannot list scans directory {self.scans_dir}: {e}")
+                return 0
+
+            conn = self._connect()
+            try:
+                known = {
+                    row['name']: (row['file_size'], row['file_mtime'])
+                    for row in conn.execute('SELECT name, file_size, file_mtime FROM scans')
+                }
+                ingested = 0
+                for name in names:
+                    path = os.path.join(self.scans_dir, name, SCAN_FILE_NAME)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue  # Scan still running, no export yet
+                    if known.get(name) == (st.st_size, st.st_mtime):
+                        continue
+                    if self._ingest(conn, name, path, st):
+                        ingested += 1
+                return ingested
+            finally:
+                conn.close()
+
+    def _ingest(self, conn: sqlite3.Connection, name: str, path: str, st: os.stat_result) -> bool:
+        try:
+            with open(path, 'rb') as f:
+                export = json.load(f)
+        except (OSError, ValueError) as e:
+            # Most likely still being written; picked up on a later sync
+            print(f"✗ Skipping {name}: {e}")
+            return False
+
+        data = export.get('data', {})
+        scan_time = export.get('export_timestamp')
+        if parse_time(scan_time) is None:
+            metadata = data.get('scan_metadata') or [{}]
+            scan_time = metadata[0].get('start_time') if metadata else None
+        scan_epoch = parse_time(scan_time)
+        if scan_epoch is None:
+            scan_time = datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat()
+            scan_epoch = st.st_mtime
+
+        # Everything except the record lists is small - keep it whole
+        extra = {key: value for key, value in export.items() if key != 'data'}
+        extra['data'] = {key: value for key, value in data.items() if key not in RECORD_SECTIONS}
+
+        with conn:
+            old = conn.execute('SELECT id FROM scans WHERE name = ?', (name,)).fetchone()
+            if old:
+                conn.execute('DELETE FROM records WHERE scan_id = ?', (old['id'],))
+                conn.execute('DELETE FROM scans WHERE id = ?', (old['id'],))
+
+            cursor = conn.execute(
+                'INSERT INTO scans (name, scan_time, scan_epoch, file_size, file_mtime, '
+                'device_count, connection_count, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    name, scan_time, scan_epoch, st.st_size, st.st_mtime,
+                    len(data.get('devices', {}).get('records', [])),
+                    len(data.get('connections', {}).get('records', [])),
+                    zlib.compress(json.dumps(extra).encode('utf-8'))
+                )
+            )
+            scan_id = cursor.lastrowid
+
+            rows = []
+            for section in RECORD_SECTIONS:
+                records = data.get(section, {}).get('records', [])
+                keys = [record_key(section, record) for record in records]
+                key_counts = Counter(keys)
+                for ord_, (record, key) in enumerate(zip(records, keys)):
+                    if key == 'None' or key_counts[key] > 1:
+                        key = ''  # No unique identity in this scan
+                    if section == 'devices':
+                        mac, ip = normalize_mac(record.get('mac')), record.get('ip')
+                    elif section == 'connections':
+                        mac, ip = normalize_mac(record.get('mac_address')), record.get('ip_address')
+                    else:
+                        mac, ip = None, None
+                    if mac == UNKNOWN_MAC_KEY:
+                        mac = None  # Placeholder shared by unrelated devices
+                    rows.append((scan_id, section, ord_, key, mac or None, ip or None, _canonical(record)))
+            conn.executemany(
+                'INSERT INTO records (scan_id, section, ord, key, mac, ip, body) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+        print(f"✓ Indexed {name}: {len(rows)} records")
+        return True
+
+    # ------------------------------------------------------------------ queries
+
+    @staticmethod
+    def _scan_info(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'name': row['name'],
+            'scan_time': row['scan_time'],
+            'devices': row['device_count'],
+            'connections': row['connection_count']
+        }
+
+    def list_scans(self) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT * FROM scans ORDER BY scan_epoch').fetchall()
+            return [self._scan_info(row) for row in rows]
+        finally:
+            conn.close()
+
+    def topology_at(self, epoch: float) -> Optional[Dict[str, Any]]:
+        """Rebuild the export of the latest scan taken at or before `epoch`"""
+        conn = self._connect()
+        try:
+            scan = conn.execute(
+                'SELECT * FROM scans WHERE scan_epoch <= ? ORDER BY scan_epoch DESC LIMIT 1', (epoch,)
+            ).fetchone()
+            if scan is None:
+                return None
+
+            export = json.loads(zlib.decompress(scan['extra']))
+            data = export['data']
+            for section in RECORD_SECTIONS:
+                records = [
+                    json.loads(row['body']) for row in conn.execute(
+                        'SELECT body FROM records WHERE scan_id = ? AND section = ? ORDER BY ord',
+                        (scan['id'], section)
+                    )
+                ]
+                data[section] = {'count': len(records), 'records': records}
+            return {'scan': self._scan_info(scan), 'topology': export}
+        finally:
+            conn.close()
+
+    def presence(self, field: str, value: str) -> Dict[str, Any]:
+        """
+        First/last scan in which a device MAC or IP appeared.
+
+        Args:
+            field: 'mac' or 'ip'
+            value: MAC (any format) or IP address
+        """
+        if field not in ('mac', 'ip'):
+            raise ValueError(f"Unsupported field: {field}")
+        if field == 'mac':
+            value = normalize_mac(value)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f'SELECT s.name, s.scan_time, r.body FROM records r JOIN scans s ON s.id = r.scan_id '
+                f'WHERE r.section = ? AND r.{field} = ? ORDER BY s.scan_epoch',
+                ('devices', value)
+            ).fetchall()
+            total = conn.execute('SELECT COUNT(*) FROM scans').fetchone()[0]
+        finally:
+            conn.close()
+
+        if not rows:
+            return {field: value, 'found': False, 'scans_seen': 0, 'total_scans': total}
+
+        other = 'ip' if field == 'mac' else 'mac'
+        seen_values = []
+        for row in rows:
+            observed = json.loads(row['body']).get(other)
+            if observed and observed not in seen_values:
+                seen_values.append(observed)
+
+        return {
+            field: value,
+            'found': True,
+            'first_seen': {'scan': rows[0]['name'], 'scan_time': rows[0]['scan_time']},
+            'last_seen': {'scan': rows[-1]['name'], 'scan_time': rows[-1]['scan_time']},
+            'scans_seen': len(rows),
+            'total_scans': total,
+            f'{other}s': seen_values,
+            'latest_record': json.loads(rows[-1]['body'])
+        }
+
+    def diff(self, from_scan: str, to_scan: str) -> Optional[Dict[str, Any]]:
+        """Added/removed/changed records per section between two scans (by name), matched by unique key"""
+        conn = self._connect()
+        try:
+            scans = {
+                row['name']: row for row in conn.execute(
+                    'SELECT * FROM scans WHERE name IN (?, ?)', (from_scan, to_scan)
+                )
+            }
+            if from_scan not in scans or to_scan not in scans:
+                return None
+            a, b = scans[from_scan]['id'], scans[to_scan]['id']
+
+            sections = {}
+            for section in RECORD_SECTIONS:
+                added = conn.execute(
+                    "SELECT body FROM records WHERE scan_id = ? AND section = ? AND key != '' AND key NOT IN "
+                    '(SELECT key FROM records WHERE scan_id = ? AND section = ?) ORDER BY ord',
+                    (b, section, a, section)
+                ).fetchall()
+                removed = conn.execute(
+                    "SELECT key FROM records WHERE scan_id = ? AND section = ? AND key != '' AND key NOT IN "
+                    '(SELECT key FROM records WHERE scan_id = ? AND section = ?) ORDER BY ord',
+                    (a, section, b, section)
+                ).fetchall()
+                changed = conn.execute(
+                    'SELECT new.body AS body, old.body AS old_body FROM records new '
+                    'JOIN records old ON old.scan_id = ? AND old.section = new.section AND old.key = new.key '
+                    "WHERE new.scan_id = ? AND new.section = ? AND new.key != '' AND old.body != new.body "
+                    'ORDER BY new.ord',
+                    (a, b, section)
+                ).fetchall()
+
+                changes = []
+                for row in changed:
+                    old, new = json.loads(row['old_body']), json.loads(row['body'])
+                    changes.append({
+                        'record': new,
+                        'fields': sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+                    })
+                sections[section] = {
+                    'added': [json.loads(row['body']) for row in added],
+                    'removed': [row['key'] for row in removed],
+                    'changed': changes
+                }
+
+            return {
+                'from': self._scan_info(scans[from_scan]),
+                'to': self._scan_info(scans[to_scan]),
+                'records': sections
+            }
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index scan exports into the scan history store")
+    parser.add_argument('--scans-dir', default=SCANS_DIR, help="Directory containing scan_* folders")
+    parser.add_argument('--db', default=HISTORY_DB, help="History database path")
+    args = parser.parse_args()
+
+    history = ScanHistory(args.db, args.scans_dir)
+    ingested = history.sync(force=True)
+    print(f"\n✓ {ingested} new scan(s) indexed, {len(history.list_scans())} total in {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -4,64 +4,65 @@
 
 set -e
 
+INSTALL_DIR="/opt/firewall-log-api"
+
 echo "🔧 Setting up NetTopo Visualizer auto-update system..."
 
-# 1. Copy update script to system location
-echo "📋 Installing update script..."
+# 1. Install the publisher (shares write_topology_data.py / topology_validation.py / topology_layout.py with the log API)
+echo "📋 Installing topology publisher..."
+sudo mkdir -p "$INSTALL_DIR"
+sudo cp topology_publisher.py write_topology_data.py topology_validation.py topology_layout.py "$INSTALL_DIR/"
 sudo cp update_latest_scan.sh /usr/local/bin/update_topology_scan
 sudo chmod +x /usr/local/bin/update_topology_scan
+# The publisher precomputes layouts with NumPy
+if ! python3 -c "import numpy" 2>/dev/null; then
+    sudo apt-get install -y python3-numpy || sudo pip3 install --break-system-packages numpy
+fi
+
+# 2. Retire the old 5-minute polling timer if an earlier version installed it
+if systemctl list-unit-files update-topology-scan.timer > /dev/null 2>&1; then
+    echo "🧹 Removing old update timer..."
+    sudo systemctl disable --now update-topology-scan.timer 2>/dev/null || true
+    sudo rm -f /etc/systemd/system/update-topology-scan.timer /etc/systemd/system/update-topology-scan.service
+fi
 
-# 2. Create systemd service
+# 3. Create systemd service: watches the scans directory (inotify) and publishes each
+#    completed scan as soon as its raw_data_complete.json is written
 echo "⚙️  Creating systemd service..."
-sudo tee /etc/systemd/system/update-topology-scan.service > /dev/null <<EOF
+sudo tee /etc/systemd/system/topology-publisher.service > /dev/null <<EOF
 [Unit]
-Description=Update NetTopo Visualizer with latest scan data
+Description=Publish completed scans to NetTopo Visualizer
 After=network.target
 
 [Service]
-Type=oneshot
-ExecStart=/usr/local/bin/update_topology_scan
+Type=simple
+WorkingDirectory=$INSTALL_DIR
+ExecStart=/usr/bin/python3 $INSTALL_DIR/topology_publisher.py --layout --delta
+Restart=always
+RestartSec=5
 User=root
 StandardOutput=journal
 StandardError=journal
+# Status lines straight to the journal
+Environment=PYTHONUNBUFFERED=1
 
 [Install]
 WantedBy=multi-user.target
 EOF
 
-# 3. Create systemd timer (runs every 5 minutes)
-echo "⏰ Creating systemd timer..."
-sudo tee /etc/systemd/system/update-topology-scan.timer > /dev/null <<EOF
-[Unit]
-Description=Update topology scan data every 5 minutes
-Requires=update-topology-scan.service
-
-[Timer]
-OnBootSec=1min
-OnUnitActiveSec=5min
-AccuracySec=1s
-
-[Install]
-WantedBy=timers.target
-EOF
-
-# 4. Reload systemd and enable timer
-echo "🔄 Enabling systemd timer..."
+# 4. Reload systemd and start the publisher (it publishes the newest complete scan on start)
+echo "🔄 Enabling publisher service..."
 sudo systemctl daemon-reload
-sudo systemctl enable update-topology-scan.timer
-sudo systemctl start update-topology-scan.timer
-
-# 5. Run once immediately
-echo "▶️  Running initial update..."
-sudo /usr/local/bin/update_topology_scan
+sudo systemctl enable topology-publisher
+sudo systemctl restart topology-publisher
 
-# 6. Verify timer is running
+# 5. Verify the publisher is running
 echo ""
 echo "✅ Setup complete!"
 echo ""
-echo "📊 Timer status:"
-sudo systemctl status update-topology-scan.timer --no-pager
+echo "📊 Publisher status:"
+sudo systemctl status topology-publisher --no-pager
 echo ""
-echo "📝 Check logs with: sudo journalctl -u update-topology-scan -f"
-echo "🔍 Manual run: sudo systemctl start update-topology-scan"
-echo "⏸️  Stop timer: sudo systemctl stop update-topology-scan.timer"
+echo "📝 Check logs with: sudo journalctl -u topology-publisher -f"
+echo "🔍 Manual publish: sudo /usr/local/bin/update_topology_scan"
+echo "⏸️  Stop publisher: sudo systemctl stop topology-publisher"
@@ -8,17 +8,24 @@ echo "🔧 Setting up Firewall Log API service..."
 # 1. Install Python dependencies
 echo "📦 Installing Python dependencies..."
 sudo apt-get update
-sudo apt-get install -y python3-pip python3-flask python3-flask-cors
+sudo apt-get install -y python3-pip python3-flask python3-flask-cors python3-numpy gunicorn
 
 # If system packages not available, use pip with break-system-packages
 if ! dpkg -l | grep -q python3-flask-cors; then
     sudo pip3 install --break-system-packages flask flask-cors
 fi
+if ! python3 -c "import gunicorn" 2>/dev/null; then
+    sudo pip3 install --break-system-packages gunicorn
+fi
+if ! python3 -c "import numpy" 2>/dev/null; then
+    sudo pip3 install --break-system-packages numpy
+fi
 
-# 2. Copy API script to system location
-echo "📋 Installing API script..."
-sudo cp firewall_log_api.py /usr/local/bin/firewall_log_api
-sudo chmod +x /usr/local/bin/firewall_log_api
+# 2. Copy API scripts to system location
+echo "📋 Installing API scripts..."
+sudo mkdir -p /opt/firewall-log-api
+sudo cp firewall_log_api.py api_metrics.py log_store.py parallel_scan.py scan_history.py traffic_summary.py write_topology_data.py topology_validation.py topology_publisher.py gunicorn.conf.py /opt/firewall-log-api/
+sudo chmod +x /opt/firewall-log-api/firewall_log_api.py
 
 # 3. Create systemd service
 echo "⚙️  Creating systemd service..."
@@ -30,8 +37,17 @@ After=network.target
 [Service]
 Type=simple
 User=ubuntu
-WorkingDirectory=/home/ubuntu
-ExecStart=/usr/bin/python3 /usr/local/bin/firewall_log_api
+WorkingDirectory=/opt/firewall-log-api
+# Worker processes/threads and timeouts (see gunicorn.conf.py for all settings)
+Environment=FIREWALL_API_WORKERS=$(( $(nproc) * 2 + 1 ))
+Environment=FIREWALL_API_THREADS=8
+Environment=FIREWALL_API_TIMEOUT=60
+Environment=FIREWALL_API_GRACEFUL_TIMEOUT=30
+ExecStart=/usr/bin/python3 -m gunicorn -c /opt/firewall-log-api/gunicorn.conf.py firewall_log_api:app
+# HUP replaces the workers one by one without dropping the listening socket
+ExecReload=/bin/kill -HUP \$MAINPID
+KillSignal=SIGTERM
+TimeoutStopSec=40
 Restart=always
 RestartSec=3
 StandardOutput=journal
@@ -57,6 +73,7 @@ echo ""
 echo "📝 Useful commands:"
 echo "  • View logs:       sudo journalctl -u firewall-log-api -f"
 echo "  • Restart service: sudo systemctl restart firewall-log-api"
+echo "  • Reload workers:  sudo systemctl reload firewall-log-api"
 echo "  • Stop service:    sudo systemctl stop firewall-log-api"
 echo "  • Test API:        curl http://localhost:5000/api/health"
 echo ""
@@ -0,0 +1,446 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import firewall_log_api
+from firewall_log_api import LogOffsetIndex, ResultCache, read_lines_reverse
+from log_store import LogStore
+from write_topology_data import write_precompressed_artifacts
+
+
+def log_line(n, mac):
+    return f'Oct 16 10:00:00 fw kernel: src_port="{n}" src_mac="{mac}" dst_mac="11:22:33:44:55:66"\n'
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'firewall.log')
+
+
+def offsets_for(index, mac):
+    return list(index.iter_offsets(mac))
+
+
+class TestLogOffsetIndex:
+    def test_refresh_indexes_only_appended_lines(self, log_path):
+        with open(log_path, 'w') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:01') + log_line(1, 'aa:bb:cc:dd:ee:02'))
+        index = LogOffsetIndex(log_path, log_path + '.macidx')
+
+        assert index.refresh() == 2
+        assert index.refresh() == 0
+
+        size = os.path.getsize(log_path)
+        with open(log_path, 'a') as f:
+            f.write(log_line(2, 'AA-BB-CC-DD-EE-01'))
+        assert index.refresh() == 1
+        assert offsets_for(index, 'AABBCCDDEE01') == [size, 0]
+        assert index.pending_bytes() == 0
+
+    def test_partial_last_line_is_indexed_once_complete(self, log_path):
+        with open(log_path, 'w') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:01') + log_line(1, 'aa:bb:cc:dd:ee:01').rstrip('\n'))
+        index = LogOffsetIndex(log_path, log_path + '.macidx')
+
+        assert index.refresh() == 1
+        assert len(offsets_for(index, 'AABBCCDDEE01')) == 1
+
+        with open(log_path, 'a') as f:
+            f.write('\n')
+        assert index.refresh() == 1
+        assert len(offsets_for(index, 'AABBCCDDEE01')) == 2
+
+    def test_rotation_rebuilds_the_index(self, log_path):
+        with open(log_path, 'w') as f:
+            f.write(''.join(log_line(n, 'aa:bb:cc:dd:ee:01') for n in range(3)))
+        index = LogOffsetIndex(log_path, log_path + '.macidx')
+        index.refresh()
+
+        os.rename(log_path, log_path + '.1')
+        with open(log_path, 'w') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:02'))
+        assert index.pending_bytes() == os.path.getsize(log_path)
+
+        assert index.refresh() == 1
+        assert offsets_for(index, 'AABBCCDDEE01') == []
+        assert offsets_for(index, 'AABBCCDDEE02') == [0]
+
+    def test_truncation_rebuilds_the_index(self, log_path):
+        with open(log_path, 'w') as f:
+            f.write(''.join(log_line(n, 'aa:bb:cc:dd:ee:01') for n in range(3)))
+        index = LogOffsetIndex(log_path, log_path + '.macidx')
+        index.refresh()
+
+        with open(log_path, 'w') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:02'))
+        assert index.refresh() == 1
+        assert offsets_for(index, 'AABBCCDDEE01') == []
+        assert index.read_lines(offsets_for(index, 'AABBCCDDEE02')) == [log_line(0, 'aa:bb:cc:dd:ee:02')]
+
+    def test_refresh_past_deadline_keeps_progress(self, log_path, monkeypatch):
+        monkeypatch.setattr('firewall_log_api.DEADLINE_CHECK_LINES', 2)
+        with open(log_path, 'w') as f:
+            f.write(''.join(log_line(n, 'aa:bb:cc:dd:ee:01') for n in range(10)))
+        index = LogOffsetIndex(log_path, log_path + '.macidx')
+
+        # The deadline is still ahead when the refresh starts and has passed at the first check
+        clock = iter([0.0])
+        monkeypatch.setattr('firewall_log_api.time.monotonic', lambda: next(clock, 100.0))
+        with pytest.raises(TimeoutError):
+            index.refresh(deadline=50.0)
+        monkeypatch.undo()
+        indexed = len(offsets_for(index, 'AABBCCDDEE01'))
+        assert 0 < indexed < 10
+        assert index.refresh() == 10 - indexed
+
+
+class TestReadLinesReverse:
+    @pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64])
+    def test_lines_across_chunk_boundaries(self, tmp_path, chunk_size):
+        lines = [b'first', b'', b'a much longer third line', b'x', b'last']
+        path = tmp_path / 'log'
+        path.write_bytes(b'\n'.join(lines) + b'\n')
+
+        assert list(read_lines_reverse(str(path), chunk_size)) == lines[::-1]
+
+    @pytest.mark.parametrize('chunk_size', [1, 4, 64])
+    def test_incomplete_last_line_is_skipped(self, tmp_path, chunk_size):
+        path = tmp_path / 'log'
+        path.write_bytes(b'one\ntwo\nstill being writt')
+
+        assert list(read_lines_reverse(str(path), chunk_size)) == [b'two', b'one']
+
+    def test_file_without_newline_or_empty(self, tmp_path):
+        path = tmp_path / 'log'
+        path.write_bytes(b'partial')
+        assert list(read_lines_reverse(str(path), 3)) == []
+
+        path.write_bytes(b'')
+        assert list(read_lines_reverse(str(path), 3)) == []
+
+
+@pytest.fixture
+def api_log(tmp_path, monkeypatch):
+    """Point the API at an empty firewall.log in tmp_path; returns its path"""
+    path = str(tmp_path / 'firewall.log')
+    open(path, 'w').close()
+    monkeypatch.setattr(firewall_log_api, 'LOG_FILE', path)
+    monkeypatch.setattr(firewall_log_api, 'log_index', LogOffsetIndex(path, path + '.macidx'))
+    return path
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+class TestRotatedSegments:
+    def test_first_lookup_after_rotation_reads_unsummarized_segments(self, api_log):
+        with open(api_log, 'w') as f:
+            f.write(log_line(2, 'aa:bb:cc:dd:ee:01'))
+        with open(api_log + '.1', 'w') as f:
+            f.write(log_line(1, 'aa:bb:cc:dd:ee:01') + log_line(1, 'aa:bb:cc:dd:ee:02'))
+        with gzip.open(api_log + '.2.gz', 'wt') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:01'))
+        os.utime(api_log + '.1', (time.time() - 100,) * 2)
+        os.utime(api_log + '.2.gz', (time.time() - 200,) * 2)
+
+        logs, segments_read, segments_skipped = firewall_log_api.device_logs_all_segments('AABBCCDDEE01')
+        assert [log.src_port for log in logs] == ['2', '1', '0']
+        assert (segments_read, segments_skipped) == (3, 0)
+
+        # Summaries are built in the background; later lookups skip segments that can't match
+        for segment in (api_log + '.1', api_log + '.2.gz'):
+            wait_for(lambda: os.path.exists(segment + firewall_log_api.SEGMENT_SUMMARY_SUFFIX))
+        wait_for(lambda: firewall_log_api._summary_builder is None)
+        logs, segments_read, segments_skipped = firewall_log_api.device_logs_all_segments('AABBCCDDEE02')
+        assert len(logs) == 1
+        assert (segments_read, segments_skipped) == (2, 1)
+
+    def test_unsummarized_segment_respects_the_deadline(self, api_log, monkeypatch):
+        monkeypatch.setattr(firewall_log_api, 'build_segment_summaries_in_background', lambda paths: None)
+        with gzip.open(api_log + '.1.gz', 'wt') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:01'))
+
+        with pytest.raises(TimeoutError):
+            firewall_log_api.device_logs_all_segments('AABBCCDDEE01', deadline=time.monotonic() - 1)
+
+
+class TestBatchEndpoint:
+    @pytest.fixture
+    def client(self, api_log):
+        with open(api_log, 'w') as f:
+            f.write(log_line(4, 'aa:bb:cc:dd:ee:02') + log_line(5, 'aa:bb:cc:dd:ee:01'))
+        with open(api_log + '.1', 'w') as f:
+            f.write(log_line(2, 'aa:bb:cc:dd:ee:01') + log_line(3, 'aa:bb:cc:dd:ee:01'))
+        with gzip.open(api_log + '.2.gz', 'wt') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:03') + log_line(1, 'aa:bb:cc:dd:ee:01'))
+        os.utime(api_log + '.1', (time.time() - 100,) * 2)
+        os.utime(api_log + '.2.gz', (time.time() - 200,) * 2)
+        return firewall_log_api.app.test_client()
+
+    def test_matches_single_mac_endpoint_across_segments(self, client):
+        response = client.post('/api/logs/batch', json={'macs': ['aa:bb:cc:dd:ee:01', 'AA-BB-CC-DD-EE-03']})
+        assert response.status_code == 200
+        devices = response.get_json()['devices']
+
+        for mac in ('aa:bb:cc:dd:ee:01', 'AA-BB-CC-DD-EE-03'):
+            single = client.get(f'/api/logs/{mac}').get_json()['logs']
+            assert devices[mac]['logs'] == single
+        assert [log['src_port'] for log in devices['aa:bb:cc:dd:ee:01']['logs']] == ['5', '3', '2', '1']
+        assert devices['aa:bb:cc:dd:ee:01']['total'] == 4
+        assert devices['AA-BB-CC-DD-EE-03']['count'] == 1
+
+    def test_rotated_segments_are_only_read_to_fill_the_limit(self, client):
+        response = client.post('/api/logs/batch', json={'macs': ['aa:bb:cc:dd:ee:01'], 'limit': 2})
+        device = response.get_json()['devices']['aa:bb:cc:dd:ee:01']
+        assert [log['src_port'] for log in device['logs']] == ['5', '3']
+        assert device['total'] == 3
+
+    def test_rejects_bad_bodies(self, client):
+        assert client.post('/api/logs/batch', json={'macs': 'aa:bb:cc:dd:ee:01'}).status_code == 400
+        assert client.post('/api/logs/batch', json={'macs': [], 'limit': 'x'}).status_code == 400
+        assert client.post('/api/logs/batch', json={'macs': [], 'shape': 'table'}).status_code == 400
+
+
+class TestQueryEndpoint:
+    @pytest.fixture
+    def client(self, api_log, tmp_path, monkeypatch):
+        monkeypatch.setattr(firewall_log_api, 'log_store',
+                            LogStore(str(tmp_path / 'store'), firewall_log_api.LOG_FIELD_DEFAULTS))
+        with open(api_log, 'w') as f:
+            for n in range(6):
+                severity = 'Alert' if n % 2 else 'Information'
+                f.write(f'2026-10-16T10:00:0{n}Z fw kernel: severity="{severity}" dst_port={n} '
+                        f'src_mac="aa:bb:cc:dd:ee:0{n % 3}" dst_mac="11:22:33:44:55:66"\n')
+        return firewall_log_api.app.test_client()
+
+    def test_filters_and_groups(self, client):
+        body = client.get('/api/logs/query?mac=AA-BB-CC-DD-EE-01&group_by=severity').get_json()
+        assert [log['dst_port'] for log in body['logs']] == ['4', '1']
+        assert body['total'] == 2
+        assert body['groups'] == [{'value': 'Information', 'count': 1}, {'value': 'Alert', 'count': 1}]
+
+        body = client.get('/api/logs/query?severity=Alert&since=2026-10-16T10:00:02Z&limit=1').get_json()
+        assert [log['dst_port'] for log in body['logs']] == ['5']
+        assert body['total'] == 2
+
+    def test_picks_up_appended_lines(self, client, api_log):
+        assert client.get('/api/logs/query?dst_port=9').get_json()['total'] == 0
+        with open(api_log, 'a') as f:
+            f.write('2026-10-16T10:00:09Z fw kernel: dst_port=9 src_mac="aa:bb:cc:dd:ee:09"\n')
+        assert client.get('/api/logs/query?dst_port=9').get_json()['total'] == 1
+
+    def test_rejects_bad_parameters(self, client):
+        assert client.get('/api/logs/query?since=yesterday').status_code == 400
+        assert client.get('/api/logs/query?dst_port=http').status_code == 400
+        assert client.get('/api/logs/query?group_by=timestamp').status_code == 400
+
+
+class TestPingBatchEndpoint:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        pinged = []
+
+        def fake_ping(ip_address, timeout=firewall_log_api.PING_TIMEOUT_SECONDS):
+            pinged.append((ip_address, timeout))
+            return {'success': True, 'ip': ip_address, 'packets_received': 1, 'output': '...'}
+
+        monkeypatch.setattr(firewall_log_api, 'run_ping', fake_ping)
+        monkeypatch.setattr(firewall_log_api, 'ping_cache', firewall_log_api.ResultCache(60))
+        client = firewall_log_api.app.test_client()
+        client.pinged = pinged
+        return client
+
+    def sweep(self, client, body):
+        response = client.post('/api/ping/batch', json=body)
+        return response.status_code, [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_streams_results_and_skips_invalid_entries(self, client):
+        status, lines = self.sweep(client, {'ips': ['10.0.0.1', ' 10.0.0.2', '10.0.0.1', 'not-an-ip', 7],
+                                            'timeout': 2})
+        assert status == 200
+        assert sorted(line['ip'] for line in lines[:-1]) == ['10.0.0.1', '10.0.0.2']
+        assert all('output' not in line for line in lines[:-1])
+        assert lines[-1] == {'done': True, 'count': 2, 'reachable': 2, 'skipped': ['not-an-ip', '7']}
+        assert sorted(client.pinged) == [('10.0.0.1', 2), ('10.0.0.2', 2)]
+
+    @pytest.mark.parametrize('timeout', [0, -1, 'nan', float('inf'), 'soon', True, 11])
+    def test_rejects_timeouts_outside_the_allowed_range(self, client, timeout):
+        if timeout == 'nan':
+            timeout = float('nan')
+        response = client.post('/api/ping/batch', data=json.dumps({'ips': ['10.0.0.1'], 'timeout': timeout}),
+                               content_type='application/json')
+        assert response.status_code == 400
+        assert client.pinged == []
+
+    def test_rejects_oversized_batches_before_validating_entries(self, client, monkeypatch):
+        monkeypatch.setattr(firewall_log_api, 'MAX_PING_BATCH', 2)
+        status, lines = self.sweep(client, {'ips': ['10.0.0.1', 'bad', 'bad']})
+        assert status == 400
+        assert 'Too many targets' in lines[0]['error']
+
+
+class TestResultCache:
+    def test_hit_until_version_changes(self):
+        cache = ResultCache(ttl=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        assert cache.get_or_compute('key', compute, version=1) == 1
+        assert cache.get_or_compute('key', compute, version=1) == 1
+        assert cache.get_or_compute('key', compute, version=2) == 2
+        assert cache.stats() == {'entries': 1, 'hits': 1, 'misses': 2, 'coalesced': 0}
+
+    def test_entries_expire(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('firewall_log_api.time.monotonic', lambda: now[0])
+        cache = ResultCache(ttl=5)
+        values = iter([1, 2])
+
+        assert cache.get_or_compute('key', lambda: next(values)) == 1
+        now[0] += 4
+        assert cache.get_or_compute('key', lambda: next(values)) == 1
+        now[0] += 2
+        assert cache.get_or_compute('key', lambda: next(values)) == 2
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResultCache(ttl=60, max_entries=2)
+        cache.get_or_compute('a', lambda: 'a')
+        cache.get_or_compute('b', lambda: 'b')
+        cache.get_or_compute('a', lambda: 'stale')
+        cache.get_or_compute('c', lambda: 'c')
+
+        assert cache.get_or_compute('a', lambda: 'recomputed') == 'a'
+        assert cache.get_or_compute('b', lambda: 'recomputed') == 'recomputed'
+
+    def test_concurrent_requests_share_one_computation(self):
+        cache = ResultCache(ttl=60)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+                   for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while cache.stats()['coalesced'] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert results == ['value'] * 4
+        assert len(calls) == 1
+
+    def test_errors_reach_waiters_but_are_not_cached(self):
+        cache = ResultCache(ttl=60)
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise RuntimeError('boom')
+
+        errors = []
+
+        def call():
+            try:
+                cache.get_or_compute('key', failing)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        waiter = threading.Thread(target=call)
+        waiter.start()
+        while cache.stats()['coalesced'] < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        assert errors == ['boom', 'boom']
+        assert cache.get_or_compute('key', lambda: 'ok') == 'ok'
+
+    def test_device_logs_cache_sees_rotation(self, api_log, monkeypatch):
+        monkeypatch.setattr(firewall_log_api, 'device_logs_cache', ResultCache(60))
+        client = firewall_log_api.app.test_client()
+        with open(api_log, 'w') as f:
+            f.write(log_line(0, 'aa:bb:cc:dd:ee:01'))
+        assert len(client.get('/api/logs/aa:bb:cc:dd:ee:01').get_json()['logs']) == 1
+
+        # Rotated segment appears while the live log is recreated with the same size and mtime
+        st = os.stat(api_log)
+        with open(api_log + '.1', 'w') as f:
+            f.write(log_line(1, 'aa:bb:cc:dd:ee:01'))
+        os.utime(api_log + '.1', (st.st_mtime - 100,) * 2)
+        assert len(client.get('/api/logs/aa:bb:cc:dd:ee:01').get_json()['logs']) == 2
+
+
+class TestTopologyEndpoint:
+    @pytest.fixture
+    def topology(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'raw_data_complete.json')
+        with open(path, 'w') as f:
+            json.dump({'data': {'devices': {'count': 1, 'records': [{'id': 1}]}}}, f)
+        monkeypatch.setattr(firewall_log_api, 'TOPOLOGY_FILE', path)
+        monkeypatch.setattr(firewall_log_api, 'topology_hash_cache', ResultCache(60))
+        return path
+
+    def test_precompressed_sibling_with_its_own_etag(self, topology):
+        content_hash = write_precompressed_artifacts(topology)
+        client = firewall_log_api.app.test_client()
+
+        response = client.get('/api/topology', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['ETag'] == f'"{content_hash}-gzip"'
+        assert gzip.decompress(response.get_data()) == open(topology, 'rb').read()
+
+        response = client.get('/api/topology')
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['ETag'] == f'"{content_hash}"'
+        assert response.get_json()['data']['devices']['count'] == 1
+
+    def test_not_modified_for_any_variant_of_the_current_hash(self, topology):
+        content_hash = write_precompressed_artifacts(topology)
+        client = firewall_log_api.app.test_client()
+
+        for etag in (content_hash, f'{content_hash}-gzip'):
+            response = client.get('/api/topology', headers={'If-None-Match': f'"{etag}"'})
+            assert response.status_code == 304
+        assert client.get('/api/topology', headers={'If-None-Match': '"other"'}).status_code == 200
+
+    def test_stale_siblings_are_ignored(self, topology):
+        write_precompressed_artifacts(topology)
+        # Rewritten without regenerating the siblings (e.g. by an older writer)
+        with open(topology, 'w') as f:
+            json.dump({'data': {}}, f)
+        os.utime(topology, (time.time() + 10,) * 2)
+        client = firewall_log_api.app.test_client()
+
+        response = client.get('/api/topology', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_json() == {'data': {}}
+        assert response.headers['ETag'] == f'"{hashlib.sha256(open(topology, "rb").read()).hexdigest()}"'
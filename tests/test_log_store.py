@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from log_store import Chunk, LogStore
+
+FIELDS = ('timestamp', 'severity', 'src_mac', 'dst_port')
+
+
+def record(n, severity='Information', mac='aa:bb:cc:dd:ee:01', port=''):
+    return {'timestamp': f't{n}', 'severity': severity, 'src_mac': mac, 'dst_port': port}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LogStore(str(tmp_path / 'store'), FIELDS, chunk_rows=4)
+    for n in range(10):
+        store.append(record(n, severity='Alert' if n % 3 == 0 else 'Information',
+                            mac=f'aa:bb:cc:dd:ee:0{n % 2}', port=str(n) if n % 2 else ''), epoch=float(n))
+    store.flush()
+    return store
+
+
+class TestLogStoreQuery:
+    def test_records_newest_first_across_chunks(self, store):
+        result = store.query(limit=5)
+        assert result['total'] == 10
+        assert [r['timestamp'] for r in result['records']] == ['t9', 't8', 't7', 't6', 't5']
+        assert result['records'][0] == {'timestamp': 't9', 'severity': 'Alert', 'src_mac': 'aa:bb:cc:dd:ee:01',
+                                         'dst_port': '9'}
+        assert result['records'][1]['dst_port'] == ''
+
+    def test_time_window_skips_chunks_from_the_manifest(self, store):
+        result = store.query(since=5, until=6)
+        assert [r['timestamp'] for r in result['records']] == ['t6', 't5']
+        assert result['chunks_scanned'] == 1
+        assert result['chunks_skipped'] == 2
+
+    def test_where_and_where_any_filters(self, store):
+        result = store.query(where={'severity': lambda v: v == 'Alert', 'dst_port': lambda v: v > 0})
+        assert [r['timestamp'] for r in result['records']] == ['t9', 't3']
+
+        result = store.query(where_any=(('src_mac', 'severity'), lambda v: v in ('aa:bb:cc:dd:ee:00', 'Alert')))
+        assert [r['timestamp'] for r in result['records']] == ['t9', 't8', 't6', 't4', 't3', 't2', 't0']
+
+    def test_chunk_ruled_out_by_dictionary(self, store):
+        result = store.query(where={'severity': lambda v: v == 'Debug'})
+        assert result['total'] == 0
+        assert result['chunks_scanned'] == 0
+
+    def test_group_by_counts_every_match_beyond_the_limit(self, store):
+        result = store.query(limit=1, group_by='severity')
+        assert len(result['records']) == 1
+        assert result['groups'] == [{'value': 'Information', 'count': 6}, {'value': 'Alert', 'count': 4}]
+
+        result = store.query(limit=0, group_by='dst_port', top=2)
+        assert result['groups'][0] == {'value': -1, 'count': 5}
+
+    def test_damaged_column_block_skips_the_chunk(self, store, capsys):
+        first = os.path.join(store.store_dir, store.manifest()['chunks'][0]['file'])
+        meta = Chunk(first).header['columns']['severity']
+        with open(first, 'r+b') as f:
+            f.seek(Chunk(first).data_start + meta['offset'])
+            f.write(b'\xff' * meta['length'])
+
+        result = store.query(limit=100)
+        assert result['chunks_skipped'] == 1
+        assert [r['timestamp'] for r in result['records']] == ['t9', 't8', 't7', 't6', 't5', 't4']
+        assert 'Skipping unreadable log store chunk' in capsys.readouterr().out
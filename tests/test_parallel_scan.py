@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+import parallel_scan
+from parallel_scan import scan_offsets, scan_slot
+from write_topology_data import normalize_mac
+
+MAC_A = 'aa:bb:cc:00:00:01'
+MAC_B = 'aa:bb:cc:00:00:02'
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'firewall.log'
+    with open(path, 'w') as f:
+        for i in range(2000):
+            mac = MAC_A if i % 3 else MAC_B
+            f.write(f'Oct 16 10:00:00 fw kernel: src_port="{i}" src_mac="{mac}" dst_mac="11:22:33:44:55:66"\n')
+    return str(path)
+
+
+class TestScanSlot:
+    def test_slots_limit_concurrent_holders(self, tmp_path):
+        slot_dir = str(tmp_path / 'slots')
+        holding = []
+        peak = []
+        lock = threading.Lock()
+
+        def hold():
+            with scan_slot(slot_dir, 2):
+                with lock:
+                    holding.append(1)
+                    peak.append(len(holding))
+                time.sleep(0.05)
+                with lock:
+                    holding.pop()
+
+        threads = [threading.Thread(target=hold) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(peak) == 5
+        assert max(peak) == 2
+
+    def test_waiting_for_a_slot_honours_the_deadline(self, tmp_path):
+        slot_dir = str(tmp_path / 'slots')
+        with scan_slot(slot_dir, 1):
+            with pytest.raises(TimeoutError):
+                with scan_slot(slot_dir, 1, deadline=time.time() + 0.05):
+                    pass
+
+        with scan_slot(slot_dir, 1, deadline=time.time() + 0.05):
+            pass  # Freed when its holder left
+
+
+class TestScanOffsets:
+    def test_pool_scan_through_slots_matches_in_process_scan(self, log_file, tmp_path, monkeypatch):
+        monkeypatch.setattr(parallel_scan, 'SCAN_SLOT_DIR', str(tmp_path / 'slots'))
+        monkeypatch.setattr(parallel_scan, 'SCAN_SLOTS', 1)
+        macs = [normalize_mac(MAC_A), normalize_mac(MAC_B)]
+        try:
+            pooled = scan_offsets(log_file, macs, workers=2, min_parallel_bytes=0, timeout=60)
+        finally:
+            parallel_scan.shutdown_pool()
+
+        assert pooled == scan_offsets(log_file, macs, workers=1)
+        assert [len(pooled[mac]) for mac in macs] == [1333, 667]
@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from topology_publisher import BACKUP_SUFFIX, EXPORT_NAME, SOURCE_HASH_SUFFIX, TopologyPublisher, file_sha256
+from write_topology_data import MANIFEST_NAME, generate_sample_topology_data
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def web_files(publisher):
+    return sorted(os.listdir(os.path.dirname(publisher.target_path)))
+
+
+@pytest.fixture
+def scans(tmp_path):
+    def add_scan(name, data):
+        scan_dir = tmp_path / 'scans' / name
+        scan_dir.mkdir(parents=True)
+        (scan_dir / EXPORT_NAME).write_text(json.dumps(data))
+        return str(scan_dir / EXPORT_NAME)
+    return add_scan
+
+
+class TestCopyingPublish:
+    @pytest.fixture
+    def publisher(self, tmp_path):
+        target = tmp_path / 'web' / 'raw_data_complete.json'
+        target.parent.mkdir()
+        target.write_text('{"old": true}')
+        (tmp_path / 'web' / ('raw_data_complete.json' + BACKUP_SUFFIX)).write_text('{"older": true}')
+        return TopologyPublisher(scans_dir=str(tmp_path / 'scans'), target_path=str(target), validate=False)
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        path = tmp_path / 'export.json'
+        path.write_text(json.dumps(generate_sample_topology_data()))
+        return str(path)
+
+    def test_copy_replaces_snapshot_and_keeps_previous_as_backup(self, publisher, source):
+        publisher._copy(source, file_sha256(source))
+
+        assert read(publisher.target_path) == read(source)
+        assert read(publisher.target_path + BACKUP_SUFFIX) == '{"old": true}'
+        assert read(publisher.target_path + '.sha256').strip() == file_sha256(source)
+        assert not any(name.endswith('.tmp') for name in web_files(publisher))
+
+    def test_changed_source_leaves_snapshot_and_backup_untouched(self, publisher, source):
+        before = web_files(publisher)
+
+        with pytest.raises(ValueError, match='changed while it was being published'):
+            publisher._copy(source, '0' * 64)
+
+        assert read(publisher.target_path) == '{"old": true}'
+        assert read(publisher.target_path + BACKUP_SUFFIX) == '{"older": true}'
+        assert web_files(publisher) == before
+
+    def test_missing_source_leaves_no_pending_backup(self, publisher, tmp_path):
+        before = web_files(publisher)
+
+        with pytest.raises(FileNotFoundError):
+            publisher._copy(str(tmp_path / 'missing.json'), '0' * 64)
+
+        assert read(publisher.target_path + BACKUP_SUFFIX) == '{"older": true}'
+        assert web_files(publisher) == before
+
+    def test_stale_pending_backup_is_replaced(self, publisher, source):
+        with open(publisher.target_path + BACKUP_SUFFIX + '.tmp', 'w') as f:
+            f.write('left over from a crash')
+
+        publisher._copy(source, file_sha256(source))
+
+        assert read(publisher.target_path + BACKUP_SUFFIX) == '{"old": true}'
+        assert not os.path.exists(publisher.target_path + BACKUP_SUFFIX + '.tmp')
+
+    def test_first_publish_has_no_backup(self, tmp_path, source):
+        publisher = TopologyPublisher(scans_dir=str(tmp_path / 'scans'),
+                                      target_path=str(tmp_path / 'web' / 'raw_data_complete.json'), validate=False)
+
+        publisher._copy(source, file_sha256(source))
+
+        assert read(publisher.target_path) == read(source)
+        assert not os.path.exists(publisher.target_path + BACKUP_SUFFIX)
+
+
+class TestRewritingPublish:
+    @pytest.fixture
+    def publisher(self, tmp_path):
+        return TopologyPublisher(scans_dir=str(tmp_path / 'scans'),
+                                 target_path=str(tmp_path / 'web' / 'raw_data_complete.json'),
+                                 validate=False, layout=True, delta=True)
+
+    def test_layout_and_patch_are_published(self, publisher, scans):
+        data = generate_sample_topology_data()
+        scans('scan_1', data)
+        assert publisher.publish('scan_1')
+
+        published = json.loads(read(publisher.target_path))
+        assert len(published['data']['layout']['positions']) == len(data['data']['devices']['records'])
+        assert json.loads(read(publisher.target_path + '.clusters.json'))['source_hash'] == \
+            read(publisher.target_path + '.sha256').strip()
+
+        data['data']['devices']['records'][0]['ip'] = '10.99.0.1'
+        source = scans('scan_2', data)
+        assert publisher.publish('scan_2')
+
+        manifest = json.loads(read(os.path.join(os.path.dirname(publisher.target_path), MANIFEST_NAME)))
+        assert manifest['version'] == 2
+        assert [(p['from_version'], p['to_version']) for p in manifest['patches']] == [(1, 2)]
+        assert read(publisher.target_path + SOURCE_HASH_SUFFIX).strip() == file_sha256(source)
+        assert json.loads(read(publisher.target_path + BACKUP_SUFFIX))['data']['layout']
+
+    def test_unchanged_export_is_not_rewritten(self, publisher, scans, capsys):
+        data = generate_sample_topology_data()
+        scans('scan_1', data)
+        scans('scan_2', data)
+        assert publisher.publish('scan_1')
+        mtime = os.stat(publisher.target_path).st_mtime_ns
+
+        assert publisher.publish('scan_2')
+        assert 'scan_2 is unchanged' in capsys.readouterr().out
+        assert os.stat(publisher.target_path).st_mtime_ns == mtime
+        assert not os.path.exists(publisher.target_path + BACKUP_SUFFIX)
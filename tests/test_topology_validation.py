@@ -0,0 +1,89 @@
+import io
+import json
+
+import pytest
+
+from topology_validation import JsonStreamReader, validate_export
+from write_topology_data import generate_sample_topology_data
+
+DOCUMENT = {
+    'export_type': 'COMPLETE_RAW_SCAN_DATA',
+    'data': {
+        'devices': {'count': 2, 'records': [
+            {'id': 1, 'name': 'swéitch \\"core\\"', 'confidence': 95.5, 'ratio': -1.25e-3, 'up': True},
+            {'id': 22, 'name': None, 'confidence': 12345678901234, 'tags': [], 'extra': {}},
+        ]},
+    },
+}
+
+
+def read_document(reader):
+    """Walk the whole document with the pull API, decoding each leaf with value()"""
+    def read():
+        char = reader.peek()
+        if char == '{':
+            return {key: read() for key in reader.iter_object()}
+        if char == '[':
+            return [read() for _ in reader.iter_array()]
+        return reader.value()
+    return read()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1024])
+def test_tokens_split_across_chunks(chunk_size):
+    text = json.dumps(DOCUMENT, indent=1)
+    reader = JsonStreamReader(io.StringIO(text), chunk_size)
+
+    assert read_document(reader) == DOCUMENT
+    assert reader.peek() == ''
+    assert reader.offset == len(text)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3])
+def test_number_cut_at_chunk_boundary_is_not_truncated(chunk_size):
+    reader = JsonStreamReader(io.StringIO('[12.5e3, -0.001, 7]'), chunk_size)
+
+    assert [reader.value() for _ in reader.iter_array()] == [12.5e3, -0.001, 7]
+
+
+def test_subtree_decoded_whole_with_value():
+    text = json.dumps({'layout': {'positions': {'a': [1.5, 2.5, 1]}}, 'after': 1})
+    reader = JsonStreamReader(io.StringIO(text), 4)
+
+    keys = []
+    for key in reader.iter_object():
+        keys.append((key, reader.value()))
+    assert keys == [('layout', {'positions': {'a': [1.5, 2.5, 1]}}), ('after', 1)]
+
+
+@pytest.mark.parametrize('text', ['{"a": 1', '{"a": tru}', '[1, 2'])
+def test_truncated_input_raises(text):
+    reader = JsonStreamReader(io.StringIO(text), 2)
+
+    with pytest.raises(ValueError):
+        read_document(reader)
+
+
+def test_large_value_is_not_decoded_once_per_chunk():
+    text = json.dumps({'layout': {str(n): [n, n + 0.5] for n in range(5000)}})
+    reader = JsonStreamReader(io.StringIO(text), 64)
+    calls = []
+    raw_decode = reader._decoder.raw_decode
+    reader._decoder.raw_decode = lambda *args: calls.append(1) or raw_decode(*args)
+
+    assert [(key, len(reader.value())) for key in reader.iter_object()] == [('layout', 5000)]
+    # One attempt per doubling of the buffer, not one per 64-character chunk
+    assert len(calls) < 20
+
+
+def test_duplicate_device_mac_is_a_warning():
+    data = generate_sample_topology_data()
+    devices = data['data']['devices']['records']
+    devices[1]['mac'] = devices[0]['mac'].upper()
+
+    validator = validate_export(data)
+    assert validator.valid
+    assert any('duplicates MAC' in warning for warning in validator.warnings)
+
+    devices[1]['id'] = devices[0]['id']
+    assert not validate_export(data).valid
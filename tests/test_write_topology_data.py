@@ -0,0 +1,177 @@
+import copy
+import hashlib
+import json
+
+import pytest
+
+from write_topology_data import (
+    CLUSTER_SUFFIX, UNKNOWN_MAC, apply_topology_patch, build_cluster_index, diff_topology, record_key,
+    write_topology_stream
+)
+
+
+def export(devices, connections=(), **fields):
+    document = {
+        'export_type': 'COMPLETE_RAW_SCAN_DATA',
+        'data': {
+            'devices': {'count': len(devices), 'records': list(devices)},
+            'connections': {'count': len(connections), 'records': list(connections)},
+        },
+    }
+    document.update(fields)
+    return document
+
+
+class TestRecordKey:
+    def test_devices_are_keyed_by_normalized_mac(self):
+        assert record_key('devices', {'id': 1, 'mac': 'aa:bb:cc:dd:ee:ff'}) == 'AABBCCDDEEFF'
+        assert record_key('devices', {'id': 2, 'mac': 'AA-BB-CC-DD-EE-FF'}) == 'AABBCCDDEEFF'
+
+    def test_devices_without_a_real_mac_fall_back_to_id(self):
+        assert record_key('devices', {'id': 7, 'mac': UNKNOWN_MAC}) == '7'
+        assert record_key('devices', {'id': 8, 'mac': 'unknown mac'}) == '8'
+        assert record_key('devices', {'id': 9, 'mac': ''}) == '9'
+        assert record_key('devices', {'id': 10}) == '10'
+
+    def test_other_sections_are_keyed_by_id(self):
+        assert record_key('connections', {'id': 3, 'mac': 'aa:bb:cc:dd:ee:ff'}) == '3'
+
+
+class TestDiffTopology:
+    def test_added_removed_and_changed_records(self):
+        old = export([
+            {'id': 1, 'mac': 'aa:bb:cc:dd:ee:01', 'ip': '10.0.0.1'},
+            {'id': 2, 'mac': 'aa:bb:cc:dd:ee:02', 'ip': '10.0.0.2'},
+        ])
+        new = export([
+            {'id': 1, 'mac': 'aa:bb:cc:dd:ee:01', 'ip': '10.0.0.9'},
+            {'id': 3, 'mac': 'aa:bb:cc:dd:ee:03', 'ip': '10.0.0.3'},
+        ])
+
+        devices = diff_topology(old, new)['records']['devices']
+        assert devices['added'] == [new['data']['devices']['records'][1]]
+        assert devices['removed'] == ['AABBCCDDEE02']
+        assert devices['changed'] == [new['data']['devices']['records'][0]]
+
+    def test_unknown_mac_devices_are_tracked_separately(self):
+        old = export([
+            {'id': 1, 'mac': UNKNOWN_MAC, 'ip': '10.0.0.1'},
+            {'id': 2, 'mac': UNKNOWN_MAC, 'ip': '10.0.0.2'},
+        ])
+        new = export([
+            {'id': 1, 'mac': UNKNOWN_MAC, 'ip': '10.0.0.1'},
+            {'id': 2, 'mac': UNKNOWN_MAC, 'ip': '10.0.0.5'},
+            {'id': 4, 'mac': UNKNOWN_MAC, 'ip': '10.0.0.4'},
+        ])
+
+        devices = diff_topology(old, new)['records']['devices']
+        assert [r['id'] for r in devices['added']] == [4]
+        assert devices['removed'] == []
+        assert [r['id'] for r in devices['changed']] == [2]
+
+    def test_identical_exports_produce_an_empty_patch(self):
+        old = export([{'id': 1, 'mac': 'aa:bb:cc:dd:ee:01'}], [{'id': 1, 'device_id': 1}])
+
+        patch = diff_topology(old, old)
+        assert patch['top_level'] == {}
+        assert patch['data'] == {}
+        assert patch['removed_data'] == []
+        for section in patch['records'].values():
+            assert section == {'key': 'record', 'added': [], 'removed': [], 'changed': []}
+
+    def test_non_record_fields_are_carried_whole(self):
+        old = export([], export_timestamp='2026-01-01T00:00:00')
+        old['data']['scan_metadata'] = {'duration': 1}
+        old['data']['obsolete'] = True
+        new = export([], export_timestamp='2026-01-02T00:00:00')
+        new['data']['scan_metadata'] = {'duration': 2}
+
+        patch = diff_topology(old, new)
+        assert patch['top_level'] == {'export_timestamp': '2026-01-02T00:00:00'}
+        assert patch['data'] == {'scan_metadata': {'duration': 2}}
+        assert patch['removed_data'] == ['obsolete']
+
+
+def device(id_, mac, ip):
+    return {'id': id_, 'mac': mac, 'ip': ip}
+
+
+class TestApplyTopologyPatch:
+    @pytest.mark.parametrize('old_devices, new_devices', [
+        # Add, remove, change
+        ([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:02', '10.0.0.2')],
+         [device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.9'), device(3, 'aa:bb:cc:dd:ee:03', '10.0.0.3')]),
+        # Reordered
+        ([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:02', '10.0.0.2')],
+         [device(2, 'aa:bb:cc:dd:ee:02', '10.0.0.2'), device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1')]),
+        # Two devices reporting one MAC: matched by id instead
+        ([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:01', '10.0.0.2')],
+         [device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:01', '10.0.0.7'),
+          device(3, 'aa:bb:cc:dd:ee:03', '10.0.0.3')]),
+        # Duplicate MAC appears only in the new scan
+        ([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:02', '10.0.0.2')],
+         [device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:01', '10.0.0.2')]),
+        # Neither MAC nor id unique: the section is replaced
+        ([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.2')],
+         [device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.3'), device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.2')]),
+        # Unknown MACs are keyed by id
+        ([device(1, UNKNOWN_MAC, '10.0.0.1'), device(2, UNKNOWN_MAC, '10.0.0.2')],
+         [device(2, UNKNOWN_MAC, '10.0.0.5'), device(4, UNKNOWN_MAC, '10.0.0.4')]),
+    ])
+    def test_patch_turns_old_into_new(self, old_devices, new_devices):
+        old = export(old_devices, [{'id': 1, 'device_id': 1}], export_timestamp='2026-01-01T00:00:00', stale=True)
+        new = export(new_devices, [{'id': 1, 'device_id': 2}], export_timestamp='2026-01-02T00:00:00')
+        old['data']['obsolete'] = True
+        new['data']['scan_metadata'] = {'duration': 2}
+        original = copy.deepcopy(old)
+
+        assert apply_topology_patch(old, diff_topology(old, new)) == new
+        assert old == original
+
+    def test_duplicate_macs_are_not_collapsed(self):
+        old = export([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1')])
+        new = export([device(1, 'aa:bb:cc:dd:ee:01', '10.0.0.1'), device(2, 'aa:bb:cc:dd:ee:01', '10.0.0.2')])
+
+        devices = diff_topology(old, new)['records']['devices']
+        assert devices['key'] == 'id'
+        assert devices['added'] == [new['data']['devices']['records'][1]]
+
+
+class TestClusterIndex:
+    devices = [
+        {'id': 1, 'mac': 'aa:bb:cc:dd:ee:01', 'type': 'Switch', 'name': 'core', 'network': '10.0.0.0/24'},
+        {'id': 2, 'mac': 'aa:bb:cc:dd:ee:02', 'type': 'ACTIVE host', 'network': '10.0.0.0/24'},
+        {'id': 3, 'mac': 'aa:bb:cc:dd:ee:03', 'type': 'Printer', 'network': '10.0.1.0/24'},
+        {'id': 4, 'mac': UNKNOWN_MAC, 'type': 'Printer'},
+    ]
+    connections = [
+        {'id': 1, 'device_id': 1, 'mac_address': 'AA-BB-CC-DD-EE-02'},
+        {'id': 2, 'device_id': 1, 'mac_address': 'aa:bb:cc:dd:ee:03'},
+        {'id': 3, 'device_id': 1, 'mac_address': 'aa:bb:cc:dd:ee:99'},
+    ]
+
+    def test_views_and_adjacency(self):
+        index = build_cluster_index(export(self.devices, self.connections), 'hash')
+
+        assert index['source_hash'] == 'hash'
+        assert index['adjacency'] == {'1': ['2', '3'], '2': ['1'], '3': ['1']}
+        switch = index['views']['switch']
+        assert switch['membership'] == {'1': 'switch:1', '2': 'switch:1', '3': 'switch:1', '4': 'switch:none'}
+        assert switch['clusters']['switch:1'] == {
+            'id': 'switch:1', 'label': 'core', 'device_count': 3, 'active_count': 2, 'l2_only_count': 1,
+            'types': {'Switch': 1, 'ACTIVE host': 1, 'Printer': 1}, 'members': [1, 2, 3]
+        }
+        network = index['views']['network']
+        assert list(network['clusters']) == ['net:10.0.0.0/24', 'net:10.0.1.0/24', 'net:unknown']
+        assert network['links'] == [{'source': 'net:10.0.0.0/24', 'target': 'net:10.0.1.0/24', 'count': 1}]
+
+    def test_streamed_export_writes_the_same_index(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('write_topology_data.CLUSTER_BATCH_ROWS', 2)
+        target = str(tmp_path / 'raw_data_complete.json')
+
+        assert write_topology_stream(iter(self.devices), iter(self.connections), target_path=target)
+        with open(target, 'rb') as f:
+            payload = f.read()
+        with open(target + CLUSTER_SUFFIX) as f:
+            streamed = json.load(f)
+        assert streamed == build_cluster_index(json.loads(payload), hashlib.sha256(payload).hexdigest())
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Server-side Topology Layout
+Precomputes node positions for the NetTopo Visualizer so the browser can
+render a large topology without running a d3 force simulation.
+
+The model mirrors components/TopologyGraph.tsx: node IDs are the device MAC
+(or dev-<id>), L2-only peers become ghost nodes, the hub (a Switch, else the
+best-connected node) is pinned at the origin, active hosts settle on a ring
+at ACTIVE_RING_RADIUS and inactive/L2 nodes at OUTER_RING_RADIUS. Forces
+(link springs, many-body repulsion, collision, radial pull) are evaluated
+for all nodes at once with NumPy. Repulsion reaches only CHARGE_DISTANCE_MAX,
+so thousands of nodes spread along their ring instead of inflating it.
+
+Positions are relative to the hub and written to data.layout.positions as
+{node_id: [x, y, ring]} (ring 0 hub, 1 active, 2 inactive/L2). When the
+previous snapshot already has positions, those nodes stay put and only new
+nodes (or nodes whose ring changed) are placed, so the picture is stable
+between scans and the warm run is cheap.
+
+Usage:
+    python topology_layout.py raw_data_complete.json [--previous OLD.json] [--output OUT.json]
+"""
+
+import argparse
+import json
+import math
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+ACTIVE_RING_RADIUS = 200.0
+OUTER_RING_RADIUS = 350.0
+LINK_DISTANCE = 30.0
+LINK_STRENGTH = 0.2
+CHARGE_STRENGTH = -200.0
+COLLIDE_RADIUS = 20.0
+RADIAL_STRENGTH = 0.8
+VELOCITY_DECAY = 0.4
+ALPHA_MIN = 0.001
+LAYOUT_ITERATIONS = 300  # Same cooling schedule as d3 (alpha 1 -> 0.001)
+CHARGE_DISTANCE_MAX = 100.0  # Repulsion range (d3 distanceMax), keeps large rings near their radius
+EXACT_CHARGE_LIMIT = 512  # Above this, repulsion is approximated on a grid
+CHARGE_CELL_SIZE = 25.0  # Grid cell side for the approximation
+CHARGE_BLOCK_ROWS = 512  # Rows per pairwise block, bounds memory to ~rows*n floats
+LAYOUT_SEED = 7
+LAYOUT_ALGORITHM = "numpy-force-radial"
+
+
+def build_graph(data: Dict[str, Any]) -> Tuple[List[str], List[int], List[Tuple[int, int]], int]:
+    """
+    Build the node/link model the frontend uses.
+
+    Args:
+        data: Topology export (the full document with a 'data' section)
+
+    Returns:
+        (node_ids, ring per node (0 hub, 1 active, 2 outer), links as index pairs, hub index)
+    """
+    sections = data['data']
+    index: Dict[str, int] = {}
+    node_ids: List[str] = []
+    active: List[bool] = []
+    is_switch: List[bool] = []
+    device_nodes: Dict[Any, int] = {}
+
+    def add_node(node_id: str, node_active: bool, switch: bool) -> int:
+        index[node_id] = len(node_ids)
+        node_ids.append(node_id)
+        active.append(node_active)
+        is_switch.append(switch)
+        return index[node_id]
+
+    for device in sections['devices']['records']:
+        mac = device.get('mac')
+        node_id = mac if mac and mac != 'Unknown MAC' else f"dev-{device.get('id')}"
+        device_type = device.get('type') or ''
+        node_active = 'ACTIVE' in device_type or device_type == 'Switch'
+        # Later duplicates overwrite earlier ones in the client's Map; keep its first slot
+        if node_id in index:
+            i = index[node_id]
+            active[i], is_switch[i] = node_active, device_type == 'Switch'
+        else:
+            i = add_node(node_id, node_active, device_type == 'Switch')
+        device_nodes[device.get('id')] = i
+
+    links: List[Tuple[int, int]] = []
+    ghosts = set()
+    for conn in sections['connections']['records']:
+        source = device_nodes.get(conn.get('device_id'))
+        if source is None:
+            continue
+        target_id = conn.get('mac_address')
+        if target_id not in index:
+            ghosts.add(add_node(target_id, True, False))
+        links.append((source, index[target_id]))
+
+    degree = [0] * len(node_ids)
+    for s, t in links:
+        degree[s] += 1
+        degree[t] += 1
+    hub = 0
+    best = 0
+    for i in range(len(node_ids)):
+        if degree[i] > best:
+            best = degree[i]
+            hub = i
+        if is_switch[i]:
+            hub = i
+
+    rings = [0 if i == hub else (1 if active[i] and i not in ghosts else 2) for i in range(len(node_ids))]
+    return node_ids, rings, links, hub
+
+
+def ring_positions(count: int, radius: float) -> np.ndarray:
+    """Evenly spaced points on a circle, like the client's initial distribution"""
+    angles = np.arange(count) * (2 * math.pi / max(count, 1))
+    return np.column_stack((radius * np.cos(angles), radius * np.sin(angles)))
+
+
+def grid_charge_forces(pos: np.ndarray, rows: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Many-body repulsion for the given rows, with each grid cell of side
+    CHARGE_CELL_SIZE within CHARGE_DISTANCE_MAX acting as one body of its
+    node count at its centroid (a one-level Barnes-Hut approximation).
+    """
+    reach = int(math.ceil(CHARGE_DISTANCE_MAX / CHARGE_CELL_SIZE))
+    # Cell coordinates padded by `reach`, so every neighbour of a node's cell is on the grid
+    cells = np.floor(pos / CHARGE_CELL_SIZE).astype(np.int64)
+    cells -= cells.min(axis=0) - reach
+    width = int(cells[:, 1].max()) + reach + 1
+    cell_of = cells[:, 0] * width + cells[:, 1]
+    size = (int(cells[:, 0].max()) + reach + 1) * width
+    mass = np.bincount(cell_of, minlength=size).astype(float)
+    sum_x = np.bincount(cell_of, pos[:, 0], minlength=size)
+    sum_y = np.bincount(cell_of, pos[:, 1], minlength=size)
+    # A node doesn't push itself: its own cell acts through the centroid of the rest
+    block = pos[rows]
+    own = cell_of[rows]
+    mass_own = mass[own] - 1
+    sum_x_own = sum_x[own] - block[:, 0]
+    sum_y_own = sum_y[own] - block[:, 1]
+
+    result = np.zeros((len(rows), 2))
+    for ox in range(-reach, reach + 1):
+        for oy in range(-reach, reach + 1):
+            if ox or oy:
+                cell = own + ox * width + oy
+                cell_mass, cx, cy = mass[cell], sum_x[cell], sum_y[cell]
+            else:
+                cell_mass, cx, cy = mass_own, sum_x_own, sum_y_own
+            occupied = cell_mass > 0
+            safe_mass = np.where(occupied, cell_mass, 1.0)
+            dx = cx / safe_mass - block[:, 0]
+            dy = cy / safe_mass - block[:, 1]
+            dist2 = dx * dx + dy * dy
+            near = occupied & (dist2 <= CHARGE_DISTANCE_MAX ** 2)
+            push = np.where(near, CHARGE_STRENGTH * alpha * cell_mass / np.maximum(dist2, 1.0), 0.0)
+            result[:, 0] += push * dx
+            result[:, 1] += push * dy
+    return result
+
+
+def charge_forces(pos: np.ndarray, rows: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Many-body repulsion plus collision for the given rows against all nodes
+    within CHARGE_DISTANCE_MAX.
+
+    Exact (blocked pairwise) for small graphs; large graphs use the grid
+    approximation. Without the range limit every node pushes every other and
+    the rings of a large graph spread far beyond their radial targets.
+    """
+    if len(pos) > EXACT_CHARGE_LIMIT:
+        return grid_charge_forces(pos, rows, alpha)
+    result = np.zeros((len(rows), 2))
+    for start in range(0, len(rows), CHARGE_BLOCK_ROWS):
+        block = pos[rows[start:start + CHARGE_BLOCK_ROWS]]
+        dx = pos[:, 0] - block[:, 0, None]
+        dy = pos[:, 1] - block[:, 1, None]
+        dist2 = dx * dx + dy * dy
+        # d3.forceManyBody().distanceMax: v += delta * strength * alpha / |delta|^2 (self pairs have delta 0)
+        push = np.where(dist2 <= CHARGE_DISTANCE_MAX ** 2, CHARGE_STRENGTH * alpha / np.maximum(dist2, 1.0), 0.0)
+        # d3.forceCollide: separate overlapping pairs
+        dist = np.sqrt(dist2)
+        push -= 0.5 * np.clip(2 * COLLIDE_RADIUS - dist, 0.0, None) / np.maximum(dist, 1.0)
+        result[start:start + len(block), 0] = (push * dx).sum(axis=1)
+        result[start:start + len(block), 1] = (push * dy).sum(axis=1)
+    return result
+
+
+def compute_layout(data: Dict[str, Any],
+                   previous_positions: Optional[Dict[str, List[float]]] = None,
+                   iterations: int = LAYOUT_ITERATIONS) -> Dict[str, Any]:
+    """
+    Compute hub-relative x/y for every node in the topology.
+
+    Args:
+        data: Topology export
+        previous_positions: {node_id: [x, y, ring]} from the previous snapshot, used to warm-start
+        iterations: Simulation steps to run while any node is free to move
+
+    Returns:
+        Layout section: {'algorithm', 'positions': {node_id: [x, y, ring]}, 'placed', 'iterations'}
+    """
+    node_ids, rings, links, hub = build_graph(data)
+    n = len(node_ids)
+    if n == 0:
+        return {'algorithm': LAYOUT_ALGORITHM, 'positions': {}, 'placed': 0, 'iterations': 0}
+
+    rings_arr = np.array(rings)
+    radius = np.select([rings_arr == 1, rings_arr == 2], [ACTIVE_RING_RADIUS, OUTER_RING_RADIUS], 0.0)
+    pos = np.zeros((n, 2))
+    for ring, ring_radius in ((1, ACTIVE_RING_RADIUS), (2, OUTER_RING_RADIUS)):
+        members = np.flatnonzero(rings_arr == ring)
+        pos[members] = ring_positions(len(members), ring_radius)
+
+    # Warm start: keep nodes that were already laid out on the same ring
+    movable = np.ones(n, dtype=bool)
+    movable[hub] = False
+    rng = np.random.default_rng(LAYOUT_SEED)
+    previous_positions = previous_positions or {}
+    for i, node_id in enumerate(node_ids):
+        previous = previous_positions.get(node_id)
+        if i == hub or not previous or len(previous) < 3 or previous[2] != rings[i]:
+            continue
+        pos[i] = previous[:2]
+        movable[i] = False
+    if previous_positions:
+        # New nodes start at a random angle on their ring instead of the cold-start spacing
+        fresh = np.flatnonzero(movable)
+        angles = rng.uniform(0, 2 * math.pi, len(fresh))
+        pos[fresh] = np.column_stack((np.cos(angles), np.sin(angles))) * radius[fresh, None]
+    pos[hub] = 0.0
+
+    rows = np.flatnonzero(movable)
+    steps = iterations if len(rows) else 0
+    if steps:
+        link_arr = np.array(links, dtype=np.int64).reshape(-1, 2)
+        source, target = link_arr[:, 0], link_arr[:, 1]
+        degree = np.bincount(link_arr.ravel(), minlength=n).astype(float)
+        bias = degree[source] / np.maximum(degree[source] + degree[target], 1.0)
+        link_strength = LINK_STRENGTH
+        velocity = np.zeros((n, 2))
+        alpha = 1.0
+        alpha_decay = 1 - ALPHA_MIN ** (1 / LAYOUT_ITERATIONS)
+
+        for _ in range(steps):
+            alpha += (0.0 - alpha) * alpha_decay
+            force = np.zeros((n, 2))
+
+            # d3.forceLink: spring each link toward LINK_DISTANCE, split by degree bias
+            if len(link_arr):
+                delta = (pos[target] + velocity[target]) - (pos[source] + velocity[source])
+                length = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-6)
+                delta *= ((length - LINK_DISTANCE) / length * alpha * link_strength)[:, None]
+                for axis in (0, 1):
+                    force[:, axis] -= np.bincount(target, delta[:, axis] * bias, minlength=n)
+                    force[:, axis] += np.bincount(source, delta[:, axis] * (1 - bias), minlength=n)
+
+            force[rows] += charge_forces(pos, rows, alpha)
+
+            # d3.forceRadial: pull each node toward its ring
+            r = np.maximum(np.hypot(pos[:, 0], pos[:, 1]), 1e-6)
+            force += pos * ((radius - r) * RADIAL_STRENGTH * alpha / r)[:, None]
+
+            velocity = (velocity + force) * (1 - VELOCITY_DECAY)
+            velocity[~movable] = 0.0
+            pos += velocity
+
+    positions = {node_id: [round(float(x), 1), round(float(y), 1), ring]
+                 for node_id, (x, y), ring in zip(node_ids, pos, rings)}
+    return {
+        'algorithm': LAYOUT_ALGORITHM,
+        'positions': positions,
+        'placed': int(len(rows)),
+        'iterations': steps,
+    }
+
+
+def load_previous_positions(path: str) -> Optional[Dict[str, List[float]]]:
+    """Positions from an existing export, or None if it has no usable layout"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)
+        positions = previous['data']['layout']['positions']
+        if isinstance(positions, dict):
+            return positions
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def apply_layout(data: Dict[str, Any], previous_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Add data.layout to a topology export in place, warm-started from previous_path.
+
+    Returns:
+        The layout section that was added
+    """
+    previous = load_previous_positions(previous_path) if previous_path else None
+    layout = compute_layout(data, previous)
+    data['data']['layout'] = layout
+    return layout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute topology layout")
+    parser.add_argument('source', help="Topology export to lay out")
+    parser.add_argument('--previous', help="Previous export to warm-start from (default: source itself)")
+    parser.add_argument('--output', help="Where to write the result (default: overwrite source)")
+    args = parser.parse_args()
+
+    with open(args.source, encoding='utf-8') as f:
+        data = json.load(f)
+    layout = apply_layout(data, args.previous or args.source)
+
+    from write_topology_data import write_topology_data
+    if not write_topology_data(data, args.output or args.source):
+        return 1
+    print(f"  Layout: {len(layout['positions'])} nodes, {layout['placed']} placed in {layout['iterations']} steps")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Topology Publisher
+Event-driven replacement for the update_latest_scan.sh timer: publishes a
+scan's raw_data_complete.json to the web root as soon as it is complete
+
+The scans directory and each scan_* folder are watched with inotify (polled
+every POLL_SECONDS where inotify isn't available). When a scan's export is
+closed after writing or moved into place, it is published if:
+    - it belongs to the newest scan seen so far (an older scan rewriting its
+      export never replaces a newer snapshot)
+    - its sha256 differs from the one recorded for the published snapshot
+      (.source.sha256 sidecar); unchanged content is never validated or
+      copied again
+    - it passes strict streaming validation (topology_validation.py), which is
+      also what tells a finished export from one still being written
+
+Publishing copies the export to a temp file and renames it over the target
+while hashing. It then writes the cluster index and the .gz/.br siblings, and
+writes the .sha256 sidecar last. The sidecar is the version ID: the log API
+watches for it and pushes the new version to connected UIs over
+/api/topology/events.
+
+With --layout (node positions precomputed by topology_layout.py, needs NumPy)
+or --delta (versioned patch + manifest, see write_topology_data.py), the
+export is loaded and rewritten through write_topology_data instead of copied
+byte for byte. The published file then differs from the scan's export, so the
+export's own hash is kept in a .source.sha256 sidecar for the unchanged check.
+
+    python3 topology_publisher.py              # Run as a daemon (systemd: topology-publisher.service)
+    python3 topology_publisher.py --once       # Publish the newest complete scan and exit
+    python3 topology_publisher.py --layout --delta
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import shutil
+import struct
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from write_topology_data import (
+    COPY_CHUNK_SIZE, HASH_SUFFIX, MANIFEST_NAME, PATCH_DIR_NAME, atomic_output, atomic_write_bytes,
+    build_cluster_index, write_cluster_index, write_precompressed_artifacts, write_topology_data,
+    write_topology_delta
+)
+
+SCANS_DIR = "/opt/eagleyesocradar/scans"
+TARGET_PATH = "/var/www/reactapp/data/raw_data_complete.json"
+BACKUP_SUFFIX = ".bak"  # Previous snapshot, kept as a hard link (no copy)
+SOURCE_HASH_SUFFIX = ".source.sha256"  # sha256 of the scan export the snapshot was published from
+SCAN_PREFIX = "scan_"
+EXPORT_NAME = "raw_data_complete.json"
+WEB_OWNER = "www-data"
+MAX_REPORTED_ISSUES = 20
+POLL_SECONDS = 2.0  # Polling interval when inotify is unavailable
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class DirectoryWatcher:
+    """
+    Reports files created, closed after writing or moved into watched
+    directories. Uses inotify through libc; falls back to comparing
+    directory listings every poll_seconds where that isn't possible.
+
+    Args:
+        mask: inotify events to watch for
+        poll_seconds: Polling interval for the fallback
+    """
+
+    def __init__(self, mask: int = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE, poll_seconds: float = POLL_SECONDS):
+        self.mask = mask
+        self.poll_seconds = poll_seconds
+        self._dirs: Dict[int, str] = {}  # watch descriptor -> directory
+        self._snapshots: Dict[str, Dict[str, Tuple[int, int]]] = {}  # polling: directory -> {name: (mtime_ns, size)}
+        self._fd = -1
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            self._libc = None
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd >= 0
+
+    def add(self, directory: str) -> None:
+        """Start watching a directory (no-op if it is already watched)"""
+        if directory in self._dirs.values() or directory in self._snapshots:
+            return
+        if self.uses_inotify:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.mask)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), directory)
+            self._dirs[wd] = directory
+        else:
+            self._snapshots[directory] = self._listing(directory)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[List[Tuple[str, str, int]]]:
+        """
+        Block until something changes (or timeout seconds pass).
+
+        Returns:
+            [(directory, name, mask), ...] - empty on timeout, None if events were
+            lost (queue overflow) and callers should rescan
+        """
+        if not self.uses_inotify:
+            return self._poll(timeout)
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        buffer = os.read(self._fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._dirs.pop(wd, None)
+                continue
+            if wd in self._dirs:
+                events.append((self._dirs[wd], name, mask))
+        return events
+
+    def close(self) -> None:
+        if self.uses_inotify:
+            os.close(self._fd)
+            self._fd = -1
+
+    @staticmethod
+    def _listing(directory: str) -> Dict[str, Tuple[int, int]]:
+        listing = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    listing[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return listing
+
+    def _poll(self, timeout: Optional[float]) -> List[Tuple[str, str, int]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = []
+            for directory, previous in list(self._snapshots.items()):
+                current = self._listing(directory)
+                for name, state in current.items():
+                    if previous.get(name) != state:
+                        is_dir = os.path.isdir(os.path.join(directory, name))
+                        mask = (IN_CREATE | IN_ISDIR) if is_dir else IN_CLOSE_WRITE
+                        events.append((directory, name, mask))
+                self._snapshots[directory] = current
+            if events:
+                return events
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            time.sleep(self.poll_seconds if deadline is None else
+                       max(0.0, min(self.poll_seconds, deadline - time.monotonic())))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def published_hash(target_path: str, suffix: str = HASH_SUFFIX) -> Optional[str]:
+    """Content hash of the published snapshot (or with SOURCE_HASH_SUFFIX, of its source) from its sidecar"""
+    try:
+        with open(target_path + suffix) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class TopologyPublisher:
+    """
+    Publishes the newest complete scan export to the web root.
+
+    Args:
+        scans_dir: Directory holding scan_* folders
+        target_path: Published snapshot path
+        validate: Strictly validate exports before publishing
+        layout: Precompute node positions, warm-started from the published snapshot
+        delta: Also write a versioned patch against the published snapshot and a manifest
+    """
+
+    def __init__(self, scans_dir: str = SCANS_DIR, target_path: str = TARGET_PATH, validate: bool = True,
+                 layout: bool = False, delta: bool = False):
+        self.scans_dir = scans_dir
+        self.target_path = target_path
+        self.validate = validate
+        self.layout = layout
+        self.delta = delta
+        self.published_scan: Optional[str] = None
+
+    @property
+    def rewrites(self) -> bool:
+        """The published file is rewritten from the export rather than copied"""
+        return self.layout or self.delta
+
+    def scans(self) -> List[str]:
+        """scan_* folder names, newest first (names are timestamp-based)"""
+        try:
+            names = os.listdir(self.scans_dir)
+        except FileNotFoundError:
+            return []
+        return sorted((name for name in names if name.startswith(SCAN_PREFIX)), reverse=True)
+
+    def is_complete(self, source: str) -> bool:
+        """A finished export parses completely and passes strict validation"""
+        if not self.validate:
+            return True
+        from topology_validation import validate_topology_file
+        validator = validate_topology_file(source, max_issues=MAX_REPORTED_ISSUES)
+        if not validator.valid:
+            validator.print_report()
+        return validator.valid
+
+    def publish_newest(self) -> Optional[str]:
+        """Publish the newest scan whose export is complete (startup, --once, or after lost events)"""
+        for scan in self.scans():
+            if self.published_scan and scan < self.published_scan:
+                break
+            source = os.path.join(self.scans_dir, scan, EXPORT_NAME)
+            if os.path.isfile(source) and self.publish(scan):
+                return scan
+        return None
+
+    def publish(self, scan: str) -> bool:
+        """
+        Publish one scan's export unless it is older than the published scan,
+        incomplete or unchanged.
+
+        Returns:
+            bool: True if the scan is (now) the published one
+        """
+        if self.published_scan and scan < self.published_scan:
+            return False
+        source = os.path.join(self.scans_dir, scan, EXPORT_NAME)
+        try:
+            # Hashing is cheaper than validating, and published content was validated already
+            content_hash = file_sha256(source)
+            source_hash = published_hash(self.target_path, SOURCE_HASH_SUFFIX)
+            if not self.rewrites and source_hash is None:
+                source_hash = published_hash(self.target_path)  # Published before source sidecars existed
+            if content_hash == source_hash:
+                if self.published_scan != scan:
+                    print(f"[{datetime.now()}] ✓ {scan} is unchanged (sha256 {content_hash[:12]}), nothing to copy")
+                self.published_scan = scan
+                return True
+
+            if not self.is_complete(source):
+                print(f"[{datetime.now()}] ✗ {source} is incomplete or invalid, not publishing {scan}")
+                return False
+
+            if self.rewrites:
+                self._rewrite(source, content_hash)
+            else:
+                self._copy(source, content_hash)
+            self.published_scan = scan
+            print(f"[{datetime.now()}] ✓ Published {scan} (sha256 {content_hash})")
+            return True
+        except (OSError, ValueError) as e:
+            print(f"[{datetime.now()}] ✗ Error publishing {scan}: {e}")
+            return False
+
+    @contextmanager
+    def _replacing_target(self):
+        """Around replacing the snapshot: the old one becomes the .bak only once the new one is in place"""
+        os.makedirs(os.path.dirname(self.target_path) or '.', exist_ok=True)
+        backup = self.target_path + BACKUP_SUFFIX
+        pending_backup = None
+        if os.path.exists(self.target_path):
+            # The new snapshot gets a new inode, so a hard link keeps the old one without copying it
+            pending_backup = backup + '.tmp'
+            if os.path.exists(pending_backup):
+                os.unlink(pending_backup)
+            os.link(self.target_path, pending_backup)
+
+        try:
+            yield
+        except BaseException:
+            if pending_backup:
+                os.unlink(pending_backup)
+            raise
+        if pending_backup:
+            os.replace(pending_backup, backup)
+
+    def _copy(self, source: str, content_hash: str) -> None:
+        with self._replacing_target():
+            digest = hashlib.sha256()
+            with open(source, 'rb') as src, atomic_output(self.target_path) as out:
+                for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                # Raising here discards the temp file, so a changed export never replaces the snapshot
+                if digest.hexdigest() != content_hash:
+                    raise ValueError(f"{source} changed while it was being published")
+
+        # Everything else first: the .sha256 sidecar (the version clients are told about) goes last
+        with open(self.target_path, 'rb') as f:
+            write_cluster_index(self.target_path, build_cluster_index(json.load(f), content_hash))
+        write_precompressed_artifacts(self.target_path)
+        self._finish(content_hash)
+
+    def _rewrite(self, source: str, content_hash: str) -> None:
+        """Publish the export with a precomputed layout and/or a delta patch (loads it into memory)"""
+        with open(source, 'rb') as f:
+            payload = f.read()
+        if hashlib.sha256(payload).hexdigest() != content_hash:
+            raise ValueError(f"{source} changed while it was being published")
+        data = json.loads(payload)
+        del payload
+
+        if self.layout:
+            from topology_layout import apply_layout  # Needs NumPy; only imported when asked for
+            layout = apply_layout(data, previous_path=self.target_path)
+            print(f"[{datetime.now()}]   Layout: {len(layout['positions'])} nodes, "
+                  f"{layout['placed']} placed in {layout['iterations']} steps")
+
+        with self._replacing_target():
+            # Both write the snapshot, its cluster index and its .gz/.br/.sha256 siblings
+            if self.delta:
+                written = write_topology_delta(data, self.target_path)
+            else:
+                written = write_topology_data(data, self.target_path)
+            if not written:
+                raise ValueError(f"Could not write {self.target_path}")
+        self._finish(content_hash)
+
+    def _finish(self, content_hash: str) -> None:
+        # Recorded after everything else, so an interrupted publish is redone on the next event
+        atomic_write_bytes(self.target_path + SOURCE_HASH_SUFFIX, (content_hash + '\n').encode('ascii'))
+
+        data_dir = os.path.dirname(self.target_path) or '.'
+        paths = [self.target_path + suffix
+                 for suffix in ('', '.gz', '.br', HASH_SUFFIX, SOURCE_HASH_SUFFIX, '.clusters.json')]
+        if self.delta:
+            patch_dir = os.path.join(data_dir, PATCH_DIR_NAME)
+            paths.append(os.path.join(data_dir, MANIFEST_NAME))
+            if os.path.isdir(patch_dir):
+                paths.append(patch_dir)
+                paths.extend(os.path.join(patch_dir, name) for name in os.listdir(patch_dir))
+        for path in paths:
+            try:
+                shutil.chown(path, WEB_OWNER, WEB_OWNER)
+            except (OSError, LookupError):
+                pass  # Not running as root, or no www-data user (development)
+
+    def run(self, watcher: Optional[DirectoryWatcher] = None) -> None:
+        """Publish the newest complete scan, then publish new ones as their exports are written"""
+        watcher = watcher or DirectoryWatcher()
+        os.makedirs(self.scans_dir, exist_ok=True)
+        watcher.add(self.scans_dir)
+        for scan in self.scans():
+            watcher.add(os.path.join(self.scans_dir, scan))
+        print(f"Watching {self.scans_dir} ({'inotify' if watcher.uses_inotify else 'polling'})")
+        self.publish_newest()
+
+        try:
+            while True:
+                events = watcher.wait()
+                if events is None:
+                    print(f"[{datetime.now()}] Watch events were lost, rescanning")
+                    for scan in self.scans():
+                        watcher.add(os.path.join(self.scans_dir, scan))
+                    self.publish_newest()
+                    continue
+
+                ready = set()
+                for directory, name, mask in events:
+                    if directory == self.scans_dir:
+                        if name.startswith(SCAN_PREFIX) and mask & IN_ISDIR:
+                            # New scan folder; its export may already be there before the watch was added
+                            watcher.add(os.path.join(directory, name))
+                            if os.path.isfile(os.path.join(directory, name, EXPORT_NAME)):
+                                ready.add(name)
+                    elif name == EXPORT_NAME and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        ready.add(os.path.basename(directory))
+
+                # Several scans finishing at once: only the newest matters
+                if ready:
+                    self.publish(max(ready))
+        finally:
+            watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish completed scans to the NetTopo Visualizer web root")
+    parser.add_argument('--scans-dir', default=SCANS_DIR, help="Directory holding scan_* folders")
+    parser.add_argument('--target', default=TARGET_PATH, help="Published snapshot path")
+    parser.add_argument('--once', action='store_true', help="Publish the newest complete scan and exit")
+    parser.add_argument('--no-validate', action='store_true', help="Skip strict validation (not recommended)")
+    parser.add_argument('--layout', action='store_true',
+                        help="Precompute node x/y positions so the browser can skip the force simulation (needs NumPy)")
+    parser.add_argument('--delta', action='store_true',
+                        help="Also write a versioned patch against the previous snapshot and a manifest")
+    args = parser.parse_args()
+
+    publisher = TopologyPublisher(args.scans_dir, args.target, validate=not args.no_validate,
+                                  layout=args.layout, delta=args.delta)
+    if args.once:
+        scan = publisher.publish_newest()
+        if scan is None:
+            print(f"[{datetime.now()}] ✗ No complete scan found in {args.scans_dir}")
+            return 1
+        return 0
+
+    try:
+        publisher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Topology Export Validation
+Strict validation of raw_data_complete.json exports against the record shapes
+the frontend expects (DeviceRecord, ConnectionRecord, NeighborRecord and
+ScanStateRecord in types.ts).
+
+Checks:
+    - every record has each field with the right JSON type (extra fields are allowed)
+    - every section's "count" matches its number of records (and {count, list} summaries)
+    - connections.device_id / neighbors.local_device_id reference an existing device id
+    - device ids are unique; duplicate device MACs and IPs are reported as warnings
+      (two interfaces or a misreporting scanner don't block publishing)
+
+Files are read in a single streaming pass: only one record is decoded at a
+time, so memory stays bounded by the id/MAC/IP sets rather than the export's
+size. The same checks run on an in-memory export (see write_topology_data's
+validate option).
+
+Usage:
+    python topology_validation.py raw_data_complete.json [--max-issues 50]
+
+Exits non-zero if the export has errors (warnings alone don't fail it).
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List, Any, Iterator, Optional, TextIO
+
+from write_topology_data import UNKNOWN_MAC_KEY, normalize_mac
+
+READ_CHUNK_SIZE = 1024 * 1024  # Characters read from the file at a time
+MAX_VALUE_SIZE = 256 * 1024 * 1024  # Largest single non-record value (e.g. data.layout) the reader will buffer
+MAX_REPORTED_ISSUES = 50  # Issues kept per level; the rest are only counted
+UNKNOWN_MACS = ('', UNKNOWN_MAC_KEY)  # Normalized placeholders that may repeat
+NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+# JSON types per field kind
+FIELD_TYPES = {
+    'int': (int,),
+    'number': (int, float),
+    'string': (str,),
+    'string|null': (str, type(None)),
+}
+
+# Mirrors the record interfaces in types.ts
+RECORD_SCHEMAS = {
+    'devices': {
+        'id': 'int',
+        'ip': 'string',
+        'name': 'string',
+        'type': 'string',
+        'detection_method': 'string',
+        'mac': 'string',
+        'confidence': 'number',
+        'network': 'string',
+        'vendor': 'string',
+        'last_seen': 'string',
+        'name_source': 'string',
+        'netbios_domain': 'string|null',
+        'logged_in_user': 'string|null',
+        'state': 'string',
+    },
+    'connections': {
+        'id': 'int',
+        'device_id': 'int',
+        'port_name': 'string',
+        'port_alias': 'string',
+        'port_status': 'string',
+        'mac_address': 'string',
+        'ip_address': 'string',
+        'vendor': 'string',
+        'status': 'string',
+    },
+    'neighbors': {
+        'id': 'int',
+        'local_device_id': 'int',
+        'local_ip': 'string',
+        'local_port': 'string|null',
+        'protocol': 'string',
+        'remote_name': 'string',
+        'remote_port': 'string|null',
+    },
+    'scan_state': {
+        'id': 'int',
+        'network': 'string',
+        'device': 'string',
+        'scan_time': 'string',
+    },
+}
+OPTIONAL_RECORD_FIELDS = {'devices': ('state',)}
+REQUIRED_SECTIONS = ('devices', 'connections')  # neighbors/scan_state may be missing (warning only)
+REQUIRED_HEADER_FIELDS = ('export_timestamp', 'export_type', 'data')
+LIST_SUMMARIES = ('all_unique_macs', 'all_discovered_ips', 'logged_in_users')  # {count, list} sections
+DEVICE_REFERENCES = {'connections': 'device_id', 'neighbors': 'local_device_id'}
+
+
+class TopologyValidator:
+    """
+    Accumulates checks as an export is fed to it piece by piece.
+
+    Feed order within the export doesn't matter (references to devices that
+    haven't been seen yet are resolved in finish()).
+
+    Args:
+        max_issues: Messages kept per level; further issues are only counted
+    """
+
+    def __init__(self, max_issues: int = MAX_REPORTED_ISSUES):
+        self.max_issues = max_issues
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.error_count = 0
+        self.warning_count = 0
+        self.record_counts: Dict[str, int] = {}
+        self._header_fields = set()
+        self._sections = set()
+        self._schemas = {
+            section: [(name, FIELD_TYPES[kind], name in OPTIONAL_RECORD_FIELDS.get(section, ()))
+                      for name, kind in schema.items()]
+            for section, schema in RECORD_SCHEMAS.items()
+        }
+        self._device_ids = set()
+        self._device_macs: Dict[str, Any] = {}  # normalized MAC -> first device id
+        self._device_ips: Dict[str, Any] = {}  # IP -> first device id
+        self._unresolved: Dict[Any, str] = {}  # device id referenced before it was seen -> first referrer
+
+    # ------------------------------------------------------------------ reporting
+
+    def error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_issues:
+            self.errors.append(message)
+
+    def warning(self, message: str) -> None:
+        self.warning_count += 1
+        if len(self.warnings) < self.max_issues:
+            self.warnings.append(message)
+
+    @property
+    def valid(self) -> bool:
+        return self.error_count == 0
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'valid': self.valid,
+            'records': dict(self.record_counts),
+            'error_count': self.error_count,
+            'warning_count': self.warning_count,
+            'errors': list(self.errors),
+            'warnings': list(self.warnings),
+        }
+
+    def print_report(self) -> None:
+        for message in self.errors:
+            print(f"✗ {message}")
+        if self.error_count > len(self.errors):
+            print(f"✗ ... and {self.error_count - len(self.errors)} more errors")
+        for message in self.warnings:
+            print(f"! {message}")
+        if self.warning_count > len(self.warnings):
+            print(f"! ... and {self.warning_count - len(self.warnings)} more warnings")
+        counts = ', '.join(f"{count:,} {section}" for section, count in self.record_counts.items())
+        if self.valid:
+            print(f"✓ Strict validation passed ({counts}; {self.warning_count} warnings)")
+        else:
+            print(f"✗ Strict validation failed: {self.error_count} errors, {self.warning_count} warnings ({counts})")
+
+    # ------------------------------------------------------------------ feeding
+
+    def header(self, name: str, value: Any) -> None:
+        """A top-level field other than "data" ("data" itself only needs to be announced)"""
+        self._header_fields.add(name)
+        if name in ('export_timestamp', 'export_type') and not isinstance(value, str):
+            self.error(f"{name} must be a string")
+
+    def data_value(self, name: str, value: Any) -> None:
+        """A non-record entry of the data section"""
+        if name in LIST_SUMMARIES:
+            if not isinstance(value, dict) or not isinstance(value.get('list'), list):
+                self.error(f"data.{name} must be an object with a list")
+            elif value.get('count') != len(value['list']):
+                self.error(f"data.{name}.count is {value.get('count')!r} but the list has {len(value['list'])} entries")
+        elif name == 'scan_metadata' and not isinstance(value, list):
+            self.error("data.scan_metadata must be a list")
+
+    def section_started(self, section: str) -> None:
+        self._sections.add(section)
+        self.record_counts.setdefault(section, 0)
+
+    def record(self, section: str, record: Any) -> None:
+        """One record of a record section"""
+        index = self.record_counts[section]
+        self.record_counts[section] = index + 1
+        where = f"data.{section}.records[{index}]"
+        if not isinstance(record, dict):
+            self.error(f"{where} is {type(record).__name__}, expected an object")
+            return
+
+        for name, types, optional in self._schemas.get(section, ()):
+            if name not in record:
+                if not optional:
+                    self.error(f"{where} is missing {name}")
+            elif type(record[name]) not in types:
+                self.error(f"{where}.{name} is {json.dumps(record[name])[:40]}, expected {RECORD_SCHEMAS[section][name]}")
+
+        if section == 'devices':
+            self._device(record, where)
+        elif section in DEVICE_REFERENCES:
+            device_id = record.get(DEVICE_REFERENCES[section])
+            if type(device_id) is int and device_id not in self._device_ids:
+                self._unresolved.setdefault(device_id, where)
+
+    def _device(self, record: Dict[str, Any], where: str) -> None:
+        device_id = record.get('id')
+        if type(device_id) is int:
+            if device_id in self._device_ids:
+                self.error(f"{where} duplicates device id {device_id}")
+            self._device_ids.add(device_id)
+            self._unresolved.pop(device_id, None)
+
+        mac = record.get('mac')
+        if isinstance(mac, str):
+            normalized = normalize_mac(mac)
+            if normalized not in UNKNOWN_MACS:
+                first = self._device_macs.setdefault(normalized, device_id)
+                if first != device_id:
+                    self.warning(f"{where} duplicates MAC {mac} (device {first})")
+
+        ip = record.get('ip')
+        if isinstance(ip, str) and ip:
+            first = self._device_ips.setdefault(ip, device_id)
+            if first != device_id:
+                self.warning(f"{where} duplicates IP {ip} (device {first})")
+
+    def section_count(self, section: str, count: Any) -> None:
+        """A record section's "count" (call after its records)"""
+        if type(count) is not int:
+            self.error(f"data.{section}.count must be an integer")
+        elif count != self.record_counts.get(section, 0):
+            self.error(f"data.{section}.count is {count} but it has {self.record_counts.get(section, 0)} records")
+
+    def finish(self) -> bool:
+        """Run the checks that need the whole export. Returns True if there were no errors."""
+        for name in REQUIRED_HEADER_FIELDS:
+            if name not in self._header_fields:
+                self.error(f"Missing required field: {name}")
+        for section in RECORD_SCHEMAS:
+            if section not in self._sections:
+                if section in REQUIRED_SECTIONS:
+                    self.error(f"Missing required data field: {section}")
+                else:
+                    self.warning(f"Missing data field: {section}")
+        for device_id, where in self._unresolved.items():
+            self.error(f"{where} references device {device_id}, which is not in data.devices")
+        return self.valid
+
+
+def validate_export(data: Dict[str, Any], validator: Optional[TopologyValidator] = None) -> TopologyValidator:
+    """
+    Strictly validate an export that is already in memory.
+
+    Returns:
+        TopologyValidator: finished validator (see .valid / .report())
+    """
+    validator = validator or TopologyValidator()
+    if not isinstance(data, dict):
+        validator.error("Export must be a JSON object")
+        validator.finish()
+        return validator
+    for name, value in data.items():
+        validator.header(name, value)
+    sections = data.get('data')
+    if isinstance(sections, dict):
+        for name, value in sections.items():
+            if name not in RECORD_SCHEMAS:
+                validator.data_value(name, value)
+                continue
+            validator.section_started(name)
+            records = value.get('records') if isinstance(value, dict) else None
+            if not isinstance(records, list):
+                validator.error(f"data.{name}.records must be a list")
+                continue
+            for record in records:
+                validator.record(name, record)
+            validator.section_count(name, value.get('count'))
+    elif 'data' in data:
+        validator.error("data must be an object")
+    validator.finish()
+    return validator
+
+
+class JsonStreamReader:
+    """
+    Minimal pull reader over a JSON text stream. Containers are walked with
+    iter_object()/iter_array(); each member must be consumed (value(), or a
+    nested iter_*) before the iterator advances. Leaf values and whole
+    sub-trees are decoded by json's raw_decode, so only the current value is
+    ever held in memory. A value that doesn't fit the buffer is retried only
+    after the buffer has doubled, so decoding it stays linear in its size.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.consumed = 0  # Characters dropped from the front of buf
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    @property
+    def offset(self) -> int:
+        return self.consumed + self.pos
+
+    def _fill(self, at_least: int = 0) -> bool:
+        """Append at least max(chunk_size, at_least) characters (fewer only at end of input)"""
+        if self.eof:
+            return False
+        if self.pos:
+            self.consumed += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(max(self.chunk_size, at_least))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' at offset {self.offset}, found {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # A number cut off by the chunk boundary ("12" of "12.5e3") decodes too; only
+                # accept a value once the character after it can't continue it
+                if self.eof or (end < len(self.buf) and self.buf[end] not in NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"Invalid JSON at offset {self.consumed + e.pos}: {e.msg}") from None
+            pending = len(self.buf) - self.pos
+            if pending > MAX_VALUE_SIZE:
+                raise ValueError(f"Value at offset {self.offset} is larger than {MAX_VALUE_SIZE} characters")
+            # Double what's buffered before decoding again: re-decoding after every chunk is quadratic
+            self._fill(pending)
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield each key of the next object; the caller consumes its value before the next key"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected an object key at offset {self.offset}")
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def iter_array(self) -> Iterator[int]:
+        """Yield the index of each element of the next array; the caller consumes each element"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def validate_topology_file(path: str, max_issues: int = MAX_REPORTED_ISSUES) -> TopologyValidator:
+    """
+    Strictly validate an export file in one streaming pass.
+
+    Args:
+        path: Export to check (raw_data_complete.json)
+        max_issues: Messages kept per level
+
+    Returns:
+        TopologyValidator: finished validator (see .valid / .report())
+    """
+    validator = TopologyValidator(max_issues)
+    try:
+        with open(path, encoding='utf-8') as f:
+            reader = JsonStreamReader(f)
+            if reader.peek() != '{':
+                raise ValueError("Export must be a JSON object")
+            for name in reader.iter_object():
+                if name != 'data':
+                    validator.header(name, reader.value())
+                    continue
+                validator.header(name, None)
+                if reader.peek() != '{':
+                    reader.value()
+                    validator.error("data must be an object")
+                    continue
+                for section in reader.iter_object():
+                    if section not in RECORD_SCHEMAS:
+                        validator.data_value(section, reader.value())
+                        continue
+                    _stream_section(reader, validator, section)
+            if reader.peek():
+                raise ValueError(f"Unexpected data after the export at offset {reader.offset}")
+    except (OSError, ValueError) as e:
+        # Unreadable or malformed JSON: nothing after this point can be trusted
+        validator.error(str(e))
+        return validator
+    validator.finish()
+    return validator
+
+
+def _stream_section(reader: JsonStreamReader, validator: TopologyValidator, section: str) -> None:
+    validator.section_started(section)
+    if reader.peek() != '{':
+        reader.value()
+        validator.error(f"data.{section} must be an object")
+        return
+    count = None
+    has_records = False
+    for key in reader.iter_object():
+        if key == 'records' and reader.peek() == '[':
+            has_records = True
+            for _ in reader.iter_array():
+                validator.record(section, reader.value())
+        elif key == 'count':
+            count = reader.value()
+        else:
+            reader.value()
+    if not has_records:
+        validator.error(f"data.{section}.records must be a list")
+        return
+    # "count" may come before or after the records (the streaming writer puts it after)
+    validator.section_count(section, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strictly validate a topology export (streaming)")
+    parser.add_argument('path', help="Export to check, e.g. raw_data_complete.json")
+    parser.add_argument('--max-issues', type=int, default=MAX_REPORTED_ISSUES,
+                        help="Errors/warnings listed per level (all are counted)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    validator = validate_topology_file(args.path, args.max_issues)
+    if args.json:
+        print(json.dumps(validator.report(), indent=2))
+    else:
+        validator.print_report()
+        print(f"  Checked {args.path} in {time.perf_counter() - start:.2f}s")
+    return 0 if validator.valid else 1
+
+
+if __name__ == "__main__":
+    exit(main())
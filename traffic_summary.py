@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Per-device Traffic Summaries
+Rolling firewall log counters for every node of the topology, so the UI can
+color the whole graph from one response instead of fetching logs per device.
+
+Log records are matched to topology nodes by normalized MAC (src_mac/dst_mac),
+falling back to src_ip/dst_ip. Node IDs are the ones TopologyGraph.tsx uses:
+the device MAC (or dev-<id>), and the MAC of L2-only peers from connections.
+A record between two known nodes counts for both.
+
+Each window (e.g. 5m/1h/24h) is a ring of BUCKETS_PER_WINDOW time buckets per
+node, keyed by the log's own timestamp, so a window slides in steps of
+window/BUCKETS_PER_WINDOW and old buckets are simply dropped. Per bucket:
+events, denies, severity counts, destination port counts and distinct peer IPs
+(capped at MAX_PEERS_PER_BUCKET, so large distinct_peers values are lower bounds).
+
+The aggregator only holds counters; firewall_log_api.py feeds it the log lines
+appended since the last processed offset (in one API process, which publishes
+full summaries for the others to answer from with select_summary).
+"""
+
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+from write_topology_data import normalize_mac
+
+WINDOWS = (('5m', 300), ('1h', 3600), ('24h', 86400))
+BUCKETS_PER_WINDOW = 12
+MAX_PEERS_PER_BUCKET = 4096
+TOP_PORTS = 5
+MAC_CACHE_SIZE = 100000  # Raw log MAC spellings remembered with their normalized form
+DENY_SUBTYPES = ('Denied', 'Deny', 'Drop', 'Dropped', 'Reject', 'Rejected')
+UNKNOWN_MAC = 'Unknown MAC'
+
+
+def build_device_index(data: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str], Dict[str, str]]:
+    """
+    Map a topology export's nodes for log matching.
+
+    Args:
+        data: Topology export (the full document with a 'data' section)
+
+    Returns:
+        (nodes {node_id: {id, name, ip, mac, type}}, normalized MAC -> node_id, IP -> node_id)
+    """
+    sections = data.get('data', {})
+    nodes: Dict[str, Dict[str, Any]] = {}
+    by_mac: Dict[str, str] = {}
+    by_ip: Dict[str, str] = {}
+
+    for device in sections.get('devices', {}).get('records', []):
+        mac = device.get('mac')
+        node_id = mac if mac and mac != UNKNOWN_MAC else f"dev-{device.get('id')}"
+        nodes[node_id] = {key: device.get(key) for key in ('id', 'name', 'ip', 'mac', 'type')}
+        if mac and mac != UNKNOWN_MAC:
+            by_mac[normalize_mac(mac)] = node_id
+        if device.get('ip'):
+            by_ip.setdefault(device['ip'], node_id)
+
+    # L2-only peers seen on switch ports are nodes too (ghost nodes in the graph)
+    for conn in sections.get('connections', {}).get('records', []):
+        mac = conn.get('mac_address')
+        if not mac or mac == UNKNOWN_MAC:
+            continue
+        normalized = normalize_mac(mac)
+        if normalized not in by_mac:
+            by_mac[normalized] = mac
+            nodes[mac] = {'id': None, 'name': None, 'ip': conn.get('ip_address'), 'mac': mac, 'type': 'L2'}
+        if conn.get('ip_address'):
+            by_ip.setdefault(conn['ip_address'], by_mac[normalized])
+
+    return nodes, by_mac, by_ip
+
+
+class Bucket:
+    """Counters for one node over one time slice of a window"""
+
+    __slots__ = ('events', 'denies', 'severity', 'ports', 'peers')
+
+    def __init__(self):
+        self.events = 0
+        self.denies = 0
+        self.severity: Dict[str, int] = {}
+        self.ports: Dict[str, int] = {}
+        self.peers = set()
+
+
+class TrafficAggregator:
+    """
+    Rolling per-node counters over sliding windows.
+
+    Args:
+        windows: (name, seconds) pairs, smallest first
+        buckets_per_window: Time slices per window (the window's sliding granularity)
+    """
+
+    def __init__(self, windows=WINDOWS, buckets_per_window: int = BUCKETS_PER_WINDOW):
+        self.windows = tuple(windows)
+        self.widths = [seconds / buckets_per_window for _, seconds in self.windows]
+        self.lock = threading.Lock()
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.by_mac: Dict[str, str] = {}
+        self.by_ip: Dict[str, str] = {}
+        # One {node_id: {bucket number: Bucket}} per window
+        self._buckets: List[Dict[str, Dict[int, Bucket]]] = [{} for _ in self.windows]
+        self._unmatched: List[Dict[int, int]] = [{} for _ in self.windows]
+        self._mac_cache: Dict[str, str] = {}
+        self.lines_processed = 0
+
+    def set_devices(self, data: Dict[str, Any]) -> None:
+        """Match against a (new) topology export; counters of nodes that disappeared are dropped"""
+        nodes, by_mac, by_ip = build_device_index(data)
+        with self.lock:
+            self.nodes, self.by_mac, self.by_ip = nodes, by_mac, by_ip
+            for buckets in self._buckets:
+                for node_id in [node_id for node_id in buckets if node_id not in nodes]:
+                    del buckets[node_id]
+
+    def _match(self, src_mac, src_ip, dst_mac, dst_ip) -> List[Tuple[str, str]]:
+        """(node_id, peer IP) for each topology node a log record involves"""
+        by_mac, by_ip = self.by_mac, self.by_ip
+        src = by_mac.get(self._normalized(src_mac)) or by_ip.get(src_ip)
+        dst = by_mac.get(self._normalized(dst_mac)) or by_ip.get(dst_ip)
+        matches = [(src, dst_ip)] if src else []
+        if dst and dst != src:
+            matches.append((dst, src_ip))
+        return matches
+
+    def _normalized(self, mac: str) -> str:
+        # Log lines repeat the same few thousand MACs; normalize each once
+        normalized = self._mac_cache.get(mac)
+        if normalized is None:
+            if len(self._mac_cache) >= MAC_CACHE_SIZE:
+                self._mac_cache.clear()
+            normalized = self._mac_cache[mac] = normalize_mac(mac)
+        return normalized
+
+    def add(self, record, epoch: Optional[float] = None) -> int:
+        """
+        Count one parsed log record (LogRecord or dict with the parse_log_line fields).
+
+        Args:
+            record: Parsed log record
+            epoch: Event time; records without one count as happening now
+
+        Returns:
+            int: Number of nodes the record was counted for
+        """
+        now = time.time()
+        if epoch is None:
+            epoch = now
+        denied = record['log_subtype'] in DENY_SUBTYPES
+        severity = record['severity']
+        port = record['dst_port']
+        with self.lock:
+            self.lines_processed += 1
+            matches = self._match(record['src_mac'], record['src_ip'], record['dst_mac'], record['dst_ip'])
+            for w, ((_, seconds), width) in enumerate(zip(self.windows, self.widths)):
+                if epoch <= now - seconds:
+                    continue  # Already slid out of this window (backfill of older lines)
+                slot = int(epoch // width)
+                if not matches:
+                    unmatched = self._unmatched[w]
+                    unmatched[slot] = unmatched.get(slot, 0) + 1
+                    continue
+                window_buckets = self._buckets[w]
+                for node_id, peer in matches:
+                    node_buckets = window_buckets.get(node_id)
+                    if node_buckets is None:
+                        node_buckets = window_buckets[node_id] = {}
+                    bucket = node_buckets.get(slot)
+                    if bucket is None:
+                        bucket = node_buckets[slot] = Bucket()
+                    bucket.events += 1
+                    if denied:
+                        bucket.denies += 1
+                    bucket.severity[severity] = bucket.severity.get(severity, 0) + 1
+                    if port:
+                        bucket.ports[port] = bucket.ports.get(port, 0) + 1
+                    if peer and len(bucket.peers) < MAX_PEERS_PER_BUCKET:
+                        bucket.peers.add(peer)
+        return len(matches)
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """Drop buckets that have slid out of their window"""
+        now = time.time() if now is None else now
+        with self.lock:
+            for w, ((_, seconds), width) in enumerate(zip(self.windows, self.widths)):
+                oldest = int((now - seconds) // width) + 1
+                for node_id, node_buckets in list(self._buckets[w].items()):
+                    for slot in [slot for slot in node_buckets if slot < oldest]:
+                        del node_buckets[slot]
+                    if not node_buckets:
+                        del self._buckets[w][node_id]
+                for slot in [slot for slot in self._unmatched[w] if slot < oldest]:
+                    del self._unmatched[w][slot]
+
+    def summary(self, now: Optional[float] = None, windows: Optional[List[str]] = None,
+                top: int = TOP_PORTS) -> Dict[str, Any]:
+        """
+        Counters for every node with traffic in any of the requested windows.
+
+        Args:
+            now: End of the windows (default: current time)
+            windows: Window names to include (default: all)
+            top: Ports listed per node and window
+
+        Returns:
+            {'windows': {...}, 'unmatched_events': {...}, 'devices': {node_id: {..., 'windows': {name: counters}}}}
+        """
+        now = time.time() if now is None else now
+        self.expire(now)
+        wanted = [w for w, (name, _) in enumerate(self.windows) if windows is None or name in windows]
+        devices: Dict[str, Dict[str, Any]] = {}
+        unmatched = {}
+        with self.lock:
+            for w in wanted:
+                name, seconds = self.windows[w]
+                newest = int(now // self.widths[w])
+                unmatched[name] = sum(count for slot, count in self._unmatched[w].items() if slot <= newest)
+                for node_id, node_buckets in self._buckets[w].items():
+                    buckets = [bucket for slot, bucket in node_buckets.items() if slot <= newest]
+                    if not buckets:
+                        continue
+                    severity = Counter()
+                    ports = Counter()
+                    peers = set()
+                    for bucket in buckets:
+                        severity.update(bucket.severity)
+                        ports.update(bucket.ports)
+                        peers |= bucket.peers
+                    entry = devices.get(node_id)
+                    if entry is None:
+                        entry = devices[node_id] = dict(self.nodes.get(node_id, {}), windows={})
+                    entry['windows'][name] = {
+                        'events': sum(bucket.events for bucket in buckets),
+                        'denies': sum(bucket.denies for bucket in buckets),
+                        'distinct_peers': len(peers),
+                        'top_ports': [{'port': port, 'count': count} for port, count in ports.most_common(top)],
+                        'by_severity': dict(severity),
+                    }
+            lines_processed = self.lines_processed
+            node_count = len(self.nodes)
+
+        return {
+            'generated_at': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            'windows': {self.windows[w][0]: self.windows[w][1] for w in wanted},
+            'lines_processed': lines_processed,
+            'topology_nodes': node_count,
+            'unmatched_events': unmatched,
+            'devices': devices,
+        }
+
+
+def select_summary(summary: Dict[str, Any], windows: Optional[List[str]] = None,
+                   top: int = TOP_PORTS) -> Dict[str, Any]:
+    """
+    Narrow a full summary (all windows, many top ports) to the requested windows
+    and number of ports, like TrafficAggregator.summary(windows=..., top=...) would.
+    """
+    def keep(name):
+        return windows is None or name in windows
+
+    devices = {}
+    for node_id, entry in summary['devices'].items():
+        node_windows = {
+            name: dict(counters, top_ports=counters['top_ports'][:top])
+            for name, counters in entry['windows'].items() if keep(name)
+        }
+        if node_windows:
+            devices[node_id] = dict(entry, windows=node_windows)
+
+    return dict(
+        summary,
+        windows={name: seconds for name, seconds in summary['windows'].items() if keep(name)},
+        unmatched_events={name: count for name, count in summary['unmatched_events'].items() if keep(name)},
+        devices=devices,
+    )
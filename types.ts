@@ -103,9 +103,17 @@ export interface RawNetworkData {
       count: number;
       list: string[];
     };
+    layout?: TopologyLayout;
   };
 }
 
+export interface TopologyLayout {
+  algorithm: string;
+  positions: Record<string, [number, number, number]>; // node id -> [x, y, ring], relative to the hub
+  placed: number;
+  iterations: number;
+}
+
 export interface GraphNode extends d3.SimulationNodeDatum {
   id: string; // We will use stringified ID or MAC for D3
   originalId?: number; // The database ID
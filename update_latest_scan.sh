@@ -1,11 +1,20 @@
 #!/bin/bash
-# Update symlink to second-last scan folder for NetTopo Visualizer
-# Run this script via cron or systemd timer
+# Publish scan data for NetTopo Visualizer (manual run)
+# Normally topology-publisher.service (setup_auto_update.sh) publishes each scan as it completes
 
 SCANS_DIR="/opt/eagleyesocradar/scans"
 LINK_TARGET="/var/www/reactapp/data/raw_data_complete.json"
 BACKUP_LINK="/var/www/reactapp/data/raw_data_complete.json.bak"
+TOPOLOGY_WRITER="/opt/firewall-log-api/write_topology_data.py"  # Installed by setup_log_api.sh
+TOPOLOGY_VALIDATOR="/opt/firewall-log-api/topology_validation.py"
+TOPOLOGY_PUBLISHER="/opt/firewall-log-api/topology_publisher.py"  # Installed by setup_auto_update.sh
 
+# Same logic as the daemon: newest complete scan, validated, skipped if unchanged
+if [ -f "$TOPOLOGY_PUBLISHER" ]; then
+    exec python3 "$TOPOLOGY_PUBLISHER" --once --layout --delta --scans-dir "$SCANS_DIR" --target "$LINK_TARGET"
+fi
+
+# Fallback without the publisher: copy the second-last scan
 # Get second-to-last scan folder (sorted by name, which is timestamp-based)
 SECOND_LAST_SCAN=$(ls -1 "$SCANS_DIR" | grep "^scan_" | sort -r | sed -n '2p')
 
@@ -22,6 +31,13 @@ if [ ! -f "$SOURCE_JSON" ]; then
     exit 1
 fi
 
+# Strict validation gate: a malformed export would break the graph in every browser,
+# so keep serving the current snapshot instead
+if [ -f "$TOPOLOGY_VALIDATOR" ] && ! python3 "$TOPOLOGY_VALIDATOR" "$SOURCE_JSON" --max-issues 20; then
+    echo "[$(date)] ERROR: $SOURCE_JSON failed validation, not publishing $SECOND_LAST_SCAN" >&2
+    exit 1
+fi
+
 # Create backup of current file
 if [ -f "$LINK_TARGET" ]; then
     cp "$LINK_TARGET" "$BACKUP_LINK" 2>/dev/null || true
@@ -31,8 +47,29 @@ fi
 cp "$SOURCE_JSON" "${LINK_TARGET}.tmp"
 mv "${LINK_TARGET}.tmp" "$LINK_TARGET"
 
+# Pre-compressed siblings so the web server never compresses per request
+gzip -9 -n -c "$LINK_TARGET" > "${LINK_TARGET}.gz.tmp"
+mv "${LINK_TARGET}.gz.tmp" "${LINK_TARGET}.gz"
+if command -v brotli > /dev/null 2>&1; then
+    brotli -q 11 -c "$LINK_TARGET" > "${LINK_TARGET}.br.tmp"
+    mv "${LINK_TARGET}.br.tmp" "${LINK_TARGET}.br"
+fi
+
+# Content hash sidecar (strong ETag) - written last
+sha256sum "$LINK_TARGET" | cut -d' ' -f1 > "${LINK_TARGET}.sha256.tmp"
+mv "${LINK_TARGET}.sha256.tmp" "${LINK_TARGET}.sha256"
+
+# Cluster index for the level-of-detail API (the API builds it itself if this is skipped)
+if [ -f "$TOPOLOGY_WRITER" ]; then
+    python3 "$TOPOLOGY_WRITER" --clusters-for "$LINK_TARGET" > /dev/null || true
+fi
+
 # Set permissions
-chown www-data:www-data "$LINK_TARGET"
-chmod 644 "$LINK_TARGET"
+for f in "$LINK_TARGET" "${LINK_TARGET}.gz" "${LINK_TARGET}.br" "${LINK_TARGET}.sha256" "${LINK_TARGET}.clusters.json"; do
+    if [ -f "$f" ]; then
+        chown www-data:www-data "$f"
+        chmod 644 "$f"
+    fi
+done
 
 echo "[$(date)] Successfully updated to scan: $SECOND_LAST_SCAN"
@@ -4,17 +4,70 @@ Network Topology Data Writer
 Atomically writes network topology data to JSON file for NetTopo Visualizer
 
 Usage:
-    python write_topology_data.py
+    python write_topology_data.py [--target PATH] [--delta | --stream] [--layout]
+    python write_topology_data.py --clusters-for PATH
 
 This script ensures atomic writes to prevent the React app from reading
 partial/corrupted JSON data during updates.
+
+With --delta, each write also emits a versioned patch against the previous
+snapshot plus a small manifest, so clients can fetch only what changed:
+
+    topology_manifest.json          {"version": 7, "hash": "sha256...", "patches": [...]}
+    topology_patches/patch_000007.json
+                                    {"from_version": 6, "to_version": 7,
+                                     "records": {"devices": {"key": "record", "added": [...], "removed": [...],
+                                                             "changed": [...]}, ...},
+                                     "data": {...changed non-record sections...}}
+
+Records are matched by MAC/id (record_key), by id when a MAC repeats, or the
+section is replaced whole; apply_topology_patch() is the reference for clients.
+
+Every write also emits <target>.clusters.json: devices grouped by network CIDR
+and by upstream switch, with aggregate counts, for the log API's level-of-detail
+endpoints (/api/topology/clusters, /api/topology/neighborhood).
+
+With --layout, node positions are precomputed (see topology_layout.py, needs
+NumPy) and stored in data.layout, warm-started from the snapshot being replaced.
+
+With --strict, the export is checked record by record against the shapes in
+types.ts (see topology_validation.py) and nothing is written if it fails.
 """
 
+import argparse
+import gzip
+import hashlib
 import json
 import os
+import sqlite3
 import tempfile
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Any
+from itertools import groupby
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+try:
+    import brotli  # Optional: enables .br siblings (pip install brotli)
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = "topology_manifest.json"
+PATCH_DIR_NAME = "topology_patches"
+MAX_PATCHES = 50  # Patches kept; clients older than the oldest one fetch the full snapshot
+UNKNOWN_MAC = "Unknown MAC"  # Scanner placeholder for devices whose MAC wasn't resolved
+UNKNOWN_MAC_KEY = "UNKNOWN MAC"  # normalize_mac(UNKNOWN_MAC)
+RECORD_SECTIONS = ('devices', 'connections', 'neighbors', 'scan_state')
+HASH_SUFFIX = ".sha256"  # Sidecar holding the snapshot's sha256 hex digest (usable as a strong ETag)
+CLUSTER_SUFFIX = ".clusters.json"  # Sidecar with precomputed cluster membership for the level-of-detail API
+CLUSTER_NODE_FIELDS = ('id', 'name', 'ip', 'mac', 'type', 'vendor', 'network', 'confidence')
+CLUSTER_VIEWS = ('network', 'switch')
+CLUSTER_BATCH_ROWS = 1000  # Records buffered per insert into the cluster builder's temp database
+COPY_CHUNK_SIZE = 1024 * 1024
+# Publish-time compression: a few times faster than gzip 9 / Brotli 11 for a few percent larger files,
+# which matters more here since every publish recompresses the whole export
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
 
 
 def generate_sample_topology_data() -> Dict[str, Any]:
@@ -214,72 +267,821 @@ def generate_sample_topology_data() -> Dict[str, Any]:
     }
 
 
-def write_topology_data(data: Dict[str, Any], target_path: str = "/var/www/reactapp/data/raw_data_complete.json") -> bool:
+def write_topology_data(data: Dict[str, Any], target_path: str = "/var/www/reactapp/data/raw_data_complete.json",
+                        validate: bool = False) -> bool:
     """
     Atomically write topology data to avoid race conditions.
     
     Args:
         data: The topology data dictionary
         target_path: Destination file path
+        validate: Strictly validate first and don't write if it fails
         
     Returns:
         bool: True if successful, False otherwise
     """
+    if validate and not validate_topology_data(data, strict=True):
+        print(f"✗ Not writing {target_path}: strict validation failed")
+        return False
+    
     try:
         # Ensure directory exists
         data_dir = os.path.dirname(target_path)
         os.makedirs(data_dir, exist_ok=True)
         
-        # Create temporary file in the same directory for atomic move
-        tmp_fd, tmp_path = tempfile.mkstemp(
-            dir=data_dir,
-            suffix=".tmp",
-            prefix=".topology_"
-        )
+        atomic_write_bytes(target_path, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+        content_hash = write_precompressed_artifacts(target_path)
+        write_cluster_index(target_path, build_cluster_index(data, content_hash))
+        
+        print(f"✓ Successfully wrote topology data to {target_path}")
+        print(f"  SHA-256: {content_hash}")
+        print(f"  Timestamp: {data.get('export_timestamp')}")
+        print(f"  Devices: {data['data']['devices']['count']}")
+        print(f"  Connections: {data['data']['connections']['count']}")
         
-        try:
-            # Write JSON to temporary file
-            with os.fdopen(tmp_fd, 'w') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+        return True
             
-            # Atomic replace - ensures React never reads partial data
-            # os.replace is atomic on both Unix and Windows
-            os.replace(tmp_path, target_path)
+    except Exception as e:
+        print(f"✗ Error writing topology data: {e}")
+        return False
+
+
+@contextmanager
+def atomic_output(target_path: str, mode: str = 'wb'):
+    """
+    Open a temp file next to target_path; on success it atomically replaces target_path.
+    
+    Args:
+        target_path: Destination file path
+        mode: File mode for the temp file ('wb' or 'w')
+    """
+    # Create temporary file in the same directory for atomic move
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(target_path) or ".",
+        suffix=".tmp",
+        prefix=".topology_"
+    )
+    
+    try:
+        encoding = None if 'b' in mode else 'utf-8'
+        with os.fdopen(tmp_fd, mode, encoding=encoding) as f:
+            yield f
+        
+        # Atomic replace - ensures React never reads partial data
+        # os.replace is atomic on both Unix and Windows
+        os.replace(tmp_path, target_path)
+        
+        # Set readable permissions
+        os.chmod(target_path, 0o644)
+        
+    except BaseException as e:
+        # Clean up temporary file if it still exists
+        if os.path.exists(tmp_path):
+            try:
+                os.unlink(tmp_path)
+            except:
+                pass
+        raise e
+
+
+def atomic_write_bytes(target_path: str, payload: bytes) -> None:
+    """
+    Write bytes to target_path via a temp file in the same directory and os.replace.
+    
+    Args:
+        target_path: Destination file path
+        payload: File contents
+    """
+    with atomic_output(target_path) as f:
+        f.write(payload)
+
+
+def write_precompressed_artifacts(target_path: str, gzip_level: int = GZIP_LEVEL,
+                                  brotli_quality: int = BROTLI_QUALITY) -> str:
+    """
+    Write .gz (and .br when the brotli module is available) siblings of target_path,
+    then a .sha256 sidecar with the hex digest of the uncompressed file.
+    
+    Each artifact is replaced atomically; the hash sidecar is written last so a
+    server using it as an ETag never advertises content that isn't in place yet.
+    Files are streamed in chunks, so this works for exports of any size.
+    
+    Args:
+        target_path: Path of the JSON snapshot that was just written
+        gzip_level: gzip compression level (1-9)
+        brotli_quality: Brotli quality (0-11)
+        
+    Returns:
+        str: sha256 hex digest of target_path
+    """
+    digest = hashlib.sha256()
+    with open(target_path, 'rb') as src, atomic_output(target_path + ".gz") as gz_out:
+        # mtime=0 keeps the .gz byte-identical for identical content
+        with gzip.GzipFile(fileobj=gz_out, mode='wb', compresslevel=gzip_level, mtime=0) as gz:
+            for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                gz.write(chunk)
+    
+    if brotli is not None:
+        with open(target_path, 'rb') as src, atomic_output(target_path + ".br") as br_out:
+            compressor = brotli.Compressor(quality=brotli_quality)
+            for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                br_out.write(compressor.process(chunk))
+            br_out.write(compressor.finish())
+    
+    content_hash = digest.hexdigest()
+    atomic_write_bytes(target_path + HASH_SUFFIX, content_hash.encode('ascii') + b"\n")
+    return content_hash
+
+
+def confidence_bucket(confidence: Any) -> str:
+    """Bucket label used by confidence_distribution"""
+    try:
+        value = int(confidence)
+    except (TypeError, ValueError):
+        return "unknown"
+    if value >= 90:
+        return "90-100"
+    if value >= 70:
+        return "70-89"
+    if value >= 50:
+        return "50-69"
+    return "0-49"
+
+
+def write_topology_stream(devices: Iterable[Dict[str, Any]],
+                          connections: Iterable[Dict[str, Any]] = (),
+                          neighbors: Iterable[Dict[str, Any]] = (),
+                          scan_state: Iterable[Dict[str, Any]] = (),
+                          target_path: str = "/var/www/reactapp/data/raw_data_complete.json",
+                          scan_metadata: Optional[List[Dict[str, Any]]] = None,
+                          extra_data: Optional[Dict[str, Any]] = None,
+                          export_type: str = "COMPLETE_RAW_SCAN_DATA",
+                          database_source: str = "network_scanner.db",
+                          indent: Optional[int] = None,
+                          validate: bool = False) -> bool:
+    """
+    Atomically write topology data from record iterators without building it in memory.
+    
+    Records are serialized one at a time into the same RawNetworkData layout
+    write_topology_data produces. Each section's "count" is computed on the fly
+    and written after its records (JSON key order doesn't matter to the app).
+    device_type_breakdown, vendor_breakdown, name_resolution_sources and
+    confidence_distribution are counted from the device stream unless given in
+    extra_data.
+    
+    Args:
+        devices, connections, neighbors, scan_state: Iterables/generators of records
+        target_path: Destination file path
+        scan_metadata: scan_metadata list (small, written as-is)
+        extra_data: Additional/overriding entries for the "data" section (e.g. port_analysis)
+        export_type, database_source: Header fields
+        indent: None for compact output; otherwise records are pretty-printed with this indent
+        validate: Strictly validate records as they are written; on failure the target is left untouched
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    extra_data = dict(extra_data or {})
+    separators = (',', ':') if indent is None else (',', ': ')
+    newline = '' if indent is None else '\n'
+    
+    def dump(value: Any) -> str:
+        return json.dumps(value, indent=indent, separators=separators, ensure_ascii=False)
+    
+    breakdowns = {
+        'device_type_breakdown': Counter(),
+        'vendor_breakdown': Counter(),
+        'name_resolution_sources': Counter(),
+        'confidence_distribution': Counter()
+    }
+    
+    clusters = ClusterIndexBuilder()
+    validator = None
+    if validate:
+        from topology_validation import TopologyValidator
+        validator = TopologyValidator()
+    
+    def count_device(device: Dict[str, Any]) -> None:
+        clusters.add_device(device)
+        if device.get('type'):
+            breakdowns['device_type_breakdown'][device['type']] += 1
+        if device.get('vendor'):
+            breakdowns['vendor_breakdown'][device['vendor']] += 1
+        if device.get('name_source'):
+            breakdowns['name_resolution_sources'][device['name_source']] += 1
+        breakdowns['confidence_distribution'][confidence_bucket(device.get('confidence'))] += 1
+    
+    try:
+        data_dir = os.path.dirname(target_path) or "."
+        os.makedirs(data_dir, exist_ok=True)
+        
+        counts = {}
+        with atomic_output(target_path, 'w') as f:
+            header = {
+                'export_timestamp': datetime.now().isoformat(),
+                'export_type': export_type,
+                'database_source': database_source
+            }
+            f.write(dump(header)[:-1].rstrip() + ',' + newline + '"data":{' + newline)
+            if validator:
+                for name, value in header.items():
+                    validator.header(name, value)
+                validator.header('data', None)
             
-            # Set readable permissions
-            os.chmod(target_path, 0o644)
+            sections = [
+                ('devices', devices, count_device),
+                ('connections', connections, clusters.add_connection),
+                ('neighbors', neighbors, None),
+                ('scan_state', scan_state, None)
+            ]
+            for index, (name, records, on_record) in enumerate(sections):
+                if index:
+                    f.write(',' + newline)
+                f.write(f'"{name}":{{"records":[{newline}')
+                if validator:
+                    validator.section_started(name)
+                count = 0
+                for record in records:
+                    if count:
+                        f.write(',' + newline)
+                    f.write(dump(record))
+                    if on_record:
+                        on_record(record)
+                    if validator:
+                        validator.record(name, record)
+                    count += 1
+                f.write(f'{newline}],"count":{count}}}')
+                counts[name] = count
             
-            print(f"✓ Successfully wrote topology data to {target_path}")
-            print(f"  Timestamp: {data.get('export_timestamp')}")
-            print(f"  Devices: {data['data']['devices']['count']}")
-            print(f"  Connections: {data['data']['connections']['count']}")
+            tail = {'scan_metadata': scan_metadata or []}
+            for name, counter in breakdowns.items():
+                tail[name] = dict(counter)
+            tail.setdefault('port_analysis', {})
+            tail.update(extra_data)
+            for name, value in tail.items():
+                if name in counts:
+                    continue
+                f.write(',' + newline + json.dumps(name) + ':' + dump(value))
+                if validator:
+                    validator.data_value(name, value)
+            f.write(newline + '}}' + newline)
             
+            if validator and not validator.finish():
+                # Raising inside atomic_output discards the temp file
+                validator.print_report()
+                raise ValueError("strict validation failed")
+        content_hash = write_precompressed_artifacts(target_path)
+        clusters.write(target_path, content_hash)
+        
+        print(f"✓ Successfully streamed topology data to {target_path}")
+        print(f"  SHA-256: {content_hash}")
+        print(f"  Devices: {counts['devices']}")
+        print(f"  Connections: {counts['connections']}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ Error streaming topology data: {e}")
+        return False
+    finally:
+        clusters.close()
+
+
+def normalize_mac(mac: Optional[str]) -> str:
+    """Normalize MAC address (remove colons/dashes, uppercase) - same as the log API"""
+    if not mac:
+        return ""
+    return mac.replace(':', '').replace('-', '').upper()
+
+
+def record_key(section: str, record: Dict[str, Any]) -> str:
+    """
+    Stable identity of a record across scans: devices by MAC (falling back to id), others by id.
+    The scanner's UNKNOWN_MAC placeholder is shared by many devices, so those are keyed by id.
+    """
+    if section == 'devices':
+        mac = normalize_mac(record.get('mac'))
+        if mac and mac != UNKNOWN_MAC_KEY:
+            return mac
+    return str(record.get('id'))
+
+
+def diff_records(section: str, old_records: List[Dict[str, Any]], new_records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compare two record lists by record_key.
+    
+    Records are matched by record_key, or by id when some record_key repeats
+    within either list (e.g. two devices reporting the same MAC); "key" names the
+    identity used. When neither is unique the section is carried whole as
+    "replace". "order" lists the new keys only when applying the diff to the old
+    list wouldn't already leave the records in the new order (see apply_records).
+    
+    Returns:
+        dict with added records, removed keys and changed (full new) records
+    """
+    for key_name, key_of in (('record', lambda r: record_key(section, r)), ('id', lambda r: str(r.get('id')))):
+        old_keys = [key_of(r) for r in old_records]
+        new_keys = [key_of(r) for r in new_records]
+        if all(len(set(keys)) == len(keys) and 'None' not in keys for keys in (old_keys, new_keys)):
+            break
+    else:
+        return {'key': 'replace', 'replace': new_records, 'added': [], 'removed': [], 'changed': []}
+    
+    old_by_key = dict(zip(old_keys, old_records))
+    new_by_key = dict(zip(new_keys, new_records))
+    diff = {
+        'key': key_name,
+        'added': [r for k, r in new_by_key.items() if k not in old_by_key],
+        'removed': [k for k in old_by_key if k not in new_by_key],
+        'changed': [r for k, r in new_by_key.items() if k in old_by_key and old_by_key[k] != r]
+    }
+    # Survivors keep their old positions and additions go at the end
+    kept_order = [k for k in old_keys if k in new_by_key] + [k for k in new_keys if k not in old_by_key]
+    if kept_order != new_keys:
+        diff['order'] = new_keys
+    return diff
+
+
+def apply_records(section: str, records: List[Dict[str, Any]], diff: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Apply a diff_records result to the old record list, returning the new one"""
+    if diff.get('key') == 'replace':
+        return list(diff['replace'])
+    if diff.get('key') == 'id':
+        key_of = lambda r: str(r.get('id'))
+    else:
+        key_of = lambda r: record_key(section, r)
+    
+    removed = set(diff['removed'])
+    by_key = {key_of(r): r for r in records if key_of(r) not in removed}
+    for record in diff['changed'] + diff['added']:
+        by_key[key_of(record)] = record
+    if 'order' in diff:
+        return [by_key[k] for k in diff['order']]
+    return list(by_key.values())
+
+
+def diff_topology(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a patch that turns the `old` export into `new`.
+    
+    Record sections are diffed per record; any other changed value (top-level
+    fields, breakdowns, scan_metadata) is carried whole.
+    """
+    old_data = old.get('data', {})
+    new_data = new.get('data', {})
+    
+    records = {}
+    for section in RECORD_SECTIONS:
+        if section in old_data and section in new_data:
+            records[section] = diff_records(
+                section,
+                old_data[section].get('records', []),
+                new_data[section].get('records', [])
+            )
+            # The section's own fields (e.g. count) travel whole when any of them changed
+            fields = {key: value for key, value in new_data[section].items() if key != 'records'}
+            if fields != {key: value for key, value in old_data[section].items() if key != 'records'}:
+                records[section]['fields'] = fields
+    
+    data_fields = {
+        key: value for key, value in new_data.items()
+        if key not in records and old_data.get(key) != value
+    }
+    removed_data_fields = [key for key in old_data if key not in new_data]
+    top_level = {
+        key: value for key, value in new.items()
+        if key != 'data' and old.get(key) != value
+    }
+    removed_top_level = [key for key in old if key != 'data' and key not in new]
+    
+    return {
+        'top_level': top_level,
+        'removed_top_level': removed_top_level,
+        'data': data_fields,
+        'removed_data': removed_data_fields,
+        'records': records
+    }
+
+
+def apply_topology_patch(old: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a diff_topology patch to the `old` export (not modified), returning the new export"""
+    new = {key: value for key, value in old.items() if key not in patch.get('removed_top_level', [])}
+    new.update(patch['top_level'])
+    data = {key: value for key, value in old.get('data', {}).items() if key not in patch['removed_data']}
+    data.update(patch['data'])
+    for section, diff in patch['records'].items():
+        old_section = data[section]
+        fields = diff.get('fields', {key: value for key, value in old_section.items() if key != 'records'})
+        data[section] = {**fields, 'records': apply_records(section, old_section.get('records', []), diff)}
+    new['data'] = data
+    return new
+
+
+def count_patch_changes(patch: Dict[str, Any]) -> int:
+    """Number of record and data-section changes in a patch (top-level fields like export_timestamp excluded)"""
+    changes = len(patch['data']) + len(patch['removed_data'])
+    for diff in patch['records'].values():
+        changes += len(diff['added']) + len(diff['removed']) + len(diff['changed']) + len(diff.get('replace', []))
+        changes += 'fields' in diff
+    return changes
+
+
+def write_topology_delta(data: Dict[str, Any],
+                         target_path: str = "/var/www/reactapp/data/raw_data_complete.json",
+                         max_patches: int = MAX_PATCHES,
+                         validate: bool = False) -> bool:
+    """
+    Write the full snapshot plus a versioned patch against the previous one and a manifest.
+    
+    The patch is written first, then the full snapshot, then the manifest - so a
+    client that sees a new manifest version can always fetch both.
+    
+    Args:
+        data: The topology data dictionary
+        target_path: Destination file path for the full snapshot
+        max_patches: Number of patch files to keep
+        validate: Strictly validate first and don't write if it fails
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if validate and not validate_topology_data(data, strict=True):
+        print(f"✗ Not writing {target_path}: strict validation failed")
+        return False
+    
+    try:
+        data_dir = os.path.dirname(target_path) or "."
+        os.makedirs(data_dir, exist_ok=True)
+        manifest_path = os.path.join(data_dir, MANIFEST_NAME)
+        patch_dir = os.path.join(data_dir, PATCH_DIR_NAME)
+        
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        content_hash = hashlib.sha256(payload).hexdigest()
+        
+        manifest = load_manifest(manifest_path)
+        previous = None
+        if manifest and os.path.exists(target_path):
+            with open(target_path, 'rb') as f:
+                previous_payload = f.read()
+            # Only diff against the snapshot the manifest describes
+            if hashlib.sha256(previous_payload).hexdigest() == manifest['hash']:
+                previous = json.loads(previous_payload)
+        
+        if manifest and manifest['hash'] == content_hash:
+            print(f"✓ Topology unchanged (version {manifest['version']}), nothing written")
             return True
-            
-        except Exception as e:
-            # Clean up temporary file if it still exists
-            if os.path.exists(tmp_path):
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
-            raise e
-            
+        
+        version = (manifest['version'] + 1) if manifest else 1
+        patches = manifest['patches'] if (manifest and previous is not None) else []
+        
+        if previous is not None:
+            patch = diff_topology(previous, data)
+            patch.update({
+                'from_version': manifest['version'],
+                'to_version': version,
+                'from_hash': manifest['hash'],
+                'to_hash': content_hash
+            })
+            os.makedirs(patch_dir, exist_ok=True)
+            patch_name = f"patch_{version:06d}.json"
+            atomic_write_bytes(
+                os.path.join(patch_dir, patch_name),
+                json.dumps(patch, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            )
+            patches.append({
+                'from_version': manifest['version'],
+                'to_version': version,
+                'file': f"{PATCH_DIR_NAME}/{patch_name}",
+                'changes': count_patch_changes(patch)
+            })
+        
+        # Drop patches beyond the retention window
+        patches = patches[-max_patches:]
+        
+        atomic_write_bytes(target_path, payload)
+        write_precompressed_artifacts(target_path)
+        write_cluster_index(target_path, build_cluster_index(data, content_hash))
+        
+        new_manifest = {
+            'version': version,
+            'hash': content_hash,
+            'export_timestamp': data.get('export_timestamp'),
+            'full': os.path.basename(target_path),
+            'full_size': len(payload),
+            'oldest_patch_version': patches[0]['from_version'] if patches else version,
+            'patches': patches
+        }
+        atomic_write_bytes(manifest_path, json.dumps(new_manifest, indent=2).encode('utf-8'))
+        
+        # Remove patch files the manifest no longer lists: expired ones, and all of them when
+        # the chain was reset (no usable previous snapshot)
+        kept = {os.path.basename(entry['file']) for entry in patches}
+        if os.path.isdir(patch_dir):
+            for name in os.listdir(patch_dir):
+                if name.startswith('patch_') and name.endswith('.json') and name not in kept:
+                    try:
+                        os.unlink(os.path.join(patch_dir, name))
+                    except OSError:
+                        pass
+        
+        print(f"✓ Successfully wrote topology data to {target_path} (version {version})")
+        if patches and patches[-1]['to_version'] == version:
+            print(f"  Patch: {patches[-1]['file']}")
+        else:
+            print("  No previous snapshot - full snapshot only")
+        
+        return True
+        
     except Exception as e:
-        print(f"✗ Error writing topology data: {e}")
+        print(f"✗ Error writing topology delta: {e}")
         return False
 
 
-def validate_topology_data(data: Dict[str, Any]) -> bool:
+class ClusterIndexBuilder:
+    """
+    Precompute the level-of-detail views served by the log API's /api/topology/clusters.
+    
+    Devices are grouped two ways: by their `network` CIDR ("net:<cidr>") and by the
+    switch that sees their MAC on one of its ports ("switch:<device id>", taken from
+    connections.device_id). Each cluster carries aggregate counts and its member
+    device ids; a compact per-device summary and a device adjacency list back the
+    expand and neighborhood queries, so the server never rebuilds the graph per request.
+    
+    Records are kept in a private temporary SQLite database, which SQLite spills
+    to a temp file once it outgrows its page cache, so feeding a streamed export
+    through here keeps the writer's memory bounded. Feed records with
+    add_device/add_connection (any order), then call build() for the index as a
+    dict or write() to stream it to the sidecar; close() when done.
+    """
+    
+    def __init__(self) -> None:
+        # '' = private on-disk temp database (deleted on close), cached in memory up to SQLite's page cache
+        self.db = sqlite3.connect('')
+        self.db.executescript('''
+            CREATE TABLE nodes (
+                ord INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, raw_id TEXT, node TEXT,
+                network_key TEXT, type TEXT, active INTEGER, label TEXT
+            );
+            CREATE TABLE macs (mac TEXT PRIMARY KEY, device_id TEXT NOT NULL);
+            CREATE TABLE links (seq INTEGER PRIMARY KEY, switch_id TEXT, mac TEXT);
+        ''')
+        self._devices: List[tuple] = []
+        self._macs: List[tuple] = []
+        self._connections: List[tuple] = []  # (switch device id, normalized MAC seen on its port)
+        self._finalized = False
+    
+    def add_device(self, device: Dict[str, Any]) -> None:
+        node = {field: device.get(field) for field in CLUSTER_NODE_FIELDS}
+        device_type = node.get('type') or ''
+        self._devices.append((
+            str(device.get('id')), json.dumps(node['id']), json.dumps(node, ensure_ascii=False),
+            f"net:{node.get('network') or 'unknown'}", device_type,
+            'ACTIVE' in device_type or device_type == 'Switch', node.get('name') or node.get('ip') or None
+        ))
+        mac = normalize_mac(device.get('mac'))
+        if mac and mac != UNKNOWN_MAC_KEY:
+            self._macs.append((mac, str(device.get('id'))))
+        if len(self._devices) >= CLUSTER_BATCH_ROWS:
+            self._flush()
+    
+    def add_connection(self, connection: Dict[str, Any]) -> None:
+        self._connections.append((str(connection.get('device_id')), normalize_mac(connection.get('mac_address'))))
+        if len(self._connections) >= CLUSTER_BATCH_ROWS:
+            self._flush()
+    
+    def _flush(self) -> None:
+        # A repeated device id keeps its first position and its last values, like a dict
+        self.db.executemany(
+            'INSERT INTO nodes (id, raw_id, node, network_key, type, active, label) VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET raw_id = excluded.raw_id, node = excluded.node, '
+            'network_key = excluded.network_key, type = excluded.type, active = excluded.active, '
+            'label = excluded.label',
+            self._devices
+        )
+        # The first device seen with a MAC owns it
+        self.db.executemany('INSERT OR IGNORE INTO macs (mac, device_id) VALUES (?, ?)', self._macs)
+        self.db.executemany('INSERT INTO links (switch_id, mac) VALUES (?, ?)', self._connections)
+        self._devices, self._macs, self._connections = [], [], []
+    
+    def _finalize(self) -> None:
+        """Resolve port MACs to devices and assign every device its cluster in both views"""
+        if self._finalized:
+            return
+        self._flush()
+        self.db.executescript('''
+            -- Port MACs of known switches, resolved to the device that owns them (NULL: layer-2 only)
+            CREATE TABLE resolved AS
+                SELECT l.seq, l.switch_id, m.device_id AS peer
+                FROM links l JOIN nodes n ON n.id = l.switch_id LEFT JOIN macs m ON m.mac = l.mac;
+            CREATE TABLE l2_only (id TEXT PRIMARY KEY, n INTEGER);
+            INSERT INTO l2_only SELECT switch_id, COUNT(*) FROM resolved WHERE peer IS NULL GROUP BY switch_id;
+            CREATE TABLE adjacency (a TEXT, b TEXT, PRIMARY KEY (a, b)) WITHOUT ROWID;
+            INSERT OR IGNORE INTO adjacency
+                SELECT switch_id, peer FROM resolved WHERE peer IS NOT NULL AND peer != switch_id;
+            INSERT OR IGNORE INTO adjacency
+                SELECT peer, switch_id FROM resolved WHERE peer IS NOT NULL AND peer != switch_id;
+            -- A device's upstream switch is the first one that sees its MAC
+            CREATE TABLE upstream (id TEXT PRIMARY KEY, switch_id TEXT);
+            INSERT INTO upstream
+                SELECT peer, switch_id FROM (
+                    SELECT peer, switch_id, MIN(seq) FROM resolved
+                    WHERE peer IS NOT NULL AND peer != switch_id GROUP BY peer
+                );
+            
+            CREATE TABLE membership (view TEXT, id TEXT, ord INTEGER, cluster TEXT, PRIMARY KEY (view, id))
+                WITHOUT ROWID;
+            INSERT INTO membership SELECT 'network', id, ord, network_key FROM nodes;
+            -- Switches with no upstream of their own head their own cluster
+            INSERT INTO membership
+                SELECT 'switch', n.id, n.ord, CASE
+                    WHEN u.switch_id IS NOT NULL THEN 'switch:' || u.switch_id
+                    WHEN l.n IS NOT NULL OR EXISTS (SELECT 1 FROM adjacency WHERE a = n.id) THEN 'switch:' || n.id
+                    ELSE 'switch:none' END
+                FROM nodes n LEFT JOIN upstream u ON u.id = n.id LEFT JOIN l2_only l ON l.id = n.id;
+            CREATE INDEX membership_cluster ON membership (view, cluster, ord);
+            CREATE INDEX membership_ord ON membership (view, ord);
+        ''')
+        self._finalized = True
+    
+    def _nodes(self) -> Iterator[tuple]:
+        for device_id, node in self.db.execute('SELECT id, node FROM nodes ORDER BY ord'):
+            yield device_id, json.loads(node)
+    
+    def _mac_owners(self) -> Iterator[tuple]:
+        return self.db.execute('SELECT mac, device_id FROM macs ORDER BY rowid')
+    
+    def _adjacency(self) -> Iterator[tuple]:
+        """(device id, sorted peer ids) for every device with at least one peer, in device order"""
+        rows = self.db.execute('SELECT j.a, j.b FROM adjacency j JOIN nodes n ON n.id = j.a ORDER BY n.ord, j.b')
+        for device_id, group in groupby(rows, key=lambda row: row[0]):
+            yield device_id, [peer for _, peer in group]
+    
+    def _clusters(self, view: str) -> Iterator[Dict[str, Any]]:
+        """Clusters in order of their first member, without the member list (see _members)"""
+        rows = self.db.execute(
+            'SELECT m.cluster, COUNT(*), SUM(n.active), SUM(COALESCE(l.n, 0)) '
+            'FROM membership m JOIN nodes n ON n.ord = m.ord LEFT JOIN l2_only l ON l.id = m.id '
+            'WHERE m.view = ? GROUP BY m.cluster ORDER BY MIN(m.ord)', (view,)
+        )
+        for cluster_id, device_count, active_count, l2_only_count in rows:
+            label = cluster_id.split(':', 1)[1]
+            if view == 'switch' and cluster_id != 'switch:none':
+                head = self.db.execute('SELECT label FROM nodes WHERE id = ?', (label,)).fetchone()
+                label = (head and head[0]) or label
+            types = self.db.execute(
+                'SELECT n.type, COUNT(*) FROM membership m JOIN nodes n ON n.ord = m.ord '
+                'WHERE m.view = ? AND m.cluster = ? GROUP BY n.type ORDER BY MIN(m.ord)', (view, cluster_id)
+            )
+            yield {
+                'id': cluster_id,
+                'label': label,
+                'device_count': device_count,
+                'active_count': active_count,
+                'l2_only_count': l2_only_count,
+                'types': dict(types.fetchall())
+            }
+    
+    def _members(self, view: str, cluster_id: str) -> Iterator[Any]:
+        rows = self.db.execute(
+            'SELECT n.raw_id FROM membership m JOIN nodes n ON n.ord = m.ord '
+            'WHERE m.view = ? AND m.cluster = ? ORDER BY m.ord', (view, cluster_id)
+        )
+        for (raw_id,) in rows:
+            yield json.loads(raw_id)
+    
+    def _membership(self, view: str) -> Iterator[tuple]:
+        return self.db.execute('SELECT id, cluster FROM membership WHERE view = ? ORDER BY ord', (view,))
+    
+    def _links(self, view: str) -> List[Dict[str, Any]]:
+        """Device links counted per pair of clusters (one row per cluster pair, so small)"""
+        rows = self.db.execute(
+            # CROSS JOIN pins the plan to one membership lookup per adjacency row
+            'SELECT ma.cluster, mb.cluster, COUNT(*) FROM adjacency j '
+            'CROSS JOIN membership ma ON ma.view = ? AND ma.id = j.a '
+            'CROSS JOIN membership mb ON mb.view = ? AND mb.id = j.b '
+            'WHERE ma.cluster < mb.cluster GROUP BY ma.cluster, mb.cluster ORDER BY ma.cluster, mb.cluster',
+            (view, view)
+        )
+        return [{'source': a, 'target': b, 'count': count} for a, b, count in rows]
+    
+    def build(self, source_hash: Optional[str] = None) -> Dict[str, Any]:
+        """The whole index as a dict (for exports that are in memory anyway)"""
+        self._finalize()
+        views = {}
+        for view in CLUSTER_VIEWS:
+            clusters = {}
+            for cluster in self._clusters(view):
+                cluster['members'] = list(self._members(view, cluster['id']))
+                clusters[cluster['id']] = cluster
+            views[view] = {
+                'clusters': clusters,
+                'membership': dict(self._membership(view)),
+                'links': self._links(view)
+            }
+        return {
+            'source_hash': source_hash,
+            'nodes': dict(self._nodes()),
+            'macs': dict(self._mac_owners()),
+            'adjacency': dict(self._adjacency()),
+            'views': views
+        }
+    
+    def write(self, target_path: str, source_hash: Optional[str] = None) -> None:
+        """Atomically write the same index as build() to the sidecar, a row at a time"""
+        self._finalize()
+        
+        def dump(value: Any) -> str:
+            return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+        
+        def write_pairs(f, pairs) -> None:
+            f.write('{')
+            for i, (key, value) in enumerate(pairs):
+                f.write((',' if i else '') + dump(key) + ':' + dump(value))
+            f.write('}')
+        
+        with atomic_output(target_path + CLUSTER_SUFFIX, 'w') as f:
+            f.write('{"source_hash":' + dump(source_hash) + ',"nodes":')
+            write_pairs(f, self._nodes())
+            f.write(',"macs":')
+            write_pairs(f, self._mac_owners())
+            f.write(',"adjacency":')
+            write_pairs(f, self._adjacency())
+            f.write(',"views":{')
+            for v, view in enumerate(CLUSTER_VIEWS):
+                f.write((',' if v else '') + dump(view) + ':{"clusters":{')
+                for c, cluster in enumerate(self._clusters(view)):
+                    f.write((',' if c else '') + dump(cluster['id']) + ':' + dump(cluster)[:-1] + ',"members":[')
+                    f.write(','.join(dump(member) for member in self._members(view, cluster['id'])))
+                    f.write(']}')
+                f.write('},"membership":')
+                write_pairs(f, self._membership(view))
+                f.write(',"links":' + dump(self._links(view)) + '}')
+            f.write('}}')
+    
+    def close(self) -> None:
+        self.db.close()
+
+
+def build_cluster_index(data: Dict[str, Any], source_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the cluster index for an in-memory export (see ClusterIndexBuilder).
+    
+    Args:
+        data: The topology data dictionary
+        source_hash: sha256 of the snapshot file the index describes
+        
+    Returns:
+        dict: The index written to <target>.clusters.json
+    """
+    builder = ClusterIndexBuilder()
+    try:
+        for device in data['data']['devices']['records']:
+            builder.add_device(device)
+        for connection in data['data']['connections']['records']:
+            builder.add_connection(connection)
+        return builder.build(source_hash)
+    finally:
+        builder.close()
+
+
+def write_cluster_index(target_path: str, index: Dict[str, Any]) -> None:
+    """Atomically write the cluster index sidecar next to target_path"""
+    atomic_write_bytes(target_path + CLUSTER_SUFFIX,
+                       json.dumps(index, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def load_manifest(manifest_path: str) -> Optional[Dict[str, Any]]:
+    """Load the delta manifest, or None if there isn't a valid one"""
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if 'version' in manifest and 'hash' in manifest:
+            manifest.setdefault('patches', [])
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def validate_topology_data(data: Dict[str, Any], strict: bool = False) -> bool:
     """
     Validate that the data structure is correct.
     
     Args:
         data: The topology data to validate
+        strict: Also check every record, counts, device references and duplicate MACs/IPs
+            (topology_validation.py; use validate_topology_file there for exports on disk)
         
     Returns:
         bool: True if valid, False otherwise
     """
+    if strict:
+        from topology_validation import validate_export
+        validator = validate_export(data)
+        validator.print_report()
+        return validator.valid
+    
     try:
         # Check required top-level fields
         required_fields = ['export_timestamp', 'export_type', 'data']
@@ -318,6 +1120,30 @@ def main():
     """
     Main function - demonstrates usage
     """
+    parser = argparse.ArgumentParser(description="Network Topology Data Writer")
+    parser.add_argument('--target', default="./raw_data_complete.json",
+                        help="Output path (production: /var/www/reactapp/data/raw_data_complete.json)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--delta', action='store_true',
+                      help="Also write a versioned patch and manifest next to the snapshot")
+    mode.add_argument('--stream', action='store_true',
+                      help="Write compact JSON record by record (memory-bounded, for very large scans)")
+    parser.add_argument('--layout', action='store_true',
+                        help="Precompute node x/y positions so the browser can skip the force simulation")
+    parser.add_argument('--strict', action='store_true',
+                        help="Check every record against the types.ts shapes and refuse to write an invalid export")
+    parser.add_argument('--clusters-for', metavar='EXPORT',
+                        help="Only (re)build the cluster index sidecar for an existing export and exit")
+    args = parser.parse_args()
+    
+    if args.clusters_for:
+        with open(args.clusters_for, 'rb') as f:
+            payload = f.read()
+        index = build_cluster_index(json.loads(payload), hashlib.sha256(payload).hexdigest())
+        write_cluster_index(args.clusters_for, index)
+        print(f"✓ Wrote {args.clusters_for}{CLUSTER_SUFFIX} ({len(index['nodes'])} devices)")
+        return 0
+    
     print("=" * 60)
     print("Network Topology Data Writer")
     print("=" * 60)
@@ -328,21 +1154,39 @@ def main():
     
     # Validate the data
     print("\n2. Validating data structure...")
-    if not validate_topology_data(topology_data):
+    if not validate_topology_data(topology_data, strict=args.strict):
         print("✗ Data validation failed. Aborting.")
         return 1
     
+    if args.layout:
+        print("\n2b. Computing layout...")
+        from topology_layout import apply_layout  # Needs NumPy; only imported when asked for
+        layout = apply_layout(topology_data, previous_path=args.target)
+        print(f"✓ Layout: {len(layout['positions'])} nodes, {layout['placed']} placed in {layout['iterations']} steps")
+    
     # Write to file atomically
     print("\n3. Writing data to file...")
     
     # For testing locally, write to current directory
-    # For production, use: /var/www/reactapp/data/raw_data_complete.json
-    target_path = "./raw_data_complete.json"
+    # For production, use: --target /var/www/reactapp/data/raw_data_complete.json
+    target_path = args.target
     
-    # Uncomment for production:
-    # target_path = "/var/www/reactapp/data/raw_data_complete.json"
-    
-    success = write_topology_data(topology_data, target_path)
+    if args.delta:
+        success = write_topology_delta(topology_data, target_path)
+    elif args.stream:
+        # A real scanner would pass generators reading from its database here
+        sections = topology_data['data']
+        success = write_topology_stream(
+            devices=iter(sections['devices']['records']),
+            connections=iter(sections['connections']['records']),
+            neighbors=iter(sections['neighbors']['records']),
+            scan_state=iter(sections['scan_state']['records']),
+            target_path=target_path,
+            scan_metadata=sections['scan_metadata'],
+            extra_data={key: sections[key] for key in ('port_analysis', 'layout') if key in sections}
+        )
+    else:
+        success = write_topology_data(topology_data, target_path)
     
     if success:
         print("\n" + "=" * 60)
@@ -350,7 +1194,7 @@ def main():
         print("=" * 60)
         print(f"\nFile location: {os.path.abspath(target_path)}")
         print(f"File size: {os.path.getsize(target_path):,} bytes")
-        print("\nThe React app will automatically fetch this data within 5 seconds.")
+        print("\nOpen UIs reload it when the log API announces the new version on /api/topology/events.")
         return 0
     else:
         print("\n" + "=" * 60)